@@ -2,8 +2,9 @@ from flask import Flask, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, current_user
 from config import config
+from app.replica import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 
 def create_app(config_name='development'):
@@ -12,8 +13,31 @@ def create_app(config_name='development'):
     app.config.from_object(config[config_name])
     
     # Initialize extensions
+    from app import engines
+    engines.configure(app)
     db.init_app(app)
+    engines.init_app(app, db)
+    
+    from app import replica
+    replica.init_app(app, db)
     login_manager.init_app(app)
+    
+    from app.instrumentation import sql_instrumentation
+    sql_instrumentation.init_app(app, db)
+    
+    from app.catalog import menu_catalog
+    menu_catalog.init_app(app)
+    from app.search import menu_search
+    menu_search.init_app(app)
+    
+    from app import analytics, conditional, events, identity, passwords, payments, prep
+    analytics.init_app(app)
+    conditional.init_app(app)
+    events.init_app(app)
+    identity.init_app(app)
+    passwords.init_app(app)
+    payments.init_app(app)
+    prep.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
     
@@ -21,10 +45,12 @@ def create_app(config_name='development'):
     from app.auth import auth_bp
     from app.customer import customer_bp
     from app.admin import admin_bp
+    from app.payments import payments_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(customer_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(payments_bp)
     
     # Root route
     @app.route('/')
@@ -37,8 +63,10 @@ def create_app(config_name='development'):
                 return redirect(url_for('customer.dashboard'))
         return redirect(url_for('auth.login'))
     
-    # Create tables
-    with app.app_context():
-        db.create_all()
+    # Create missing tables and apply pending schema migrations
+    if app.config.get('AUTO_MIGRATE', True):
+        from app import migrations
+        with app.app_context():
+            migrations.upgrade()
     
     return app
@@ -1,8 +1,15 @@
 from functools import wraps
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, Response, current_app, render_template, redirect, url_for, flash, request, jsonify, abort, stream_with_context
 from flask_login import login_required, current_user
-from app import db
-from app.models import User, Burger, Ingredient, BurgerIngredient, Order
+from sqlalchemy import func, case
+from app import analytics, db, events, export, order_status, prep, rollups, stock
+from app.instrumentation import query_budget
+from app.pagination import keyset_paginate
+from app.catalog import menu_catalog
+from app.search import menu_search
+from app.availability import refresh_burger_availability, ingredient_changed
+from app.identity import user_cache
+from app.models import User, Burger, Ingredient, BurgerIngredient, Order, OrderStatusCount
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -19,23 +26,87 @@ def admin_required(f):
 
 @admin_bp.route('/')
 @admin_bp.route('/dashboard')
+@query_budget(6)
 @admin_required
 def dashboard():
     """Admin dashboard"""
-    total_orders = Order.query.count()
-    pending_orders = Order.query.filter_by(status='pending').count()
-    total_revenue = sum(o.total_price for o in Order.query.all() if o.payment_status == 'completed')
+    totals = rollups.dashboard_totals()
     
-    burgers = Burger.query.all()
-    unavailable_burgers = Burger.query.filter_by(is_available=False).count()
+    total_burgers, unavailable_burgers = db.session.query(
+        func.count(Burger.id),
+        func.coalesce(func.sum(case((Burger.is_available == False, 1), else_=0)), 0)
+    ).one()
     
     return render_template('admin/dashboard.html',
-                         total_orders=total_orders,
-                         pending_orders=pending_orders,
-                         total_revenue=total_revenue,
-                         total_burgers=len(burgers),
+                         total_orders=totals['total_orders'],
+                         pending_orders=totals['pending_orders'],
+                         total_revenue=totals['total_revenue'],
+                         today_orders=totals['today_orders'],
+                         today_revenue=totals['today_revenue'],
+                         total_burgers=total_burgers,
                          unavailable_burgers=unavailable_burgers)
 
+# ===== SALES REPORTS =====
+REPORT_WINDOWS = (7, 30, 90)
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+def _report_window():
+    days = request.args.get('days', type=int)
+    return days if days in REPORT_WINDOWS else None
+
+def _burger_name(snapshot, burger_id):
+    burger = snapshot.get(burger_id)
+    return burger.name if burger else f'Burger #{burger_id}'
+
+@admin_bp.route('/reports')
+@admin_required
+def sales_report():
+    """Revenue by hour and weekday, basket size and best sellers"""
+    days = _report_window()
+    totals = analytics.sales().totals(days=days)
+    snapshot = menu_catalog.current()
+    top = [(_burger_name(snapshot, burger_id), revenue, quantity)
+           for burger_id, revenue, quantity in totals.top_burgers(10)]
+    return render_template('admin/reports.html', totals=totals, top=top, days=days, sort=None,
+                           windows=REPORT_WINDOWS, weekdays=WEEKDAYS)
+
+@admin_bp.route('/reports/burgers')
+@admin_required
+def burger_report():
+    """Revenue and units sold per burger"""
+    days = _report_window()
+    sort = 'quantity' if request.args.get('sort') == 'quantity' else 'revenue'
+    totals = analytics.sales().totals(days=days)
+    snapshot = menu_catalog.current()
+    burgers = [(burger_id, _burger_name(snapshot, burger_id), revenue, quantity)
+               for burger_id, revenue, quantity in totals.burgers(sort)]
+    return render_template('admin/report_burgers.html', totals=totals, burgers=burgers, days=days,
+                           sort=sort, windows=REPORT_WINDOWS)
+
+@admin_bp.route('/prep')
+@query_budget(8)
+@admin_required
+def prep_forecast():
+    """Ingredients needed by open orders and expected over the next hour"""
+    snapshot = menu_catalog.current()
+    lines = prep.forecast(snapshot)
+    status_counts = dict(db.session.query(OrderStatusCount.status, OrderStatusCount.count)
+                         .filter(OrderStatusCount.status.in_(prep.OPEN_STATUSES)))
+    return render_template('admin/prep.html', lines=lines, status_counts=status_counts,
+                           open_statuses=prep.OPEN_STATUSES,
+                           window_minutes=current_app.config['PREP_FORECAST_WINDOW'] // 60)
+
+@admin_bp.route('/cache-stats')
+@admin_required
+def cache_stats():
+    """Hit/miss counters of this worker's in-process caches"""
+    return jsonify({
+        'users': user_cache().stats(),
+        'menu': menu_catalog.stats(),
+        'menu_search': menu_search.stats(),
+        'sales_analytics': analytics.sales().stats(),
+    })
+
 # ===== BURGER MANAGEMENT =====
 @admin_bp.route('/burgers')
 @admin_required
@@ -74,6 +145,8 @@ def add_burger():
             except (ValueError, TypeError):
                 continue
         
+        refresh_burger_availability([burger.id])
+        menu_catalog.bump()
         db.session.commit()
         flash(f'Burger "{name}" added successfully!', 'success')
         return redirect(url_for('admin.list_burgers'))
@@ -104,6 +177,9 @@ def edit_burger(burger_id):
             except (ValueError, TypeError):
                 continue
         
+        refresh_burger_availability([burger.id])
+        prep.rebuild()
+        menu_catalog.bump()
         db.session.commit()
         flash(f'Burger "{burger.name}" updated!', 'success')
         return redirect(url_for('admin.list_burgers'))
@@ -116,6 +192,7 @@ def toggle_burger_availability(burger_id):
     """Toggle burger availability"""
     burger = Burger.query.get_or_404(burger_id)
     burger.is_available = not burger.is_available
+    menu_catalog.bump()
     db.session.commit()
     
     status = "available" if burger.is_available else "unavailable"
@@ -129,6 +206,8 @@ def delete_burger(burger_id):
     burger = Burger.query.get_or_404(burger_id)
     name = burger.name
     db.session.delete(burger)
+    prep.rebuild()
+    menu_catalog.bump()
     db.session.commit()
     flash(f'Burger "{name}" deleted.', 'success')
     return redirect(url_for('admin.list_burgers'))
@@ -149,6 +228,7 @@ def add_ingredient():
     if request.method == 'POST':
         name = request.form.get('name')
         price = request.form.get('price', 0, type=float)
+        stock_quantity = request.form.get('stock_quantity', type=float)
         
         if not name:
             flash('Name is required', 'danger')
@@ -156,6 +236,10 @@ def add_ingredient():
         
         ingredient = Ingredient(name=name, price=price)
         db.session.add(ingredient)
+        db.session.flush()
+        if stock_quantity is not None:
+            stock.set_count(menu_catalog.current(), ingredient, stock_quantity)
+        menu_catalog.bump()
         db.session.commit()
         flash(f'Ingredient "{name}" added!', 'success')
         return redirect(url_for('admin.list_ingredients'))
@@ -171,6 +255,7 @@ def edit_ingredient(ingredient_id):
     if request.method == 'POST':
         ingredient.name = request.form.get('name', ingredient.name)
         ingredient.price = request.form.get('price', ingredient.price, type=float)
+        menu_catalog.bump()
         db.session.commit()
         flash(f'Ingredient "{ingredient.name}" updated!', 'success')
         return redirect(url_for('admin.list_ingredients'))
@@ -181,60 +266,164 @@ def edit_ingredient(ingredient_id):
 @admin_required
 def toggle_ingredient_availability(ingredient_id):
     """Toggle ingredient availability"""
+    snapshot = menu_catalog.current()
     ingredient = Ingredient.query.get_or_404(ingredient_id)
     ingredient.is_available = not ingredient.is_available
+    ingredient_changed(snapshot, ingredient.id)
+    menu_catalog.bump()
     db.session.commit()
     
     status = "available" if ingredient.is_available else "unavailable"
     flash(f'Ingredient "{ingredient.name}" marked as {status}.', 'success')
     return redirect(url_for('admin.list_ingredients'))
 
+@admin_bp.route('/ingredient/<int:ingredient_id>/stock', methods=['GET', 'POST'])
+@admin_required
+def ingredient_stock(ingredient_id):
+    """Restock, count or untrack an ingredient and show its stock ledger"""
+    ingredient = Ingredient.query.get_or_404(ingredient_id)
+    
+    if request.method == 'POST':
+        action = request.form.get('action')
+        quantity = request.form.get('quantity', type=float)
+        snapshot = menu_catalog.current()
+        if action == 'untrack':
+            stock.untrack(snapshot, ingredient)
+        elif quantity is None or quantity < 0:
+            flash('Enter a quantity of zero or more', 'danger')
+            return redirect(url_for('admin.ingredient_stock', ingredient_id=ingredient.id))
+        elif action == 'restock':
+            stock.restock(snapshot, ingredient, quantity)
+        elif action == 'count':
+            stock.set_count(snapshot, ingredient, quantity)
+        else:
+            abort(400)
+        db.session.commit()
+        flash(f'Stock for "{ingredient.name}" updated.', 'success')
+        return redirect(url_for('admin.ingredient_stock', ingredient_id=ingredient.id))
+    
+    return render_template('admin/ingredient_stock.html', ingredient=ingredient,
+                           movements=stock.movements(ingredient.id))
+
 @admin_bp.route('/ingredient/<int:ingredient_id>/delete', methods=['POST'])
 @admin_required
 def delete_ingredient(ingredient_id):
     """Delete ingredient"""
+    snapshot = menu_catalog.current()
     ingredient = Ingredient.query.get_or_404(ingredient_id)
     name = ingredient.name
     db.session.delete(ingredient)
+    ingredient_changed(snapshot, ingredient_id)
+    prep.rebuild()
+    menu_catalog.bump()
     db.session.commit()
     flash(f'Ingredient "{name}" deleted.', 'success')
     return redirect(url_for('admin.list_ingredients'))
 
 # ===== ORDER MANAGEMENT =====
 @admin_bp.route('/orders')
+@query_budget(4)
 @admin_required
 def list_orders():
     """List all orders"""
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     status = request.args.get('status')
     
     query = Order.query
     if status:
         query = query.filter_by(status=status)
     
-    orders = query.order_by(Order.created_at.desc()).paginate(page=page, per_page=20)
+    orders = keyset_paginate(query, Order, per_page=20, cursor=cursor, page=page,
+                             total=rollups.order_count(status))
     return render_template('admin/orders.html', orders=orders, current_status=status)
 
+@admin_bp.route('/orders/export')
+@admin_required
+def export_orders():
+    """Download orders with items and customers as CSV or JSON Lines, streamed"""
+    fmt = request.args.get('format', 'csv')
+    status = request.args.get('status') or None
+    compress = request.args.get('gzip') in ('1', 'true', 'on')
+    if fmt not in export.FORMATS or (status and status not in order_status.STATUSES):
+        abort(400)
+    try:
+        start = export.parse_bound(request.args.get('start'))
+        end = export.parse_bound(request.args.get('end'), end=True)
+    except ValueError:
+        abort(400)
+    
+    chunks = export.generate(fmt, start=start, end=end, status=status, compress=compress)
+    mimetype = 'application/gzip' if compress else export.FORMATS[fmt]
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{export.filename(fmt, compress)}"',
+        'X-Accel-Buffering': 'no',
+    })
+
+@admin_bp.route('/orders/stream')
+@admin_required
+def order_stream():
+    """Kitchen feed of new and changed orders (Server-Sent Events)"""
+    return events.stream()
+
 @admin_bp.route('/order/<int:order_id>')
 @admin_required
 def view_order(order_id):
     """View order details"""
     order = Order.query.get_or_404(order_id)
-    return render_template('admin/order_detail.html', order=order)
+    return render_template('admin/order_detail.html', order=order,
+                           next_statuses=order_status.next_statuses(order.status))
 
 @admin_bp.route('/order/<int:order_id>/status', methods=['POST'])
 @admin_required
 def update_order_status(order_id):
     """Update order status"""
-    order = Order.query.get_or_404(order_id)
     new_status = request.form.get('status')
     
-    valid_statuses = ['pending', 'confirmed', 'preparing', 'ready', 'delivered', 'cancelled']
-    if new_status not in valid_statuses:
+    if new_status not in order_status.STATUSES:
         flash('Invalid status', 'danger')
         return redirect(url_for('admin.view_order', order_id=order_id))
     
-    order.status = new_status
-    db.session.commit()
-    flash(f'Order #{order.id} status updated to {new_status}.', 'success')
+    result, = order_status.transition([order_id], new_status)
+    if result.outcome == order_status.NOT_FOUND:
+        abort(404)
+    if result.outcome == order_status.CONFLICT:
+        flash(f'Order #{order_id} is {result.status} and cannot move to {new_status}.', 'danger')
+    else:
+        flash(f'Order #{order_id} status updated to {new_status}.', 'success')
     return redirect(url_for('admin.view_order', order_id=order_id))
+
+@admin_bp.route('/orders/status', methods=['POST'])
+@query_budget(14)
+@admin_required
+def bulk_update_order_status():
+    """Move a set of orders to one status; JSON requests get a per-order report"""
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        new_status, order_ids = data.get('status'), data.get('order_ids')
+        if new_status not in order_status.STATUSES:
+            return jsonify({'error': 'Invalid status'}), 400
+        if not isinstance(order_ids, list) or not all(isinstance(i, int) for i in order_ids):
+            return jsonify({'error': 'order_ids must be a list of integers'}), 400
+        results = order_status.transition(order_ids, new_status)
+        return jsonify({'status': new_status, 'results': [r._asdict() for r in results]})
+    
+    new_status = request.form.get('status')
+    back = url_for('admin.list_orders', status=request.form.get('current_status') or None)
+    if new_status not in order_status.STATUSES:
+        flash('Invalid status', 'danger')
+        return redirect(back)
+    order_ids = request.form.getlist('order_ids', type=int)
+    if not order_ids:
+        flash('Select at least one order.', 'warning')
+        return redirect(back)
+    
+    results = order_status.transition(order_ids, new_status)
+    updated = sum(1 for r in results if r.outcome == order_status.UPDATED)
+    skipped = [r for r in results if r.outcome != order_status.UPDATED]
+    if updated:
+        flash(f'{updated} order(s) moved to {new_status}.', 'success')
+    if skipped:
+        details = ', '.join(f'#{r.order_id} ({r.status or "not found"})' for r in skipped)
+        flash(f'Could not move to {new_status}: {details}.', 'warning')
+    return redirect(back)
@@ -0,0 +1,266 @@
+"""Columnar sales analytics for the admin reports.
+
+Report figures come from paid order lines held in compact typed columns
+(``array.array``), not ORM objects: per line its order id, burger id,
+quantity, revenue, hour of day, weekday, day number and whether it is the
+first line of its order. With NumPy installed the columns are viewed as
+ndarrays without copying and each aggregate is one ``bincount``; without it
+the same aggregates run as a single loop over the arrays.
+
+The columns are cached per process and refreshed incrementally. Lines of
+orders up to a watermark are loaded once. The watermark only moves past
+settled orders (delivered, cancelled, or older than ANALYTICS_SETTLE_AFTER
+seconds), whose lines rarely start or stop counting. Lines of the unsettled
+tail above it are re-read on each refresh, at most every
+ANALYTICS_REFRESH_INTERVAL seconds. Hours and weekdays follow ``created_at``,
+which is UTC.
+
+Settled is not final: an old order can still be paid, and a confirmed or
+preparing one cancelled, at any age. Such late changes call ``lines_changed``,
+which bumps a shared ``CacheVersion``; every process checks it on refresh and
+loads its settled columns again from scratch when it has moved.
+"""
+import threading
+import time
+from array import array
+from collections import defaultdict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, func, select
+from app import db
+from app.models import CacheVersion, Order, OrderItem
+
+try:
+    import numpy
+except ImportError:  # optional; aggregates fall back to plain loops
+    numpy = None
+
+COLUMNS = (
+    ('order_id', 'q'),
+    ('burger_id', 'i'),
+    ('quantity', 'I'),
+    ('revenue', 'd'),
+    ('hour', 'B'),
+    ('weekday', 'B'),
+    ('day', 'i'),  # date.toordinal()
+    ('first', 'B'),  # 1 on the first line of each order, so sums count orders
+)
+FINAL_STATUSES = ('delivered', 'cancelled')
+SALES_VERSION = 'sales'
+LOAD_BATCH_SIZE = 5000
+
+class LineColumns:
+    """Typed columns of order lines, in order id order"""
+
+    def __init__(self):
+        for name, typecode in COLUMNS:
+            setattr(self, name, array(typecode))
+
+    def __len__(self):
+        return len(self.order_id)
+
+    def load(self, rows):
+        last_order = self.order_id[-1] if len(self) else None
+        for order_id, burger_id, quantity, price, created_at in rows:
+            self.order_id.append(order_id)
+            self.burger_id.append(burger_id)
+            self.quantity.append(quantity)
+            self.revenue.append(price * quantity)
+            self.hour.append(created_at.hour)
+            self.weekday.append(created_at.weekday())
+            self.day.append(created_at.toordinal())
+            self.first.append(order_id != last_order)
+            last_order = order_id
+
+    def nbytes(self):
+        return sum(getattr(self, name).itemsize * len(self) for name, _ in COLUMNS)
+
+class SalesTotals:
+    """Additive sales aggregates; totals of disjoint line sets simply add up"""
+
+    def __init__(self):
+        self.revenue = 0.0
+        self.orders = 0
+        self.items = 0
+        self.burger_revenue = defaultdict(float)
+        self.burger_quantity = defaultdict(int)
+        self.hour_revenue = [0.0] * 24
+        self.hour_orders = [0] * 24
+        self.weekday_revenue = [0.0] * 7
+        self.weekday_orders = [0] * 7
+
+    def add(self, other):
+        self.revenue += other.revenue
+        self.orders += other.orders
+        self.items += other.items
+        for burger_id, value in other.burger_revenue.items():
+            self.burger_revenue[burger_id] += value
+        for burger_id, value in other.burger_quantity.items():
+            self.burger_quantity[burger_id] += value
+        for mine, theirs in ((self.hour_revenue, other.hour_revenue), (self.hour_orders, other.hour_orders),
+                             (self.weekday_revenue, other.weekday_revenue),
+                             (self.weekday_orders, other.weekday_orders)):
+            for i, value in enumerate(theirs):
+                mine[i] += value
+        return self
+
+    @property
+    def basket_size(self):
+        """Average items per order"""
+        return self.items / self.orders if self.orders else 0.0
+
+    @property
+    def average_order_value(self):
+        return self.revenue / self.orders if self.orders else 0.0
+
+    def burgers(self, key='revenue'):
+        """(burger_id, revenue, quantity) for every burger sold, best first"""
+        rows = [(burger_id, revenue, self.burger_quantity[burger_id])
+                for burger_id, revenue in self.burger_revenue.items()]
+        rows.sort(key=(lambda r: (-r[1], r[0])) if key == 'revenue' else (lambda r: (-r[2], r[0])))
+        return rows
+
+    def top_burgers(self, n, key='revenue'):
+        return self.burgers(key)[:n]
+
+def aggregate_python(columns, since_day=None):
+    totals = SalesTotals()
+    for burger_id, quantity, revenue, hour, weekday, day, first in zip(
+            columns.burger_id, columns.quantity, columns.revenue, columns.hour,
+            columns.weekday, columns.day, columns.first):
+        if since_day is not None and day < since_day:
+            continue
+        totals.revenue += revenue
+        totals.orders += first
+        totals.items += quantity
+        totals.burger_revenue[burger_id] += revenue
+        totals.burger_quantity[burger_id] += quantity
+        totals.hour_revenue[hour] += revenue
+        totals.hour_orders[hour] += first
+        totals.weekday_revenue[weekday] += revenue
+        totals.weekday_orders[weekday] += first
+    return totals
+
+def aggregate_numpy(columns, since_day=None):
+    totals = SalesTotals()
+    if not len(columns):
+        return totals
+    # Zero-copy views; callers hold the lock so the arrays cannot grow meanwhile
+    view = {name: numpy.frombuffer(getattr(columns, name), dtype=typecode) for name, typecode in COLUMNS}
+    if since_day is not None:
+        mask = view['day'] >= since_day
+        view = {name: values[mask] for name, values in view.items()}
+        if not view['day'].size:
+            return totals
+
+    revenue, first, quantity = view['revenue'], view['first'], view['quantity']
+    totals.revenue = float(revenue.sum())
+    totals.orders = int(first.sum())
+    totals.items = int(quantity.sum())
+
+    burger_revenue = numpy.bincount(view['burger_id'], weights=revenue)
+    burger_quantity = numpy.bincount(view['burger_id'], weights=quantity)
+    for burger_id in numpy.flatnonzero(burger_quantity):
+        totals.burger_revenue[int(burger_id)] = float(burger_revenue[burger_id])
+        totals.burger_quantity[int(burger_id)] = int(burger_quantity[burger_id])
+
+    totals.hour_revenue = numpy.bincount(view['hour'], weights=revenue, minlength=24).tolist()
+    totals.hour_orders = numpy.bincount(view['hour'], weights=first, minlength=24).astype(int).tolist()
+    totals.weekday_revenue = numpy.bincount(view['weekday'], weights=revenue, minlength=7).tolist()
+    totals.weekday_orders = numpy.bincount(view['weekday'], weights=first, minlength=7).astype(int).tolist()
+    return totals
+
+def line_query(after_id, up_to_id=None):
+    """Paid, uncancelled order lines of orders after `after_id` (up to `up_to_id`)"""
+    query = (select(OrderItem.order_id, OrderItem.burger_id, OrderItem.quantity,
+                    OrderItem.price_at_order, Order.created_at)
+             .join(Order, Order.id == OrderItem.order_id)
+             .where(Order.id > after_id,
+                    Order.payment_status == 'completed',
+                    Order.status != 'cancelled',
+                    Order.created_at.isnot(None))
+             .order_by(OrderItem.order_id, OrderItem.id))
+    if up_to_id is not None:
+        query = query.where(Order.id <= up_to_id)
+    return query.execution_options(yield_per=LOAD_BATCH_SIZE)
+
+class SalesAnalytics:
+    """Per-process column cache with a settled part and a re-read tail"""
+
+    def __init__(self, settle_after=86400, refresh_interval=30, use_numpy=None):
+        self.settle_after = settle_after
+        self.refresh_interval = refresh_interval
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+        self._lock = threading.Lock()
+        self.settled = LineColumns()
+        self.tail = LineColumns()
+        self.watermark = 0
+        self.version = None
+        self._refreshed_at = None
+
+    def refresh(self, force=False):
+        with self._lock:
+            if (not force and self._refreshed_at is not None
+                    and time.monotonic() - self._refreshed_at < self.refresh_interval):
+                return
+            self._refresh()
+            self._refreshed_at = time.monotonic()
+
+    def _refresh(self):
+        version = CacheVersion.get(SALES_VERSION)
+        if version != self.version:
+            # An order behind the watermark changed since the settled lines were read
+            self.settled, self.watermark, self.version = LineColumns(), 0, version
+
+        cutoff = datetime.utcnow() - timedelta(seconds=self.settle_after)
+        unsettled = (Order.created_at >= cutoff) & Order.status.notin_(FINAL_STATUSES)
+        first_unsettled, last_id = db.session.execute(
+            select(func.min(case((unsettled, Order.id))), func.max(Order.id))
+            .where(Order.id > self.watermark)).one()
+        watermark = first_unsettled - 1 if first_unsettled is not None else (last_id or self.watermark)
+
+        if watermark > self.watermark:
+            self.settled.load(db.session.execute(line_query(self.watermark, watermark)))
+            self.watermark = watermark
+        tail = LineColumns()
+        tail.load(db.session.execute(line_query(self.watermark)))
+        self.tail = tail
+
+    def totals(self, days=None):
+        """SalesTotals over the last `days` days (all time when None)"""
+        self.refresh()
+        since_day = (datetime.utcnow().date() - timedelta(days=days - 1)).toordinal() if days else None
+        aggregate = aggregate_numpy if self.use_numpy else aggregate_python
+        with self._lock:
+            return aggregate(self.settled, since_day).add(aggregate(self.tail, since_day))
+
+    def stats(self):
+        return {
+            'backend': 'numpy' if self.use_numpy else 'python',
+            'watermark': self.watermark,
+            'settled_lines': len(self.settled),
+            'tail_lines': len(self.tail),
+            'bytes': self.settled.nbytes() + self.tail.nbytes(),
+        }
+
+def lines_changed(changes):
+    """Invalidate settled lines across processes, as part of the current transaction.
+
+    `changes` holds (created_at, previous status) of each order whose lines just
+    started or stopped counting; only orders that may already be settled matter.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['ANALYTICS_SETTLE_AFTER'])
+    if any(status in FINAL_STATUSES or (created_at is not None and created_at < cutoff)
+           for created_at, status in changes):
+        CacheVersion.bump(SALES_VERSION)
+
+def init_app(app):
+    app.config.setdefault('ANALYTICS_SETTLE_AFTER', 86400)
+    app.config.setdefault('ANALYTICS_REFRESH_INTERVAL', 30)
+    app.extensions['sales_analytics'] = SalesAnalytics(
+        settle_after=app.config['ANALYTICS_SETTLE_AFTER'],
+        refresh_interval=app.config['ANALYTICS_REFRESH_INTERVAL'],
+    )
+
+def sales():
+    return current_app.extensions['sales_analytics']
@@ -3,9 +3,15 @@ from flask_login import login_user, logout_user, login_required, current_user
 from app import db
 from app.models import User
 from app.auth_forms import LoginForm, RegisterForm
+from app.passwords import HashingBusy
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+def _hashing_busy(template, form):
+    """Shed load when too many passwords are being hashed at once"""
+    flash('We are handling a lot of sign-ins right now. Please try again in a moment.', 'warning')
+    return render_template(template, form=form), 503, {'Retry-After': '2'}
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     """User login"""
@@ -16,7 +22,12 @@ def login():
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         
-        if user is None or not user.check_password(form.password.data):
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+        except HashingBusy:
+            return _hashing_busy('auth/login.html', form)
+        
+        if not valid:
             flash('Invalid email or password', 'danger')
             return redirect(url_for('auth.login'))
         
@@ -24,6 +35,15 @@ def login():
             flash('Your account has been deactivated', 'warning')
             return redirect(url_for('auth.login'))
         
+        # Transparently upgrade hashes made with an older method or cost; the
+        # check itself hashes once per process, so it can be busy too
+        try:
+            if user.password_needs_rehash():
+                user.set_password(form.password.data)
+                db.session.commit()
+        except HashingBusy:
+            pass
+        
         login_user(user, remember=form.remember_me.data)
         next_page = request.args.get('next')
         
@@ -48,7 +68,10 @@ def register():
             full_name=form.full_name.data,
             is_admin=False
         )
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except HashingBusy:
+            return _hashing_busy('auth/register.html', form)
         
         db.session.add(user)
         db.session.commit()
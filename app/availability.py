@@ -0,0 +1,33 @@
+"""Effective burger availability derived from ingredient availability and stock"""
+from sqlalchemy import exists, not_, or_, update
+from app import db
+from app.models import Burger, BurgerIngredient, Ingredient
+
+def refresh_burger_availability(burger_ids=None, session=None):
+    """Recompute ingredients_available for some (or all) burgers in one UPDATE.
+
+    An ingredient is missing when it is marked unavailable or its tracked stock
+    cannot cover one more burger. Returns the number of burgers that flipped.
+    """
+    if burger_ids is not None and not burger_ids:
+        return 0
+
+    missing_ingredient = exists().where(
+        BurgerIngredient.burger_id == Burger.id,
+        BurgerIngredient.ingredient_id == Ingredient.id,
+        or_(Ingredient.is_available == False,
+            Ingredient.stock_quantity < BurgerIngredient.quantity),
+    )
+    statement = (update(Burger)
+                 .where(Burger.ingredients_available != not_(missing_ingredient))
+                 .values(ingredients_available=not_(missing_ingredient)))
+    if burger_ids is not None:
+        statement = statement.where(Burger.id.in_(burger_ids))
+
+    session = session or db.session
+    result = session.execute(statement.execution_options(synchronize_session=False))
+    return result.rowcount
+
+def ingredient_changed(snapshot, ingredient_id):
+    """Cascade an ingredient availability change to the burgers that use it"""
+    return refresh_burger_availability(snapshot.burgers_using(ingredient_id))
@@ -0,0 +1,169 @@
+"""Shopping cart storage backends.
+
+``CART_BACKEND`` selects where cart lines live: ``database`` keeps them in the
+``cart_items`` table, ``session`` keeps them in the signed session cookie so
+browsing and editing the cart never touch the database. Either way lines are
+resolved against the menu snapshot, and checkout reads them through the same
+interface.
+"""
+import abc
+from collections import namedtuple
+from flask import current_app, session
+from sqlalchemy import delete
+from app import db
+from app.catalog import menu_catalog
+from app.models import CartItem
+
+CartLine = namedtuple('CartLine', 'id burger quantity')
+
+class CartBackend(abc.ABC):
+    """Storage interface for one user's cart"""
+
+    def __init__(self, user):
+        self.user = user
+
+    @abc.abstractmethod
+    def lines(self):
+        """Cart lines with their burger snapshots"""
+
+    @abc.abstractmethod
+    def count(self):
+        """Number of distinct lines in the cart"""
+
+    def total(self):
+        return sum(line.burger.price * line.quantity for line in self.lines())
+
+    @abc.abstractmethod
+    def add(self, burger_id, quantity):
+        """Add `quantity` of a burger, merging with an existing line"""
+
+    @abc.abstractmethod
+    def update(self, line_id, quantity):
+        """Set a line's quantity (removing it below 1); False if it is not in this cart"""
+
+    @abc.abstractmethod
+    def remove(self, line_id):
+        """Remove a line; False if it is not in this cart"""
+
+    @abc.abstractmethod
+    def clear(self):
+        """Empty the cart as part of the current transaction"""
+
+    def _resolve(self, rows):
+        snapshot = menu_catalog.current()
+        lines = []
+        for line_id, burger_id, quantity in rows:
+            burger = snapshot.get(burger_id)
+            if burger is not None:
+                lines.append(CartLine(line_id, burger, quantity))
+        return lines
+
+class DatabaseCart(CartBackend):
+    """Cart lines stored as CartItem rows"""
+
+    def lines(self):
+        rows = db.session.execute(
+            db.select(CartItem.id, CartItem.burger_id, CartItem.quantity)
+            .where(CartItem.user_id == self.user.id)
+            .order_by(CartItem.id)
+        )
+        return self._resolve(rows)
+
+    def count(self):
+        return CartItem.query.filter_by(user_id=self.user.id).count()
+
+    def add(self, burger_id, quantity):
+        cart_item = CartItem.query.filter_by(user_id=self.user.id, burger_id=burger_id).first()
+        if cart_item:
+            cart_item.quantity += quantity
+        else:
+            db.session.add(CartItem(user_id=self.user.id, burger_id=burger_id, quantity=quantity))
+        db.session.commit()
+
+    def update(self, line_id, quantity):
+        cart_item = db.session.get(CartItem, line_id)
+        if cart_item is None or cart_item.user_id != self.user.id:
+            return False
+        if quantity < 1:
+            db.session.delete(cart_item)
+        else:
+            cart_item.quantity = quantity
+        db.session.commit()
+        return True
+
+    def remove(self, line_id):
+        return self.update(line_id, 0)
+
+    def clear(self):
+        db.session.execute(delete(CartItem).where(CartItem.user_id == self.user.id))
+
+class SessionCart(CartBackend):
+    """Cart lines stored in the signed session cookie, keyed by burger id"""
+
+    KEY = 'cart'
+
+    def _data(self):
+        data = session.get(self.KEY)
+        if not data or data.get('user_id') != self.user.id:
+            data = {'user_id': self.user.id, 'items': {}, 'total': 0.0, 'version': None}
+        return data
+
+    def _save(self, data):
+        # Keep a running total priced at the menu version it was computed for
+        snapshot = menu_catalog.current()
+        data['total'] = sum(snapshot.by_id[int(burger_id)].price * quantity
+                            for burger_id, quantity in data['items'].items()
+                            if int(burger_id) in snapshot.by_id)
+        data['version'] = snapshot.version
+        session[self.KEY] = data
+
+    def lines(self):
+        items = self._data()['items']
+        return self._resolve((int(burger_id), int(burger_id), quantity)
+                             for burger_id, quantity in items.items())
+
+    def count(self):
+        return len(self._data()['items'])
+
+    def total(self):
+        data = self._data()
+        if data['version'] == menu_catalog.version():
+            return data['total']
+        return super().total()
+
+    def add(self, burger_id, quantity):
+        data = self._data()
+        key = str(burger_id)
+        data['items'][key] = data['items'].get(key, 0) + quantity
+        self._save(data)
+
+    def update(self, line_id, quantity):
+        data = self._data()
+        key = str(line_id)
+        if key not in data['items']:
+            return False
+        if quantity < 1:
+            del data['items'][key]
+        else:
+            data['items'][key] = quantity
+        self._save(data)
+        return True
+
+    def remove(self, line_id):
+        return self.update(line_id, 0)
+
+    def clear(self):
+        session.pop(self.KEY, None)
+
+BACKENDS = {
+    'database': DatabaseCart,
+    'session': SessionCart,
+}
+
+def get_cart(user):
+    """Cart backend configured by CART_BACKEND for a user"""
+    backend = current_app.config.get('CART_BACKEND', 'database')
+    try:
+        return BACKENDS[backend](user)
+    except KeyError:
+        raise RuntimeError(f'Unknown CART_BACKEND {backend!r}') from None
@@ -0,0 +1,193 @@
+"""Read-through cache of the burger menu.
+
+Workers keep an immutable snapshot of every burger with its ingredient list and
+compare it against the ``menu`` row in ``cache_versions`` once per request. Admin
+endpoints that change burgers or ingredients call ``menu_catalog.bump()`` in the
+same transaction, so every worker rebuilds on its next request.
+"""
+import threading
+from collections import namedtuple
+from flask import abort, current_app, g
+from app import db
+from app.pagination import Page
+from app.models import Burger, BurgerIngredient, Ingredient, CacheVersion
+
+MENU_VERSION = 'menu'
+
+IngredientSnapshot = namedtuple('IngredientSnapshot', 'id name price is_available stock_tracked')
+IngredientLine = namedtuple('IngredientLine', 'ingredient_id name quantity is_available')
+BurgerSnapshot = namedtuple('BurgerSnapshot',
+                            'id name description price is_available is_orderable image_url ingredients')
+
+class MenuSnapshot:
+    """Immutable view of the whole menu at one version"""
+
+    def __init__(self, version, burgers, ingredients):
+        self.version = version
+        self.burgers = burgers
+        self.ingredients = ingredients
+        self.by_id = {burger.id: burger for burger in burgers}
+        self._pages = {}
+
+        # Reverse index: ingredient id -> ids of the burgers that use it
+        reverse = {}
+        for burger in burgers:
+            for line in burger.ingredients:
+                reverse.setdefault(line.ingredient_id, set()).add(burger.id)
+        self.by_ingredient = {ingredient_id: frozenset(ids) for ingredient_id, ids in reverse.items()}
+
+        # Burger x ingredient matrix as sparse rows: burger id -> ((ingredient id, quantity), ...)
+        self.recipes = {
+            burger.id: tuple((line.ingredient_id, line.quantity or 0) for line in burger.ingredients)
+            for burger in burgers if burger.ingredients
+        }
+
+        # The same rows over stock-tracked ingredients only, and the most any one
+        # burger needs of each of them
+        self.stock_recipes = {}
+        self.max_need = {}
+        for burger_id, recipe in self.recipes.items():
+            recipe = tuple(entry for entry in recipe if ingredients[entry[0]].stock_tracked)
+            if recipe:
+                self.stock_recipes[burger_id] = recipe
+            for ingredient_id, quantity in recipe:
+                self.max_need[ingredient_id] = max(self.max_need.get(ingredient_id, 0), quantity)
+
+    def expand(self, burger_quantities):
+        """Summed ingredient quantities for {burger id: count} through the recipe matrix"""
+        totals = {}
+        for burger_id, count in burger_quantities.items():
+            for ingredient_id, quantity in self.recipes.get(burger_id, ()):
+                totals[ingredient_id] = totals.get(ingredient_id, 0) + quantity * count
+        return totals
+
+    def get(self, burger_id):
+        return self.by_id.get(burger_id)
+
+    def burgers_using(self, ingredient_id):
+        return self.by_ingredient.get(ingredient_id, frozenset())
+
+    def get_or_404(self, burger_id):
+        burger = self.by_id.get(burger_id)
+        if burger is None:
+            abort(404)
+        return burger
+
+    def page(self, page, per_page, error_out=True):
+        """Memoized page slice of the burger list"""
+        key = (page, per_page)
+        result = self._pages.get(key)
+        if result is None:
+            start = (page - 1) * per_page
+            result = Page(self.burgers[start:start + per_page] if page > 0 else (),
+                          page, per_page, len(self.burgers))
+            if result.items or page == 1:
+                self._pages[key] = result
+        if error_out and (page < 1 or (not result.items and page != 1)):
+            abort(404)
+        return result
+
+def build_snapshot(version):
+    """Load the menu with one query per table"""
+    ingredients = {
+        row.id: IngredientSnapshot(row.id, row.name, row.price, bool(row.is_available),
+                                   row.stock_quantity is not None)
+        for row in db.session.execute(
+            db.select(Ingredient.id, Ingredient.name, Ingredient.price, Ingredient.is_available,
+                      Ingredient.stock_quantity)
+        )
+    }
+
+    lines = {}
+    for burger_id, ingredient_id, quantity in db.session.execute(
+        db.select(BurgerIngredient.burger_id, BurgerIngredient.ingredient_id, BurgerIngredient.quantity)
+        .order_by(BurgerIngredient.id)
+    ):
+        ingredient = ingredients.get(ingredient_id)
+        if ingredient is None:
+            continue
+        lines.setdefault(burger_id, []).append(
+            IngredientLine(ingredient_id, ingredient.name, quantity, ingredient.is_available)
+        )
+
+    burgers = tuple(
+        BurgerSnapshot(row.id, row.name, row.description, row.price, bool(row.is_available),
+                       bool(row.is_available and row.ingredients_available),
+                       row.image_url, tuple(lines.get(row.id, ())))
+        for row in db.session.execute(
+            db.select(Burger.id, Burger.name, Burger.description, Burger.price,
+                      Burger.is_available, Burger.ingredients_available, Burger.image_url)
+            .order_by(Burger.id)
+        )
+    )
+    return MenuSnapshot(version, burgers, ingredients)
+
+class MenuCatalog:
+    """Flask extension holding one menu snapshot per application"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['menu_catalog'] = {
+            'snapshot': None,
+            'lock': threading.Lock(),
+            'hits': 0,
+            'rebuilds': 0,
+        }
+        app.before_request(self._reset_version)
+
+    def _reset_version(self):
+        g.pop('menu_version', None)
+        g.pop('menu_changed_at', None)
+
+    def _state(self):
+        return current_app.extensions['menu_catalog']
+
+    def version(self):
+        """Menu version from the database, checked once per request"""
+        if 'menu_version' not in g:
+            g.menu_version, g.menu_changed_at = CacheVersion.get_with_time(MENU_VERSION)
+        return g.menu_version
+
+    def changed_at(self):
+        """When the menu version last moved, or None when that is not known"""
+        self.version()
+        return g.menu_changed_at
+
+    def current(self):
+        """Snapshot matching the current menu version"""
+        state = self._state()
+        version = self.version()
+        snapshot = state['snapshot']
+        # A lagging read replica may report an older version than the cached snapshot
+        if snapshot is not None and snapshot.version >= version:
+            state['hits'] += 1
+            return snapshot
+
+        with state['lock']:
+            snapshot = state['snapshot']
+            if snapshot is None or snapshot.version < version:
+                snapshot = build_snapshot(version)
+                state['snapshot'] = snapshot
+                state['rebuilds'] += 1
+        return snapshot
+
+    def bump(self):
+        """Invalidate every worker's snapshot when the transaction commits"""
+        CacheVersion.bump(MENU_VERSION)
+        g.pop('menu_version', None)
+        g.pop('menu_changed_at', None)
+
+    def stats(self):
+        state = self._state()
+        snapshot = state['snapshot']
+        return {
+            'version': snapshot.version if snapshot else None,
+            'burgers': len(snapshot.burgers) if snapshot else 0,
+            'hits': state['hits'],
+            'rebuilds': state['rebuilds'],
+        }
+
+menu_catalog = MenuCatalog()
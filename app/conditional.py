@@ -0,0 +1,70 @@
+"""Conditional GET for pages whose content follows known row versions.
+
+A view names what its page depends on (the menu version, an order's
+``updated_at``, the cart size) and hands ``cached_page`` a function that
+renders it. The ETag is a hash of those versions, the user, the template
+sources and the query string, so it changes whenever the page could. When the
+browser's ``If-None-Match`` (or, without one, ``If-Modified-Since``) still
+matches, the view answers 304 without loading details or rendering. Only pass
+``last_modified`` when it moves with every one of the versions: pages that show
+the menu take the later of their own timestamp and the menu's ``changed_at``,
+and send none while either is unknown.
+
+Every page here is personal: validated pages are sent ``private, no-cache``
+(the browser may keep them but must revalidate, and shared caches must not
+store them), and any other page for a signed-in user defaults to ``private,
+no-store``. A page with pending flash messages is always rendered so they are
+shown.
+"""
+import hashlib
+import os
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+def _template_version(app):
+    """Hash of the template sources, so a deploy that changes a page changes its ETags"""
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(os.path.join(app.root_path, app.template_folder)):
+        dirs.sort()
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as source:
+                digest.update(name.encode())
+                digest.update(source.read())
+    return digest.hexdigest()[:12]
+
+def make_etag(*versions):
+    """Strong ETag for the current user's view of a page at `versions`"""
+    parts = (current_app.extensions['conditional_get'], current_user.get_id(),
+             request.full_path, *versions)
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+def cached_page(render, *versions, last_modified=None):
+    """304 when the browser's copy is current, otherwise the response from `render()`"""
+    etag = make_etag(*versions)
+    if '_flashes' not in session and not is_resource_modified(request.environ, etag=etag,
+                                                               last_modified=last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+def _default_policy(response):
+    """Keep signed-in pages out of shared caches unless a view chose a policy"""
+    # The session, not current_user: after a commit reading the user would reload it
+    if (request.endpoint != 'static' and 'Cache-Control' not in response.headers
+            and session.get('_user_id')):
+        response.cache_control.private = True
+        response.cache_control.no_store = True
+        response.vary.add('Cookie')
+    return response
+
+def init_app(app):
+    app.extensions['conditional_get'] = _template_version(app)
+    app.after_request(_default_policy)
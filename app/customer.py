@@ -1,47 +1,74 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+import uuid
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort
 from flask_login import login_required, current_user
-from app import db
-from app.models import Burger, CartItem, Order, OrderItem
+from sqlalchemy import insert
+from sqlalchemy.orm import joinedload
+from sqlalchemy.exc import IntegrityError
+from app import conditional, db, events, payments, rollups, search, stock
+from app.instrumentation import query_budget
+from app.catalog import menu_catalog
+from app.search import menu_search
+from app.pagination import Page, keyset_paginate, cached_count
+from app.cart import get_cart
+from app.models import Order, OrderItem
 
 customer_bp = Blueprint('customer', __name__, url_prefix='/shop')
 
 @customer_bp.route('/')
 @customer_bp.route('/dashboard')
+@query_budget(7)
 @login_required
 def dashboard():
     """Customer dashboard - browse burgers"""
     if current_user.is_admin:
         return redirect(url_for('admin.dashboard'))
     
+    cart_count = get_cart(current_user).count()
+    return conditional.cached_page(lambda: _render_dashboard(cart_count), menu_catalog.version(), cart_count)
+
+def _render_dashboard(cart_count):
     page = request.args.get('page', 1, type=int)
-    burgers = Burger.query.paginate(page=page, per_page=12)
-    cart_count = CartItem.query.filter_by(user_id=current_user.id).count()
-    
-    return render_template('customer/dashboard.html', burgers=burgers, cart_count=cart_count)
+    snapshot = menu_catalog.current()
+    query = search.parse(request.args.get('q', ''),
+                         min_price=request.args.get('min_price', type=float),
+                         max_price=request.args.get('max_price', type=float),
+                         available_only=request.args.get('available') == '1')
+    if search.is_empty(query):
+        burgers = snapshot.page(page, per_page=12)
+    else:
+        results = menu_search.search(snapshot, query)
+        start = (max(page, 1) - 1) * 12
+        burgers = Page(results[start:start + 12], max(page, 1), 12, len(results))
+    
+    search_args = {name: request.args[name] for name in ('q', 'min_price', 'max_price', 'available')
+                   if request.args.get(name)}
+    return render_template('customer/dashboard.html', burgers=burgers, cart_count=cart_count,
+                           searching=not search.is_empty(query), search_args=search_args)
 
 @customer_bp.route('/burger/<int:burger_id>')
+@query_budget(5)
 @login_required
 def burger_detail(burger_id):
     """View burger details"""
-    burger = Burger.query.get_or_404(burger_id)
-    return render_template('customer/burger_detail.html', burger=burger)
+    def render():
+        burger = menu_catalog.current().get_or_404(burger_id)
+        return render_template('customer/burger_detail.html', burger=burger)
+    return conditional.cached_page(render, menu_catalog.version(), last_modified=menu_catalog.changed_at())
 
 @customer_bp.route('/cart')
 @login_required
 def view_cart():
     """View shopping cart"""
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    total = sum(item.burger.price * item.quantity for item in cart_items)
-    
-    return render_template('customer/cart.html', cart_items=cart_items, total=total)
+    cart = get_cart(current_user)
+    return render_template('customer/cart.html', cart_items=cart.lines(), total=cart.total())
 
 @customer_bp.route('/cart/add/<int:burger_id>', methods=['POST'])
 @login_required
 def add_to_cart(burger_id):
     """Add burger to cart"""
-    burger = Burger.query.get_or_404(burger_id)
+    burger = menu_catalog.current().get_or_404(burger_id)
     
-    if not burger.is_available:
+    if not burger.is_orderable:
         flash('This burger is not available', 'warning')
         return redirect(url_for('customer.dashboard'))
     
@@ -49,15 +76,7 @@ def add_to_cart(burger_id):
     if quantity < 1:
         quantity = 1
     
-    cart_item = CartItem.query.filter_by(user_id=current_user.id, burger_id=burger_id).first()
-    
-    if cart_item:
-        cart_item.quantity += quantity
-    else:
-        cart_item = CartItem(user_id=current_user.id, burger_id=burger_id, quantity=quantity)
-        db.session.add(cart_item)
-    
-    db.session.commit()
+    get_cart(current_user).add(burger_id, quantity)
     flash(f'Added {burger.name} to cart!', 'success')
     return redirect(url_for('customer.view_cart'))
 
@@ -65,14 +84,9 @@ def add_to_cart(burger_id):
 @login_required
 def remove_from_cart(cart_item_id):
     """Remove item from cart"""
-    cart_item = CartItem.query.get_or_404(cart_item_id)
+    if not get_cart(current_user).remove(cart_item_id):
+        abort(404)
     
-    if cart_item.user_id != current_user.id:
-        flash('Unauthorized', 'danger')
-        return redirect(url_for('customer.view_cart'))
-    
-    db.session.delete(cart_item)
-    db.session.commit()
     flash('Item removed from cart', 'info')
     return redirect(url_for('customer.view_cart'))
 
@@ -80,65 +94,84 @@ def remove_from_cart(cart_item_id):
 @login_required
 def update_cart(cart_item_id):
     """Update cart item quantity"""
-    cart_item = CartItem.query.get_or_404(cart_item_id)
-    
-    if cart_item.user_id != current_user.id:
-        return jsonify({'error': 'Unauthorized'}), 403
-    
     quantity = request.json.get('quantity', 1)
     
-    if quantity < 1:
-        db.session.delete(cart_item)
-    else:
-        cart_item.quantity = quantity
+    if not get_cart(current_user).update(cart_item_id, quantity):
+        return jsonify({'error': 'Not found'}), 404
     
-    db.session.commit()
     return jsonify({'success': True})
 
 @customer_bp.route('/checkout', methods=['GET', 'POST'])
+@query_budget(22)
 @login_required
 def checkout():
     """Checkout and create order"""
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
+    idempotency_key = request.form.get('idempotency_key') or None
+    if request.method == 'POST' and idempotency_key:
+        # A retried or double-clicked submit returns the order it already created
+        existing = _order_for_key(idempotency_key)
+        if existing:
+            return redirect(url_for('customer.payment', order_id=existing.id))
+    
+    cart = get_cart(current_user)
+    cart_items = cart.lines()
     
     if not cart_items:
         flash('Your cart is empty', 'warning')
         return redirect(url_for('customer.view_cart'))
     
+    total = sum(item.burger.price * item.quantity for item in cart_items)
+    
     if request.method == 'POST':
-        total_price = sum(item.burger.price * item.quantity for item in cart_items)
+        if not all(item.burger.is_orderable for item in cart_items):
+            flash('Some items in your cart are no longer available', 'warning')
+            return redirect(url_for('customer.view_cart'))
         
-        # Create order
-        order = Order(user_id=current_user.id, total_price=total_price, status='pending')
+        # Create order, its items and clear the cart in one transaction
+        order = Order(user_id=current_user.id, total_price=total, status='pending',
+                      customer_name=current_user.full_name, item_count=len(cart_items),
+                      idempotency_key=idempotency_key)
         db.session.add(order)
-        db.session.flush()  # Get order ID
-        
-        # Create order items
-        for cart_item in cart_items:
-            order_item = OrderItem(
-                order_id=order.id,
-                burger_id=cart_item.burger_id,
-                quantity=cart_item.quantity,
-                price_at_order=cart_item.burger.price
-            )
-            db.session.add(order_item)
+        try:
+            db.session.flush()  # Get order ID
+        except IntegrityError:
+            # A concurrent request with the same key won the race
+            db.session.rollback()
+            existing = _order_for_key(idempotency_key) if idempotency_key else None
+            if existing is None:
+                raise
+            return redirect(url_for('customer.payment', order_id=existing.id))
         
-        db.session.commit()
-        
-        # Clear cart
-        CartItem.query.filter_by(user_id=current_user.id).delete()
+        db.session.execute(insert(OrderItem), [
+            {'order_id': order.id, 'burger_id': item.burger.id,
+             'quantity': item.quantity, 'price_at_order': item.burger.price}
+            for item in cart_items
+        ])
+        snapshot = menu_catalog.current()
+        try:
+            stock.deduct(snapshot, stock.demand(snapshot, cart_items), order.id)
+        except stock.OutOfStock as error:
+            db.session.rollback()
+            flash(f'Sorry, we are running low on {error}. Please adjust your cart.', 'warning')
+            return redirect(url_for('customer.view_cart'))
+        cart.clear()
+        rollups.record_order_created(order)
+        events.order_changed(order, 'created')
         db.session.commit()
         
         flash('Order created! Proceeding to payment...', 'success')
         return redirect(url_for('customer.payment', order_id=order.id))
     
-    total = sum(item.burger.price * item.quantity for item in cart_items)
-    return render_template('customer/checkout.html', cart_items=cart_items, total=total)
+    return render_template('customer/checkout.html', cart_items=cart_items, total=total,
+                           idempotency_key=uuid.uuid4().hex)
+
+def _order_for_key(idempotency_key):
+    return Order.query.filter_by(user_id=current_user.id, idempotency_key=idempotency_key).first()
 
 @customer_bp.route('/payment/<int:order_id>', methods=['GET', 'POST'])
 @login_required
 def payment(order_id):
-    """Payment page (using Stripe)"""
+    """Payment page; the charge itself runs in the background"""
     order = Order.query.get_or_404(order_id)
     
     if order.user_id != current_user.id:
@@ -146,23 +179,35 @@ def payment(order_id):
         return redirect(url_for('customer.dashboard'))
     
     if request.method == 'POST':
-        # In production, integrate with Stripe here
-        # For now, simulate successful payment
-        order.payment_status = 'completed'
-        order.status = 'confirmed'
-        db.session.commit()
-        
+        try:
+            payments.start(order)
+        except payments.PaymentsBusy:
+            flash('We are handling a lot of payments right now. Please try again in a moment.', 'warning')
+        return redirect(url_for('customer.payment', order_id=order_id))
+    
+    if order.status == 'cancelled' and order.payment_status != 'completed':
+        flash('This order was cancelled and can no longer be paid.', 'danger')
+        return redirect(url_for('customer.order_detail', order_id=order.id))
+    if order.payment_status == 'completed':
         flash('Payment successful! Your order has been confirmed.', 'success')
-        return redirect(url_for('customer.orders'))
+        return redirect(url_for('customer.order_detail', order_id=order.id))
+    if order.payment_status == 'processing' and not payments.is_stale(order):
+        return render_template('customer/payment_pending.html', order=order)
     
-    return render_template('customer/payment.html', order=order)
+    # Burger names for the summary in one query rather than one per item
+    items = OrderItem.query.options(joinedload(OrderItem.burger)).filter_by(order_id=order.id).all()
+    return render_template('customer/payment.html', order=order, items=items)
 
 @customer_bp.route('/orders')
+@query_budget(4)
 @login_required
 def orders():
     """View customer orders"""
     page = request.args.get('page', 1, type=int)
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).paginate(page=page, per_page=10)
+    cursor = request.args.get('cursor')
+    query = Order.query.filter_by(user_id=current_user.id)
+    total = cached_count(('orders', current_user.id), query.count)
+    orders = keyset_paginate(query, Order, per_page=10, cursor=cursor, page=page, total=total)
     
     return render_template('customer/orders.html', orders=orders)
 
@@ -170,10 +215,30 @@ def orders():
 @login_required
 def order_detail(order_id):
     """View order details"""
-    order = Order.query.get_or_404(order_id)
+    row = db.session.execute(
+        db.select(Order.user_id, Order.updated_at, Order.created_at).where(Order.id == order_id)).first()
+    if row is None:
+        abort(404)
     
-    if order.user_id != current_user.id:
+    if row.user_id != current_user.id:
         flash('Unauthorized', 'danger')
         return redirect(url_for('customer.orders'))
     
-    return render_template('customer/order_detail.html', order=order)
+    def render():
+        order = (Order.query.options(joinedload(Order.items).joinedload(OrderItem.burger))
+                 .filter_by(id=order_id).one())
+        return render_template('customer/order_detail.html', order=order)
+    # Item names come from the burgers, so a menu change also changes the page
+    order_changed = row.updated_at or row.created_at
+    menu_changed = menu_catalog.changed_at()
+    last_modified = max(order_changed, menu_changed) if order_changed and menu_changed else None
+    return conditional.cached_page(render, order_changed, menu_catalog.version(), last_modified=last_modified)
+
+@customer_bp.route('/order/<int:order_id>/stream')
+@login_required
+def order_stream(order_id):
+    """Live status of one order (Server-Sent Events)"""
+    owner_id = db.session.execute(db.select(Order.user_id).where(Order.id == order_id)).scalar()
+    if owner_id is None or owner_id != current_user.id:
+        abort(404)
+    return events.stream(lambda payload: payload['order_id'] == order_id)
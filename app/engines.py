@@ -0,0 +1,108 @@
+"""Database engine profiles.
+
+SQLite gets pragmas on every new connection: WAL so checkout writers do not
+block readers, a relaxed ``synchronous`` level that is still safe with WAL, a
+busy timeout instead of immediate "database is locked" errors, and larger
+page and mmap caches. Server databases get a sized connection pool with
+pre-ping and recycling. Every value comes from config (and so from the
+environment), and the effective settings are logged at startup.
+"""
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Applied in this order: the busy timeout must be in place before switching to WAL
+SQLITE_PRAGMAS = [
+    ('busy_timeout', 'SQLITE_BUSY_TIMEOUT'),
+    ('journal_mode', 'SQLITE_JOURNAL_MODE'),
+    ('synchronous', 'SQLITE_SYNCHRONOUS'),
+    ('cache_size', 'SQLITE_CACHE_SIZE'),
+    ('mmap_size', 'SQLITE_MMAP_SIZE'),
+]
+
+POOL_OPTIONS = [
+    ('pool_size', 'DB_POOL_SIZE'),
+    ('max_overflow', 'DB_MAX_OVERFLOW'),
+    ('pool_timeout', 'DB_POOL_TIMEOUT'),
+    ('pool_recycle', 'DB_POOL_RECYCLE'),
+    ('pool_pre_ping', 'DB_POOL_PRE_PING'),
+]
+
+def is_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+def sqlite_pragmas(config):
+    """(pragma, value) pairs from config; unset values are left at SQLite's default"""
+    return [(pragma, config[key]) for pragma, key in SQLITE_PRAGMAS if config.get(key) is not None]
+
+def engine_options(url, config):
+    """Engine options for `url`: the pool profile for server databases, none for SQLite"""
+    if is_sqlite(url):
+        return {}
+    return {option: config[key] for option, key in POOL_OPTIONS if config.get(key) is not None}
+
+def install_pragmas(engine, pragmas):
+    """Run the pragmas on every new DBAPI connection of a SQLite engine"""
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas:
+            cursor.execute(f'PRAGMA {pragma}={value}')
+        cursor.close()
+
+def effective_settings(engine):
+    """Settings a live connection of `engine` actually runs with"""
+    settings = {
+        'url': engine.url.render_as_string(hide_password=True),
+        'pool': type(engine.pool).__name__,
+    }
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            for pragma, _ in SQLITE_PRAGMAS:
+                settings[pragma] = connection.exec_driver_sql(f'PRAGMA {pragma}').scalar()
+    else:
+        pool = engine.pool
+        settings.update(pool_size=pool.size(), max_overflow=getattr(pool, '_max_overflow', None),
+                        pool_timeout=getattr(pool, '_timeout', None), pool_recycle=getattr(pool, '_recycle', None),
+                        pool_pre_ping=getattr(pool, '_pre_ping', None))
+    return settings
+
+def configure(app):
+    """Fill engine options from the profile before the engines are created"""
+    options = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    # Binds (e.g. the read replica) do not inherit SQLALCHEMY_ENGINE_OPTIONS
+    binds = {}
+    for key, bind in app.config.get('SQLALCHEMY_BINDS', {}).items():
+        if not isinstance(bind, dict):
+            bind = {'url': bind, **engine_options(bind, app.config)}
+        binds[key] = bind
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+def init_app(app, db):
+    """Install SQLite pragmas on the app's engines and log the effective settings"""
+    pragmas = sqlite_pragmas(app.config)
+    report = {}
+    with app.app_context():
+        for bind, engine in db.engines.items():
+            if engine.dialect.name == 'sqlite':
+                install_pragmas(engine, pragmas)
+            report[bind or 'default'] = effective_settings(engine)
+    app.extensions['engine_settings'] = report
+
+    for bind, values in report.items():
+        app.logger.info('Database engine %s: %s', bind, describe(values))
+
+def describe(values):
+    """One-line summary of effective_settings()"""
+    details = ', '.join(f'{key}={value}' for key, value in values.items() if key != 'url')
+    return f'{values["url"]} ({details})'
+
+def settings():
+    """Effective engine settings of the current app, keyed by bind"""
+    return current_app.extensions['engine_settings']
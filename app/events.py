@@ -0,0 +1,144 @@
+"""In-process order event bus with Server-Sent Events feeds.
+
+Checkout, payment and status changes queue a small delta for each order they
+touch; the deltas are published when the transaction commits (and dropped on
+rollback). The bus keeps recent events in a ring buffer with increasing ids.
+Subscribers wait on one condition variable and read past their last seen id,
+so publishing is O(1) however many kitchen screens or customers are
+listening, and no subscriber ever queries the database. Clients resume with
+``Last-Event-ID``.
+
+Events only reach subscribers connected to the same process; with several
+workers each serves the changes it made itself plus whatever the page showed
+at load time.
+"""
+import json
+import threading
+import time
+from collections import deque
+from flask import Response, current_app, has_app_context, request
+from sqlalchemy import event
+from app import db
+
+class EventBus:
+    """Ring buffer of events that subscribers read by id"""
+
+    def __init__(self, size=1000):
+        self._events = deque(maxlen=size)
+        self._last_id = 0
+        self._condition = threading.Condition()
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, payloads):
+        """Append payloads as events and wake every subscriber once"""
+        if not payloads:
+            return
+        with self._condition:
+            for payload in payloads:
+                self._last_id += 1
+                self._events.append((self._last_id, payload))
+            self._condition.notify_all()
+
+    def since(self, after_id):
+        """Events newer than `after_id`, or None when some were already dropped"""
+        with self._condition:
+            return self._since(after_id)
+
+    def _since(self, after_id):
+        if self._events and after_id < self._events[0][0] - 1:
+            return None
+        return [(event_id, payload) for event_id, payload in self._events if event_id > after_id]
+
+    def wait(self, after_id, timeout):
+        """Block until there are events newer than `after_id` or the timeout passes"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._last_id > after_id, timeout=timeout)
+            return self._since(after_id)
+
+def init_app(app):
+    app.config.setdefault('ORDER_EVENT_BUFFER', 1000)
+    app.config.setdefault('ORDER_STREAM_HEARTBEAT', 15)
+    app.config.setdefault('ORDER_STREAM_TIMEOUT', 300)
+    app.extensions['order_events'] = EventBus(size=app.config['ORDER_EVENT_BUFFER'])
+
+def bus():
+    return current_app.extensions['order_events']
+
+def order_delta(order, kind):
+    """Event payload for an order: just enough to update a row or a badge"""
+    return {
+        'type': kind,
+        'order_id': order.id,
+        'user_id': order.user_id,
+        'status': order.status,
+        'payment_status': order.payment_status,
+        'total_price': order.total_price,
+        'item_count': order.item_count,
+        'customer_name': order.customer_name,
+        'created_at': order.created_at.isoformat() if order.created_at else None,
+    }
+
+def queue(*payloads):
+    """Publish payloads when the current transaction commits"""
+    db.session.info.setdefault('order_events', []).extend(payloads)
+
+def order_changed(order, kind):
+    queue(order_delta(order, kind))
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_queued(session):
+    payloads = session.info.pop('order_events', None)
+    if payloads and has_app_context() and 'order_events' in current_app.extensions:
+        bus().publish(payloads)
+
+@event.listens_for(db.session, 'after_rollback')
+def _drop_queued(session):
+    session.info.pop('order_events', None)
+
+def _format(event_id, payload):
+    return f'id: {event_id}\nevent: order\ndata: {json.dumps(payload)}\n\n'
+
+def stream(match=None):
+    """SSE response of order events accepted by `match`, resuming from Last-Event-ID"""
+    event_bus = bus()
+    heartbeat = current_app.config['ORDER_STREAM_HEARTBEAT']
+    timeout = current_app.config['ORDER_STREAM_TIMEOUT']
+    resume = request.headers.get('Last-Event-ID') or request.args.get('after')
+    try:
+        last_id = int(resume) if resume is not None else event_bus.last_id
+    except ValueError:
+        last_id = event_bus.last_id
+    # An id from before a restart would otherwise never be reached
+    last_id = min(last_id, event_bus.last_id)
+    # Nothing below touches the database; give the connection back to the pool
+    db.session.close()
+
+    def generate():
+        nonlocal last_id
+        deadline = time.monotonic() + timeout
+        yield 'retry: 3000\n\n'
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events = event_bus.wait(last_id, min(heartbeat, remaining))
+            if events is None:
+                # The client fell behind the buffer: it has to reload the page
+                last_id = event_bus.last_id
+                yield f'id: {last_id}\nevent: reset\ndata: {{}}\n\n'
+                continue
+            if not events:
+                yield ': keepalive\n\n'
+                continue
+            for event_id, payload in events:
+                last_id = event_id
+                if match is None or match(payload):
+                    yield _format(event_id, payload)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
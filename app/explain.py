@@ -0,0 +1,104 @@
+"""Query plans for the hot queries, to check that the indexes are used"""
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from app import db
+from app.models import BurgerIngredient, CartItem, Order, OrderItem
+from app.pagination import _seek
+
+PlanReport = namedtuple('PlanReport', 'name sql plan full_scan')
+
+PAGE_SIZE = 21  # per_page + 1, as fetched by keyset_paginate
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN wrapper that compiles and binds the statement like any other"""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = 'EXPLAIN QUERY PLAN ' if compiler.dialect.name == 'sqlite' else 'EXPLAIN '
+    return prefix + compiler.process(element.statement, **kw)
+
+def hot_queries():
+    """(name, statement) for the queries behind the busiest pages, with sample parameters"""
+    sample = db.session.execute(
+        select(Order.id, Order.user_id, Order.status, Order.created_at).order_by(Order.id.desc()).limit(1)
+    ).first()
+    order_id, user_id, status, created_at = sample or (1, 1, 'pending', None)
+    created_at = created_at or datetime.utcnow()
+    ingredient_id = db.session.execute(select(BurgerIngredient.ingredient_id).limit(1)).scalar() or 1
+    key = (created_at, order_id)
+    newest_first = (Order.created_at.desc(), Order.id.desc())
+
+    return [
+        ('customer.orders',
+         select(Order).where(Order.user_id == user_id).order_by(*newest_first).limit(PAGE_SIZE)),
+        ('customer.orders next page',
+         select(Order).where(Order.user_id == user_id, _seek(Order, key, 'next'))
+         .order_by(*newest_first).limit(PAGE_SIZE)),
+        ('admin.list_orders',
+         select(Order).order_by(*newest_first).limit(PAGE_SIZE)),
+        ('admin.list_orders next page',
+         select(Order).where(_seek(Order, key, 'next')).order_by(*newest_first).limit(PAGE_SIZE)),
+        ('admin.list_orders?status=',
+         select(Order).where(Order.status == status).order_by(*newest_first).limit(PAGE_SIZE)),
+        ('admin.list_orders?status= next page',
+         select(Order).where(Order.status == status, _seek(Order, key, 'next'))
+         .order_by(*newest_first).limit(PAGE_SIZE)),
+        ('order.items',
+         select(OrderItem).where(OrderItem.order_id == order_id)),
+        ('ingredient.burgers',
+         select(BurgerIngredient).where(BurgerIngredient.ingredient_id == ingredient_id)),
+        ('checkout idempotency lookup',
+         select(Order).where(Order.user_id == user_id, Order.idempotency_key == 'sample')),
+        ('cart lines',
+         select(CartItem.id, CartItem.burger_id, CartItem.quantity)
+         .where(CartItem.user_id == user_id).order_by(CartItem.id)),
+    ]
+
+def _bounded(statement):
+    """True when the statement stops after LIMIT rows from the start of its order"""
+    return statement._limit_clause is not None and statement._offset_clause is None
+
+def _is_full_scan(dialect, plan, bounded):
+    """True when the plan reads a whole table, or a whole index without a LIMIT to stop it.
+
+    Walking an index from one end is only cheap when LIMIT without OFFSET ends
+    the walk early; a deep OFFSET page walks as far as a table scan would.
+    """
+    if dialect == 'sqlite':
+        # "SCAN orders" reads the table and "SCAN orders USING INDEX ..." walks the
+        # index; only SEARCH reads a bounded range
+        return any(line.startswith('SCAN ') and (' USING ' not in line or not bounded) for line in plan)
+    if dialect == 'postgresql':
+        if any('Seq Scan' in line for line in plan):
+            return True
+        # An index scan without an Index Cond under it walks the whole index
+        nodes = '\n'.join(plan).split('->')
+        return not bounded and any('Index' in node and 'Scan' in node and 'Index Cond' not in node
+                                   for node in nodes)
+    # MySQL access types: ALL reads the table, index the whole index
+    line = ' '.join(plan)
+    return ' ALL ' in f' {line} ' or (not bounded and ' | index | ' in line)
+
+def explain(statement):
+    """Plan lines for a statement on the current database"""
+    rows = db.session.connection().execute(Explain(statement)).all()
+    if db.engine.dialect.name == 'sqlite':
+        return [row[-1] for row in rows]
+    return [' | '.join('' if value is None else str(value) for value in row) for row in rows]
+
+def check(name, statement):
+    """PlanReport for one statement"""
+    sql = str(statement.compile(dialect=db.engine.dialect))
+    plan = explain(statement)
+    return PlanReport(name, sql, plan, _is_full_scan(db.engine.dialect.name, plan, _bounded(statement)))
+
+def report():
+    """PlanReport for every hot query"""
+    return [check(name, statement) for name, statement in hot_queries()]
@@ -0,0 +1,158 @@
+"""Streaming order export.
+
+Orders are read joined to their customer and items through a server-side
+cursor (``yield_per``: a named cursor on PostgreSQL, an unbuffered one on
+MySQL) and written out in fixed-size chunks. Only one batch of rows and one
+chunk of output exist at a time, so memory stays flat however many orders
+are exported. Rows come in ``(created_at, id)`` order, the order of the
+``ix_orders_created`` and ``ix_orders_status_created`` indexes.
+
+CSV has one line per order item, repeating the order columns; JSON Lines has
+one object per order with its items nested. Either can be gzip-compressed as
+it streams. Text typed in by users starts with a quote in CSV when it would
+otherwise be read as a spreadsheet formula.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app import db
+from app.models import Burger, Order, OrderItem, User
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+CSV_COLUMNS = [
+    'order_id', 'created_at', 'status', 'payment_status', 'total_price',
+    'customer_id', 'customer_name', 'customer_email',
+    'burger_id', 'burger_name', 'quantity', 'unit_price', 'line_total',
+]
+
+# Leading characters that make spreadsheets evaluate a cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+CHUNK_SIZE = 64 * 1024  # bytes of output per yielded chunk
+BATCH_SIZE = 1000  # rows fetched from the cursor at a time
+
+def parse_bound(value, end=False):
+    """Datetime for a ``YYYY-MM-DD[THH:MM[:SS]]`` bound; a bare end date includes that day"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+def export_query(start=None, end=None, status=None):
+    """Orders with their customer and items, one row per item, from `start` up to `end`"""
+    query = (select(Order.id, Order.created_at, Order.status, Order.payment_status, Order.total_price,
+                    User.id.label('customer_id'), User.full_name, User.email,
+                    OrderItem.burger_id, Burger.name.label('burger_name'),
+                    OrderItem.quantity, OrderItem.price_at_order)
+             .join(User, User.id == Order.user_id)
+             .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+             .outerjoin(Burger, Burger.id == OrderItem.burger_id)
+             .order_by(Order.created_at, Order.id, OrderItem.id))
+    if start is not None:
+        query = query.where(Order.created_at >= start)
+    if end is not None:
+        query = query.where(Order.created_at < end)
+    if status:
+        query = query.where(Order.status == status)
+    return query
+
+def iter_rows(start=None, end=None, status=None, batch_size=BATCH_SIZE):
+    return db.session.execute(export_query(start, end, status).execution_options(yield_per=batch_size))
+
+def _timestamp(value):
+    return value.isoformat() if value else None
+
+def _text(value):
+    """User-entered text as a CSV cell that spreadsheets show rather than evaluate"""
+    if value and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value or ''
+
+def csv_chunks(rows, chunk_size=CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        has_item = row.burger_id is not None
+        writer.writerow([
+            row.id, _timestamp(row.created_at), row.status, row.payment_status, f'{row.total_price:.2f}',
+            row.customer_id, _text(row.full_name), _text(row.email),
+            row.burger_id if has_item else '', _text(row.burger_name),
+            row.quantity if has_item else '',
+            f'{row.price_at_order:.2f}' if has_item else '',
+            f'{row.price_at_order * row.quantity:.2f}' if has_item else '',
+        ])
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+def _order_record(row):
+    return {
+        'order_id': row.id,
+        'created_at': _timestamp(row.created_at),
+        'status': row.status,
+        'payment_status': row.payment_status,
+        'total_price': row.total_price,
+        'customer': {'id': row.customer_id, 'name': row.full_name, 'email': row.email},
+        'items': [],
+    }
+
+def jsonl_chunks(rows, chunk_size=CHUNK_SIZE):
+    parts, size = [], 0
+    record = None
+
+    def emit(record):
+        nonlocal size
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        parts.append(line)
+        size += len(line)
+
+    # Rows of one order are adjacent, so only the current order is held
+    for row in rows:
+        if record is None or record['order_id'] != row.id:
+            if record is not None:
+                emit(record)
+            record = _order_record(row)
+        if row.burger_id is not None:
+            record['items'].append({'burger_id': row.burger_id, 'burger_name': row.burger_name,
+                                    'quantity': row.quantity, 'unit_price': row.price_at_order})
+        if size >= chunk_size:
+            yield ''.join(parts).encode()
+            parts, size = [], 0
+    if record is not None:
+        emit(record)
+    if parts:
+        yield ''.join(parts).encode()
+
+def gzip_chunks(chunks):
+    """Compress a byte stream as one gzip member"""
+    compressor = zlib.compressobj(wbits=31)  # 16 + 15: gzip header and trailer
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def generate(fmt, start=None, end=None, status=None, compress=False,
+             chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE):
+    """Byte chunks of the export in `fmt` ('csv' or 'jsonl')"""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown export format: {fmt}')
+    rows = iter_rows(start, end, status, batch_size=batch_size)
+    chunks = (csv_chunks if fmt == 'csv' else jsonl_chunks)(rows, chunk_size)
+    return gzip_chunks(chunks) if compress else chunks
+
+def filename(fmt, compress=False):
+    return f'orders-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}' + ('.gz' if compress else '')
@@ -0,0 +1,136 @@
+"""Per-process cache of the users loaded by Flask-Login on every request.
+
+A commit that changes a user drops its entry in this process at once. Other
+processes learn of it through the shared ``users`` CacheVersion, which each
+one reads at most every USER_CACHE_CHECK_INTERVAL seconds; when it has moved
+the whole cache is dropped. A deactivated or demoted user is therefore served
+from another worker's cache for at most that interval, not the full TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+from app import db
+from app.models import CacheVersion, User
+
+USERS_VERSION = 'users'
+
+class UserCache:
+    """Bounded LRU of user column values with a time-to-live"""
+
+    def __init__(self, max_size=1024, ttl=60, check_interval=1):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.version = None
+        self._checked_at = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                if entry is not None:
+                    del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id, values):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def version_due(self):
+        return self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval
+
+    def sync(self, version):
+        """Drop every entry when the shared version moved since the last check"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+        }
+
+_COLUMNS = [column.key for column in inspect(User).column_attrs]
+
+def init_app(app):
+    app.config.setdefault('USER_CACHE_SIZE', 1024)
+    app.config.setdefault('USER_CACHE_TTL', 60)
+    app.config.setdefault('USER_CACHE_CHECK_INTERVAL', 1)
+    app.extensions['user_cache'] = UserCache(max_size=app.config['USER_CACHE_SIZE'],
+                                             ttl=app.config['USER_CACHE_TTL'],
+                                             check_interval=app.config['USER_CACHE_CHECK_INTERVAL'])
+
+def user_cache():
+    return current_app.extensions['user_cache']
+
+def load_user(user_id):
+    """User for Flask-Login, attached to the session without a query on a cache hit"""
+    cache = user_cache()
+    if cache.version_due():
+        cache.sync(CacheVersion.get(USERS_VERSION))
+    values = cache.get(user_id)
+    if values is not None:
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    user = db.session.get(User, user_id)
+    if user is not None:
+        cache.put(user_id, {key: getattr(user, key) for key in _COLUMNS})
+    return user
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _remember_changed_user(mapper, connection, target):
+    session = inspect(target).session
+    if session is not None:
+        session.info.setdefault('changed_user_ids', set()).add(target.id)
+
+@event.listens_for(db.session, 'before_flush')
+def _bump_users_version(session, flush_context, instances):
+    # Committed together with the change, so other processes never miss it
+    if (any(isinstance(target, User) for target in session.deleted)
+            or any(isinstance(target, User) and session.is_modified(target) for target in session.dirty)):
+        CacheVersion.bump(USERS_VERSION)
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_changed_users(session):
+    changed = session.info.pop('changed_user_ids', None)
+    if changed and has_app_context() and 'user_cache' in current_app.extensions:
+        cache = user_cache()
+        for user_id in changed:
+            cache.invalidate(user_id)
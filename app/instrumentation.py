@@ -0,0 +1,161 @@
+"""Per-request SQL statement counting and N+1 detection"""
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import current_app, request
+from sqlalchemy import event
+
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+
+_local = threading.local()
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in testing when an endpoint runs more statements than its budget"""
+
+class QueryStats:
+    """Statements seen while a collector is active"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.total_time += duration
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold):
+        """Statement shapes executed at least `threshold` times"""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+def statement_shape(statement):
+    """Normalize a statement so repeats with different parameters compare equal"""
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _STRING.sub('?', shape)
+    shape = _NUMBER.sub('?', shape)
+    return _IN_LIST.sub('(?...)', shape)
+
+def _collectors():
+    if not hasattr(_local, 'collectors'):
+        _local.collectors = []
+    return _local.collectors
+
+@contextmanager
+def count_queries():
+    """Collect every statement executed on this thread inside the block"""
+    stats = QueryStats()
+    _collectors().append(stats)
+    try:
+        yield stats
+    finally:
+        _collectors().remove(stats)
+
+@contextmanager
+def assert_max_queries(limit):
+    """Fail when the block executes more than `limit` statements"""
+    with count_queries() as stats:
+        yield stats
+    if stats.count > limit:
+        raise QueryBudgetExceeded(f'{stats.count} queries executed, budget is {limit}')
+
+def query_budget(limit):
+    """Declare the maximum number of statements a view may execute"""
+    def decorator(f):
+        f.query_budget = limit
+        return f
+    return decorator
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_start'].pop()
+    duration = time.perf_counter() - started
+    for stats in _collectors():
+        stats.record(statement, duration)
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute; drop its start time
+    # so it does not pile up on the pooled connection
+    conn = context.connection
+    if conn is None or not conn.info.get('query_start'):
+        return
+    duration = time.perf_counter() - conn.info['query_start'].pop()
+    for stats in _collectors():
+        stats.record(context.statement, duration)
+
+class SQLInstrumentation:
+    """Flask extension wiring statement counters into the request cycle"""
+
+    def __init__(self, app=None, db=None):
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('SQL_INSTRUMENTATION', True)
+        app.config.setdefault('SQL_N_PLUS_ONE_THRESHOLD', 5)
+        app.config.setdefault('SQL_ENFORCE_QUERY_BUDGETS', app.config.get('TESTING', False))
+        app.extensions['sql_instrumentation'] = self
+
+        if not app.config['SQL_INSTRUMENTATION']:
+            return
+
+        with app.app_context():
+            for engine in db.engines.values():
+                self.instrument_engine(engine)
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._teardown_request)
+
+    def instrument_engine(self, engine):
+        """Attach the timing listeners to an engine"""
+        if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(engine, 'handle_error', _handle_error)
+
+    def _start_request(self):
+        stats = QueryStats()
+        _collectors().append(stats)
+        request.environ['sql_stats'] = stats
+
+    def _finish_request(self, response):
+        stats = request.environ.get('sql_stats')
+        if stats is None:
+            return response
+
+        elapsed_ms = stats.total_time * 1000
+        response.headers['X-Query-Count'] = str(stats.count)
+        response.headers['X-Query-Time-Ms'] = f'{elapsed_ms:.2f}'
+        response.headers['Server-Timing'] = f'db;desc="{stats.count} queries";dur={elapsed_ms:.2f}'
+        current_app.logger.info('%s %s: %d queries in %.2f ms',
+                                request.method, request.path, stats.count, elapsed_ms)
+
+        threshold = current_app.config['SQL_N_PLUS_ONE_THRESHOLD']
+        for shape, repeats in stats.repeated(threshold):
+            current_app.logger.warning('Possible N+1 on %s: statement ran %d times: %s',
+                                       request.endpoint, repeats, shape)
+
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+        if budget is not None and stats.count > budget:
+            message = f'{request.endpoint} executed {stats.count} queries, budget is {budget}'
+            if current_app.config['SQL_ENFORCE_QUERY_BUDGETS']:
+                raise QueryBudgetExceeded(message)
+            current_app.logger.warning(message)
+
+        return response
+
+    def _teardown_request(self, exc=None):
+        stats = request.environ.pop('sql_stats', None)
+        if stats is not None and stats in _collectors():
+            _collectors().remove(stats)
+
+sql_instrumentation = SQLInstrumentation()
@@ -0,0 +1,171 @@
+"""Versioned schema migrations.
+
+``db.create_all()`` creates missing tables but never alters existing ones, so
+each change to an existing table is a numbered migration here. Migrations run
+in autocommit mode and every step checks the live schema first: on a fresh
+database ``create_all`` has already built everything and the steps are no-ops,
+and a migration interrupted half way simply finishes on the next run. Applied
+versions are recorded in ``schema_migrations``. Data a new table derives from
+existing rows is filled in by a migration too, so an upgraded database reads
+the same as a fresh one.
+
+Indexes are built online where the database supports it: ``CONCURRENTLY`` on
+PostgreSQL and ``ALGORITHM=INPLACE, LOCK=NONE`` on MySQL. A concurrent build
+that fails on PostgreSQL leaves an INVALID index under the same name behind;
+the next run drops and rebuilds it rather than taking it as done.
+"""
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import func, inspect, insert, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app import db, rollups
+from app.availability import refresh_burger_availability
+from app.catalog import MENU_VERSION
+from app.models import (Burger, BurgerIngredient, CacheVersion, Ingredient, Order, OrderItem, OrderStatusCount,
+                        SchemaMigration)
+
+Migration = namedtuple('Migration', 'version name upgrade')
+
+MIGRATIONS = []
+
+def migration(version, name):
+    """Register an upgrade function as schema version `version`"""
+    def register(upgrade):
+        if any(existing.version == version for existing in MIGRATIONS):
+            raise ValueError(f'Duplicate migration version {version}')
+        MIGRATIONS.append(Migration(version, name, upgrade))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return upgrade
+    return register
+
+def add_column(connection, column, server_default=None):
+    """Add a model column to its existing table unless it is already there"""
+    table = column.table.name
+    existing = {c['name'] for c in inspect(connection).get_columns(table)}
+    if column.name in existing:
+        return False
+    ddl = f'ALTER TABLE {table} ADD COLUMN {column.name} {column.type.compile(dialect=connection.dialect)}'
+    if server_default is not None:
+        ddl += f' DEFAULT {server_default}'
+        if not column.nullable:
+            ddl += ' NOT NULL'
+    connection.exec_driver_sql(ddl)
+    return True
+
+def _invalid_index(connection, name):
+    """True when a failed CREATE INDEX CONCURRENTLY left `name` behind unusable"""
+    if connection.dialect.name != 'postgresql':
+        return False
+    return bool(connection.execute(
+        text('SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)'),
+        {'name': name}).scalar())
+
+def create_index(connection, model, name):
+    """Build the index `name` declared on `model` unless it already exists"""
+    table = model.__table__
+    index = next((i for i in table.indexes if i.name == name), None)
+    if index is not None:
+        columns, unique = index.columns, index.unique
+    else:
+        # Unique constraints are added to existing tables as unique indexes
+        constraint = next(c for c in table.constraints if c.name == name)
+        columns, unique = constraint.columns, True
+
+    inspector = inspect(connection)
+    existing = {i['name'] for i in inspector.get_indexes(table.name)}
+    existing.update(c['name'] for c in inspector.get_unique_constraints(table.name))
+    dialect = connection.dialect.name
+    if name in existing:
+        if not _invalid_index(connection, name):
+            return False
+        connection.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+    columns = ', '.join(column.name for column in columns)
+    online = ' CONCURRENTLY' if dialect == 'postgresql' else ''
+    ddl = f'CREATE {"UNIQUE " if unique else ""}INDEX{online} {name} ON {table.name} ({columns})'
+    if dialect in ('mysql', 'mariadb'):
+        ddl += ' ALGORITHM=INPLACE LOCK=NONE'
+    connection.exec_driver_sql(ddl)
+    return True
+
+@migration(1, 'order summaries, idempotency keys and burger ingredient availability')
+def _order_summary_columns(connection):
+    add_column(connection, Order.__table__.c.customer_name)
+    add_column(connection, Order.__table__.c.item_count, server_default='0')
+    add_column(connection, Order.__table__.c.idempotency_key)
+    create_index(connection, Order, 'uq_order_idempotency_key')
+    true = '1' if connection.dialect.name == 'sqlite' else 'TRUE'
+    add_column(connection, Burger.__table__.c.ingredients_available, server_default=true)
+
+@migration(2, 'indexes for order lists and relationship loads')
+def _hot_query_indexes(connection):
+    create_index(connection, Order, 'ix_orders_user_created')
+    create_index(connection, Order, 'ix_orders_status_created')
+    create_index(connection, Order, 'ix_orders_created')
+    create_index(connection, OrderItem, 'ix_order_items_order_id')
+    create_index(connection, BurgerIngredient, 'ix_burger_ingredients_ingredient_id')
+
+@migration(3, 'unique provider payment ids')
+def _payment_id_index(connection):
+    create_index(connection, Order, 'ix_orders_stripe_payment_id')
+
+@migration(4, 'ingredient stock quantities')
+def _ingredient_stock(connection):
+    add_column(connection, Ingredient.__table__.c.stock_quantity)
+
+@migration(5, 'backfill order rollups')
+def _backfill_rollups(connection):
+    # create_all adds the rollup tables empty to a database that already has orders
+    orders = connection.execute(select(func.count()).select_from(Order)).scalar()
+    tallied = connection.execute(select(func.coalesce(func.sum(OrderStatusCount.count), 0))).scalar()
+    if orders != tallied:
+        with Session(bind=connection) as session:
+            rollups.rebuild(session)
+
+@migration(6, 'backfill order summaries and burger availability')
+def _backfill_summaries(connection):
+    # Migration 1 adds these columns with placeholder defaults on existing rows
+    add_column(connection, CacheVersion.__table__.c.changed_at)  # written by bump(); see migration 7
+    with Session(bind=connection) as session:
+        Order.backfill_summaries(session)
+        if refresh_burger_availability(session=session):
+            CacheVersion.bump(MENU_VERSION, session)
+        session.commit()
+
+@migration(7, 'cache version change times')
+def _cache_version_times(connection):
+    add_column(connection, CacheVersion.__table__.c.changed_at)
+
+def _applied():
+    """{version: applied_at} from schema_migrations, empty before it exists"""
+    if not inspect(db.engine).has_table(SchemaMigration.__tablename__):
+        return {}
+    return dict(db.session.execute(select(SchemaMigration.version, SchemaMigration.applied_at)).all())
+
+def status():
+    """(migration, applied_at or None) for every known migration"""
+    applied = _applied()
+    return [(m, applied.get(m.version)) for m in MIGRATIONS]
+
+def upgrade(log=None):
+    """Create missing tables and apply pending migrations; returns those applied"""
+    db.create_all(bind_key=None)  # the primary; replicas follow it
+    applied = _applied()
+    db.session.commit()
+
+    done = []
+    for m in MIGRATIONS:
+        if m.version in applied:
+            continue
+        if log:
+            log(f'Applying migration {m.version}: {m.name}')
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            m.upgrade(connection)
+            try:
+                connection.execute(insert(SchemaMigration).values(
+                    version=m.version, name=m.name, applied_at=datetime.utcnow()))
+            except IntegrityError:
+                pass  # another process finished the same migration first
+        done.append(m)
+    return done
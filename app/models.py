@@ -1,7 +1,8 @@
 from datetime import datetime
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.exc import IntegrityError
 from app import db, login_manager
+from app.passwords import hash_password, verify_password, needs_rehash
 
 class User(UserMixin, db.Model):
     """User model for both customers and admins"""
@@ -22,18 +23,23 @@ class User(UserMixin, db.Model):
     
     def set_password(self, password):
         """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
         """Check password hash"""
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """True when the stored hash predates the configured method or cost"""
+        return needs_rehash(self.password_hash)
     
     def __repr__(self):
         return f'<User {self.username}>'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    from app.identity import load_user as load_cached_user
+    return load_cached_user(int(user_id))
 
 class Ingredient(db.Model):
     """Ingredient model"""
@@ -43,10 +49,12 @@ class Ingredient(db.Model):
     name = db.Column(db.String(80), unique=True, nullable=False)
     is_available = db.Column(db.Boolean, default=True)
     price = db.Column(db.Float, default=0.0)  # Price per unit
+    stock_quantity = db.Column(db.Float)  # Units on hand; NULL when stock is not tracked
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     burger_ingredients = db.relationship('BurgerIngredient', backref='ingredient', lazy=True, cascade='all, delete-orphan')
+    stock_movements = db.relationship('StockMovement', lazy=True, cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Ingredient {self.name}>'
@@ -60,6 +68,7 @@ class Burger(db.Model):
     description = db.Column(db.Text)
     price = db.Column(db.Float, nullable=False)
     is_available = db.Column(db.Boolean, default=True)
+    ingredients_available = db.Column(db.Boolean, default=True, nullable=False)  # False when any ingredient is missing
     image_url = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -68,6 +77,11 @@ class Burger(db.Model):
     order_items = db.relationship('OrderItem', backref='burger', lazy=True)
     cart_items = db.relationship('CartItem', backref='burger', lazy=True, cascade='all, delete-orphan')
     
+    @property
+    def is_orderable(self):
+        """Available and not missing any ingredient"""
+        return bool(self.is_available and self.ingredients_available)
+    
     def __repr__(self):
         return f'<Burger {self.name}>'
 
@@ -80,7 +94,10 @@ class BurgerIngredient(db.Model):
     ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredients.id'), nullable=False)
     quantity = db.Column(db.Float, default=1.0)
     
-    __table_args__ = (db.UniqueConstraint('burger_id', 'ingredient_id', name='uq_burger_ingredient'),)
+    __table_args__ = (
+        db.UniqueConstraint('burger_id', 'ingredient_id', name='uq_burger_ingredient'),
+        db.Index('ix_burger_ingredients_ingredient_id', 'ingredient_id'),
+    )
 
 class Order(db.Model):
     """Order model"""
@@ -90,14 +107,49 @@ class Order(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     total_price = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='pending')  # pending, confirmed, preparing, ready, delivered, cancelled
-    payment_status = db.Column(db.String(20), default='pending')  # pending, completed, failed
+    payment_status = db.Column(db.String(20), default='pending')  # pending, processing, completed, failed
     stripe_payment_id = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Denormalized summary for order lists, filled in at checkout
+    customer_name = db.Column(db.String(120))
+    item_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    # Client-supplied key that makes a retried checkout return the same order
+    idempotency_key = db.Column(db.String(64))
+    
     # Relationships
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
     
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'idempotency_key', name='uq_order_idempotency_key'),
+        # Newest-first lists per customer, per status and overall; id breaks created_at ties
+        db.Index('ix_orders_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_orders_status_created', 'status', 'created_at', 'id'),
+        db.Index('ix_orders_created', 'created_at', 'id'),
+        # Payment results arrive keyed on the provider's id
+        db.Index('ix_orders_stripe_payment_id', 'stripe_payment_id', unique=True),
+    )
+    
+    @classmethod
+    def backfill_summaries(cls, session=None):
+        """Fill summary columns for orders created before they existed"""
+        session = session or db.session
+        customer_name = (db.select(User.full_name)
+                         .where(User.id == cls.user_id)
+                         .scalar_subquery())
+        item_count = (db.select(db.func.count(OrderItem.id))
+                      .where(OrderItem.order_id == cls.id)
+                      .scalar_subquery())
+        result = session.execute(
+            db.update(cls)
+            .where(db.or_(cls.customer_name.is_(None), cls.item_count == 0))
+            .values(customer_name=customer_name, item_count=item_count)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+    
     def __repr__(self):
         return f'<Order {self.id}>'
 
@@ -111,9 +163,27 @@ class OrderItem(db.Model):
     quantity = db.Column(db.Integer, nullable=False)
     price_at_order = db.Column(db.Float, nullable=False)
     
+    __table_args__ = (db.Index('ix_order_items_order_id', 'order_id'),)
+    
     def __repr__(self):
         return f'<OrderItem {self.burger_id} x{self.quantity}>'
 
+class StockMovement(db.Model):
+    """Ledger entry for a change in an ingredient's stock"""
+    __tablename__ = 'stock_movements'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredients.id'), nullable=False)
+    change = db.Column(db.Float, nullable=False)  # negative when stock is used
+    reason = db.Column(db.String(20), nullable=False)  # order, restock, count
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_stock_movements_ingredient_created', 'ingredient_id', 'created_at'),)
+    
+    def __repr__(self):
+        return f'<StockMovement {self.ingredient_id} {self.change:+g}>'
+
 class CartItem(db.Model):
     """Shopping cart item"""
     __tablename__ = 'cart_items'
@@ -128,3 +198,91 @@ class CartItem(db.Model):
     
     def __repr__(self):
         return f'<CartItem user={self.user_id} burger={self.burger_id}>'
+
+
+class SalesRollup(db.Model):
+    """Pre-aggregated order count and revenue for one time bucket"""
+    __tablename__ = 'sales_rollups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # hour, day, total
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    order_count = db.Column(db.Integer, default=0, nullable=False)
+    paid_order_count = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Float, default=0.0, nullable=False)
+    
+    __table_args__ = (db.UniqueConstraint('granularity', 'bucket_start', name='uq_sales_rollup_bucket'),)
+    
+    def __repr__(self):
+        return f'<SalesRollup {self.granularity} {self.bucket_start}>'
+
+class OrderStatusCount(db.Model):
+    """Running number of orders per status"""
+    __tablename__ = 'order_status_counts'
+    
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<OrderStatusCount {self.status}={self.count}>'
+
+class IngredientDemand(db.Model):
+    """Running quantity of an ingredient needed by confirmed and preparing orders"""
+    __tablename__ = 'ingredient_demand'
+    
+    ingredient_id = db.Column(db.Integer, primary_key=True)
+    quantity = db.Column(db.Float, default=0.0, nullable=False)
+    
+    def __repr__(self):
+        return f'<IngredientDemand {self.ingredient_id}={self.quantity:g}>'
+
+class CacheVersion(db.Model):
+    """Version counter used to invalidate in-process caches across workers"""
+    __tablename__ = 'cache_versions'
+    
+    name = db.Column(db.String(40), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    changed_at = db.Column(db.DateTime)
+    
+    @classmethod
+    def get(cls, name):
+        """Current version number for a cache name"""
+        version = db.session.execute(db.select(cls.version).where(cls.name == name)).scalar()
+        return version or 0
+    
+    @classmethod
+    def get_with_time(cls, name):
+        """(version, changed_at) for a cache name; changed_at is None if never recorded"""
+        row = db.session.execute(db.select(cls.version, cls.changed_at).where(cls.name == name)).first()
+        return (row.version, row.changed_at) if row else (0, None)
+    
+    @classmethod
+    def bump(cls, name, session=None):
+        """Increment a cache version as part of the current transaction"""
+        session = session or db.session
+        now = datetime.utcnow()
+        result = session.execute(
+            db.update(cls).where(cls.name == name).values(version=cls.version + 1, changed_at=now)
+        )
+        if not result.rowcount:
+            try:
+                with session.begin_nested():
+                    session.execute(db.insert(cls).values(name=name, version=1, changed_at=now))
+            except IntegrityError:
+                session.execute(
+                    db.update(cls).where(cls.name == name).values(version=cls.version + 1, changed_at=now)
+                )
+    
+    def __repr__(self):
+        return f'<CacheVersion {self.name}={self.version}>'
+
+class SchemaMigration(db.Model):
+    """Schema migration applied to this database"""
+    __tablename__ = 'schema_migrations'
+    
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SchemaMigration {self.version} {self.name}>'
@@ -0,0 +1,92 @@
+"""Order status state machine.
+
+Orders only move along TRANSITIONS. Each change is one conditional UPDATE
+whose WHERE clause admits only the statuses allowed to move to the target, so
+a stale page or two admins racing can neither skip a step nor push an order
+backwards; the loser gets a conflict instead. ``transition`` moves any number
+of orders at once, reports the outcome per order and queues the feed updates
+as one batch, which the bus publishes with a single wake-up.
+"""
+from collections import Counter, namedtuple
+from datetime import datetime
+from types import SimpleNamespace
+from sqlalchemy import select, update
+from app import analytics, db, events, prep, rollups
+from app.catalog import menu_catalog
+from app.models import Order
+
+TRANSITIONS = {
+    'pending': ('confirmed', 'cancelled'),
+    'confirmed': ('preparing', 'cancelled'),
+    'preparing': ('ready', 'cancelled'),
+    'ready': ('delivered',),
+    'delivered': (),
+    'cancelled': (),
+}
+STATUSES = tuple(TRANSITIONS)
+
+UPDATED = 'updated'
+CONFLICT = 'conflict'
+NOT_FOUND = 'not_found'
+
+# status is where the order stands afterwards (None when it does not exist)
+TransitionResult = namedtuple('TransitionResult', 'order_id outcome status')
+
+# Everything events.order_delta reads, so the feed needs no extra queries
+_DELTA_COLUMNS = (Order.id, Order.user_id, Order.status, Order.payment_status, Order.total_price,
+                  Order.item_count, Order.customer_name, Order.created_at)
+
+def next_statuses(status):
+    """Statuses an order in `status` may move to"""
+    return TRANSITIONS.get(status, ())
+
+def sources(status):
+    """Statuses allowed to move to `status`"""
+    return tuple(source for source, targets in TRANSITIONS.items() if status in targets)
+
+def transition(order_ids, new_status):
+    """Move orders to `new_status` in one conditional UPDATE and commit.
+
+    Returns a TransitionResult per distinct id, in the order given.
+    """
+    if new_status not in TRANSITIONS:
+        raise ValueError(f'Unknown order status: {new_status}')
+    order_ids = list(dict.fromkeys(order_ids))
+    if not order_ids:
+        return []
+    allowed = sources(new_status)
+
+    # Current state for the rollups, the feed and the conflict report; locked
+    # where the database supports it so it matches what the UPDATE sees
+    rows = {row.id: row for row in db.session.execute(
+        select(*_DELTA_COLUMNS).where(Order.id.in_(order_ids)).with_for_update())}
+
+    statement = (update(Order)
+                 .where(Order.id.in_(order_ids), Order.status.in_(allowed))
+                 .values(status=new_status, updated_at=datetime.utcnow())
+                 .execution_options(synchronize_session=False))
+    if db.engine.dialect.update_returning:
+        moved = set(db.session.execute(statement.returning(Order.id)).scalars())
+    else:
+        db.session.execute(statement)
+        moved = {order_id for order_id, row in rows.items() if row.status in allowed}
+
+    rollups.record_status_moves(Counter(rows[order_id].status for order_id in moved), new_status)
+    prep.record_transitions(menu_catalog.current(),
+                            ((order_id, rows[order_id].status, new_status) for order_id in moved))
+    if new_status == 'cancelled':
+        analytics.lines_changed((rows[order_id].created_at, rows[order_id].status)
+                                for order_id in moved if rows[order_id].payment_status == 'completed')
+    events.queue(*(events.order_delta(SimpleNamespace(**{**rows[order_id]._mapping, 'status': new_status}), 'status')
+                   for order_id in order_ids if order_id in moved))
+    db.session.commit()
+
+    results = []
+    for order_id in order_ids:
+        if order_id in moved:
+            results.append(TransitionResult(order_id, UPDATED, new_status))
+        elif order_id in rows:
+            results.append(TransitionResult(order_id, CONFLICT, rows[order_id].status))
+        else:
+            results.append(TransitionResult(order_id, NOT_FOUND, None))
+    return results
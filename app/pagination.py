@@ -0,0 +1,191 @@
+"""Pagination helpers shared by the menu and order lists"""
+import time
+from datetime import datetime
+from math import ceil
+from flask import abort, current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import tuple_
+
+# Numbered page links jump with OFFSET, whose cost grows with the page number;
+# deeper pages are only reachable through the Previous/Next cursors
+MAX_JUMP_PAGE = 10
+
+class Page:
+    """Slice of results with the same interface as a Flask-SQLAlchemy pagination"""
+
+    def __init__(self, items, page, per_page, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+
+    @property
+    def pages(self):
+        if not self.total:
+            return 0
+        return ceil(self.total / self.per_page)
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+    def iter_pages(self, left_edge=2, left_current=2, right_current=4, right_edge=2):
+        """Page numbers for navigation, with None marking skipped ranges"""
+        pages_end = self.pages + 1
+        if pages_end == 1:
+            return
+
+        left_end = min(1 + left_edge, pages_end)
+        yield from range(1, left_end)
+        if left_end == pages_end:
+            return
+
+        mid_start = max(left_end, self.page - left_current)
+        mid_end = min(self.page + right_current + 1, pages_end)
+        if mid_start - left_end > 0:
+            yield None
+        yield from range(mid_start, mid_end)
+        if mid_end == pages_end:
+            return
+
+        right_start = max(mid_end, pages_end - right_edge)
+        if right_start - mid_end > 0:
+            yield None
+        yield from range(right_start, pages_end)
+
+class KeysetPage(Page):
+    """Page fetched by seeking on (created_at, id) instead of OFFSET"""
+
+    def __init__(self, items, page, per_page, total, has_prev, has_next, prev_cursor, next_cursor,
+                 max_jump=MAX_JUMP_PAGE):
+        super().__init__(items, page, per_page, total)
+        self.max_jump = max_jump
+        self._has_prev = has_prev
+        self._has_next = has_next
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+
+    @property
+    def pages(self):
+        # The total may be cached or approximate; never show fewer pages than we can reach
+        return max(super().pages, self.page + (1 if self._has_next else 0))
+
+    @property
+    def has_prev(self):
+        return self._has_prev
+
+    @property
+    def has_next(self):
+        return self._has_next
+
+    def iter_pages(self, *args, **kwargs):
+        """Page numbers for navigation, leaving out pages beyond the OFFSET jump limit"""
+        gap = False
+        for number in super().iter_pages(*args, **kwargs):
+            if number is None or (number > self.max_jump and number != self.page):
+                gap = True
+                continue
+            if gap:
+                yield None
+                gap = False
+            yield number
+        if gap:
+            yield None
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='keyset-cursor')
+
+def encode_cursor(direction, row, page):
+    """Opaque token pointing before or after a row"""
+    return _serializer().dumps([direction, row.created_at.isoformat(), row.id, page])
+
+def decode_cursor(token):
+    """Direction, (created_at, id) key and page number of a cursor token"""
+    try:
+        direction, created_at, row_id, page = _serializer().loads(token)
+        return direction, (datetime.fromisoformat(created_at), int(row_id)), int(page)
+    except (BadSignature, ValueError, TypeError):
+        abort(400)
+
+def _seek(model, key, direction):
+    # A row-value comparison is planned as a range on the (created_at, id) index;
+    # the equivalent OR of column comparisons makes SQLite walk the whole index
+    position = tuple_(model.created_at, model.id)
+    if direction == 'next':
+        return position < tuple_(*key)
+    return position > tuple_(*key)
+
+def keyset_paginate(query, model, per_page, cursor=None, page=1, total=None, max_jump=MAX_JUMP_PAGE):
+    """Newest-first page of `query`, seeking from a cursor when one is given.
+
+    Without a cursor, page 1 needs no offset; page numbers up to `max_jump`
+    fall back to a single OFFSET jump so numbered page links keep working.
+    `total` is only used for page navigation and may be cached or approximate.
+    """
+    newest_first = (model.created_at.desc(), model.id.desc())
+
+    if cursor:
+        direction, key, page = decode_cursor(cursor)
+        if direction == 'next':
+            rows = query.filter(_seek(model, key, 'next')).order_by(*newest_first).limit(per_page + 1).all()
+            has_prev, has_next = True, len(rows) > per_page
+            rows = rows[:per_page]
+        else:
+            rows = (query.filter(_seek(model, key, 'prev'))
+                    .order_by(model.created_at.asc(), model.id.asc())
+                    .limit(per_page + 1).all())
+            has_prev, has_next = len(rows) > per_page, True
+            rows = list(reversed(rows[:per_page]))
+    else:
+        if page < 1 or page > max_jump:
+            abort(404)
+        rows = query.order_by(*newest_first).offset((page - 1) * per_page).limit(per_page + 1).all()
+        has_prev, has_next = page > 1, len(rows) > per_page
+        rows = rows[:per_page]
+        if not rows and page != 1:
+            abort(404)
+
+    prev_cursor = encode_cursor('prev', rows[0], page - 1) if rows and has_prev else None
+    next_cursor = encode_cursor('next', rows[-1], page + 1) if rows and has_next else None
+    return KeysetPage(rows, page, per_page, total, has_prev, has_next, prev_cursor, next_cursor, max_jump)
+
+class CountCache:
+    """Short-lived cache of COUNT(*) results keyed by list and filter"""
+
+    def __init__(self, ttl=30, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+
+    def get(self, key, compute):
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+
+        value = compute()
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+        self._entries[key] = (value, now + self.ttl)
+        return value
+
+def cached_count(key, compute):
+    """Count for `key`, recomputed at most once per PAGINATION_COUNT_TTL seconds"""
+    cache = current_app.extensions.get('count_cache')
+    if cache is None:
+        cache = current_app.extensions['count_cache'] = CountCache(
+            ttl=current_app.config.get('PAGINATION_COUNT_TTL', 30)
+        )
+    return cache.get(key, compute)
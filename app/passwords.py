@@ -0,0 +1,91 @@
+"""Password hashing on a bounded worker pool.
+
+Key derivation is deliberately slow. Running it on a small dedicated pool with
+a queue-depth limit means a burst of logins fails fast with ``HashingBusy``
+instead of tying up every request thread while shop pages wait. Each queued
+hash holds a request thread until it is done, so workers plus queue depth must
+stay well below the server's request threads; a hash that outlasts the
+timeout is reported as ``HashingBusy`` as well.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full"""
+
+class PasswordHasher:
+    """Runs werkzeug hashing on a bounded executor"""
+
+    def __init__(self, method, salt_length=16, workers=4, queue_depth=4, timeout=10):
+        self.method = method
+        self.salt_length = salt_length
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self._method_prefix = None
+
+    def _run(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('Password hashing queue is full')
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HashingBusy('Password hashing timed out') from None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password,
+                         method=self.method, salt_length=self.salt_length)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when a stored hash was made with a different method or cost"""
+        if self._method_prefix is None:
+            # werkzeug expands defaults (e.g. 'pbkdf2' -> 'pbkdf2:sha256:600000')
+            self._method_prefix = self.hash('').split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._method_prefix
+
+def init_app(app):
+    app.config.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    app.config.setdefault('PASSWORD_HASH_SALT_LENGTH', 16)
+    app.config.setdefault('PASSWORD_HASH_WORKERS', 4)
+    app.config.setdefault('PASSWORD_HASH_QUEUE_DEPTH', 4)
+    app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+    app.extensions['password_hasher'] = PasswordHasher(
+        method=app.config['PASSWORD_HASH_METHOD'],
+        salt_length=app.config['PASSWORD_HASH_SALT_LENGTH'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        queue_depth=app.config['PASSWORD_HASH_QUEUE_DEPTH'],
+        timeout=app.config['PASSWORD_HASH_TIMEOUT'],
+    )
+
+def hasher():
+    """Hasher of the current app, or a synchronous default outside one"""
+    if has_app_context() and 'password_hasher' in current_app.extensions:
+        return current_app.extensions['password_hasher']
+    return None
+
+def hash_password(password):
+    active = hasher()
+    if active is None:
+        return generate_password_hash(password)
+    return active.hash(password)
+
+def verify_password(password_hash, password):
+    active = hasher()
+    if active is None:
+        return check_password_hash(password_hash, password)
+    return active.verify(password_hash, password)
+
+def needs_rehash(password_hash):
+    active = hasher()
+    return active is not None and active.needs_rehash(password_hash)
@@ -0,0 +1,309 @@
+"""Asynchronous payments.
+
+Submitting the payment form only claims the order (``payment_status`` moves to
+``processing``) and queues the charge on a small worker pool, so the customer
+gets the pending page at once and no request thread waits on the provider. The
+pending page follows the order's event stream and reloads when the result is in.
+
+Results are applied by ``apply_result``: the worker calls it when the provider
+answers synchronously, and the webhook calls it when the provider reports back
+later. It is keyed on ``stripe_payment_id`` and changes the order with one
+conditional UPDATE, so a result delivered twice (by both, or by a retried
+webhook) is applied exactly once.
+
+``FakeProvider`` stands in for Stripe offline, settling each charge itself after
+PAYMENT_FAKE_LATENCY seconds and failing PAYMENT_FAKE_FAILURE_RATE of them. Its
+webhook accepts unsigned bodies when no secret is set, so it is refused outside
+development and testing.
+``StripeProvider`` creates PaymentIntents whose outcome arrives by webhook.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import Blueprint, abort, current_app, jsonify, request
+from sqlalchemy import case, or_, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+from app import analytics, db, events, prep, rollups
+from app.catalog import menu_catalog
+from app.models import Order
+
+logger = logging.getLogger(__name__)
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+# outcome is SUCCEEDED, FAILED or None while the provider has yet to report back
+ChargeResult = namedtuple('ChargeResult', 'payment_id outcome')
+
+WEBHOOK_OUTCOMES = {
+    'payment_intent.succeeded': SUCCEEDED,
+    'payment_intent.payment_failed': FAILED,
+}
+
+payments_bp = Blueprint('payments', __name__, url_prefix='/payments')
+
+class PaymentsBusy(Exception):
+    """Raised when the payment queue is full"""
+
+class WebhookError(Exception):
+    """Raised for webhook bodies that fail verification or parsing"""
+
+class FakeProvider:
+    """Offline stand-in for Stripe with configurable latency and failure rate"""
+
+    def __init__(self, latency=1.0, failure_rate=0.0, webhook_secret=None, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.webhook_secret = webhook_secret
+        self._random = random.Random(seed)
+
+    def charge(self, amount, currency, order_id, idempotency_key):
+        if self.latency:
+            # Jitter of +/-50% so concurrent charges finish out of order
+            time.sleep(self.latency * (0.5 + self._random.random()))
+        failed = self._random.random() < self.failure_rate
+        return ChargeResult(f'pi_fake_{uuid.uuid4().hex[:24]}', FAILED if failed else SUCCEEDED)
+
+    def sign(self, payload):
+        return hmac.new(self.webhook_secret.encode(), payload, hashlib.sha256).hexdigest()
+
+    def parse_webhook(self, payload, headers):
+        """Event dict of a webhook body, checking Fake-Signature when a secret is set"""
+        if self.webhook_secret:
+            signature = headers.get('Fake-Signature', '')
+            if not hmac.compare_digest(signature, self.sign(payload)):
+                raise WebhookError('Bad signature')
+        try:
+            return json.loads(payload)
+        except ValueError as exc:
+            raise WebhookError('Malformed body') from exc
+
+class StripeProvider:
+    """Creates Stripe PaymentIntents; their outcome arrives through the webhook"""
+
+    def __init__(self, secret_key, webhook_secret=None):
+        import stripe
+        self._stripe = stripe
+        self._secret_key = secret_key
+        self.webhook_secret = webhook_secret
+
+    def charge(self, amount, currency, order_id, idempotency_key):
+        intent = self._stripe.PaymentIntent.create(
+            api_key=self._secret_key,
+            amount=amount,
+            currency=currency,
+            metadata={'order_id': order_id},
+            idempotency_key=idempotency_key,
+        )
+        return ChargeResult(intent.id, None)
+
+    def parse_webhook(self, payload, headers):
+        if not self.webhook_secret:
+            raise WebhookError('PAYMENT_WEBHOOK_SECRET is not configured')
+        try:
+            return self._stripe.Webhook.construct_event(
+                payload, headers.get('Stripe-Signature', ''), self.webhook_secret)
+        except (ValueError, self._stripe.error.SignatureVerificationError) as exc:
+            raise WebhookError(str(exc)) from exc
+
+class PaymentQueue:
+    """Runs charges on a bounded executor, or inline with no workers"""
+
+    def __init__(self, provider, workers=4, queue_depth=64, currency='usd'):
+        self.provider = provider
+        self.currency = currency
+        self._executor = None
+        if workers:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='payment')
+            self._slots = threading.BoundedSemaphore(workers + queue_depth)
+
+    def submit(self, app, order_id, amount, idempotency_key):
+        if self._executor is None:
+            self._charge(app, order_id, amount, idempotency_key)
+            return
+        if not self._slots.acquire(blocking=False):
+            raise PaymentsBusy('Payment queue is full')
+        try:
+            future = self._executor.submit(self._charge, app, order_id, amount, idempotency_key)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+    def _charge(self, app, order_id, amount, idempotency_key):
+        # A fresh app context means a session of the worker's own
+        with app.app_context():
+            try:
+                result = self.provider.charge(amount, self.currency, order_id, idempotency_key)
+            except Exception:
+                logger.exception('Charge for order %s failed', order_id)
+                result = ChargeResult(None, FAILED)
+            if result.outcome:
+                apply_result(result.payment_id, result.outcome, order_id)
+            elif result.payment_id:
+                # Remember the provider's id so its webhook finds the order
+                db.session.execute(
+                    update(Order)
+                    .where(Order.id == order_id, Order.payment_status == 'processing')
+                    .values(stripe_payment_id=result.payment_id)
+                    .execution_options(synchronize_session=False))
+                db.session.commit()
+
+def init_app(app):
+    app.config.setdefault('PAYMENT_PROVIDER', 'fake')
+    app.config.setdefault('PAYMENT_CURRENCY', 'usd')
+    app.config.setdefault('PAYMENT_WORKERS', 4)
+    app.config.setdefault('PAYMENT_QUEUE_DEPTH', 64)
+    app.config.setdefault('PAYMENT_STALE_AFTER', 600)
+    app.config.setdefault('PAYMENT_FAKE_LATENCY', 1.0)
+    app.config.setdefault('PAYMENT_FAKE_FAILURE_RATE', 0.0)
+    app.config.setdefault('PAYMENT_WEBHOOK_SECRET', None)
+    if app.config['PAYMENT_PROVIDER'] == 'stripe':
+        provider = StripeProvider(app.config['STRIPE_SECRET_KEY'],
+                                  webhook_secret=app.config['PAYMENT_WEBHOOK_SECRET'])
+    else:
+        if not (app.debug or app.testing):
+            raise RuntimeError('PAYMENT_PROVIDER "fake" is only for development and testing')
+        provider = FakeProvider(latency=app.config['PAYMENT_FAKE_LATENCY'],
+                                failure_rate=app.config['PAYMENT_FAKE_FAILURE_RATE'],
+                                webhook_secret=app.config['PAYMENT_WEBHOOK_SECRET'])
+    app.extensions['payments'] = PaymentQueue(
+        provider,
+        workers=app.config['PAYMENT_WORKERS'],
+        queue_depth=app.config['PAYMENT_QUEUE_DEPTH'],
+        currency=app.config['PAYMENT_CURRENCY'],
+    )
+
+def payment_queue():
+    return current_app.extensions['payments']
+
+def _claimable():
+    """Orders a new payment attempt may start on"""
+    stale = datetime.utcnow() - timedelta(seconds=current_app.config['PAYMENT_STALE_AFTER'])
+    return (Order.status != 'cancelled') & or_(Order.payment_status.in_(('pending', 'failed')),
+                                               (Order.payment_status == 'processing') & (Order.updated_at < stale))
+
+def is_stale(order):
+    """True when a processing payment has waited too long for its result"""
+    stale = datetime.utcnow() - timedelta(seconds=current_app.config['PAYMENT_STALE_AFTER'])
+    return order.payment_status == 'processing' and order.updated_at is not None and order.updated_at < stale
+
+def start(order):
+    """Claim `order` for payment and queue its charge.
+
+    Returns False when the order is cancelled, already paid or a charge is under way.
+    Raises PaymentsBusy, with the claim released, when the queue is full.
+    """
+    order_id, amount = order.id, round(order.total_price * 100)
+    claimed = db.session.execute(
+        update(Order)
+        .where(Order.id == order_id, _claimable())
+        .values(payment_status='processing', stripe_payment_id=None, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)).rowcount
+    if not claimed:
+        db.session.rollback()
+        return False
+    db.session.commit()
+
+    try:
+        payment_queue().submit(current_app._get_current_object(), order_id, amount,
+                               f'order-{order_id}-{uuid.uuid4().hex}')
+    except PaymentsBusy:
+        db.session.execute(
+            update(Order)
+            .where(Order.id == order_id, Order.payment_status == 'processing')
+            .values(payment_status='pending', updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False))
+        db.session.commit()
+        raise
+    return True
+
+def apply_result(payment_id, outcome, order_id, in_flight_only=False):
+    """Apply a charge outcome to its order once; True when the order changed.
+
+    With `in_flight_only`, the order must have a charge under way that no other
+    payment id has been recorded for, as when it was found by the order id the
+    webhook sender put in the metadata rather than by its payment id.
+    """
+    order = db.session.get(Order, order_id)
+    if order is None:
+        return False
+
+    previous_status = order.status
+    now = datetime.utcnow()
+    in_flight = (Order.payment_status == 'processing',
+                 or_(Order.stripe_payment_id.is_(None), Order.stripe_payment_id == payment_id))
+    if outcome == SUCCEEDED:
+        status = 'confirmed' if previous_status == 'pending' else previous_status
+        statement = (update(Order)
+                     .where(Order.id == order.id, Order.payment_status != 'completed',
+                            *(in_flight if in_flight_only else ()))
+                     .values(payment_status='completed',
+                             stripe_payment_id=payment_id,
+                             status=case((Order.status == 'pending', 'confirmed'), else_=Order.status),
+                             updated_at=now))
+    else:
+        status = previous_status
+        # A failure only counts for the attempt in flight, not a superseded one
+        statement = (update(Order)
+                     .where(Order.id == order.id, *in_flight)
+                     .values(payment_status='failed', stripe_payment_id=payment_id, updated_at=now))
+    changed = db.session.execute(statement.execution_options(synchronize_session=False)).rowcount
+    if not changed:
+        db.session.rollback()
+        return False
+
+    # Mirror the UPDATE on the loaded order instead of reading it back
+    payment_status = 'completed' if outcome == SUCCEEDED else 'failed'
+    for key, value in (('payment_status', payment_status), ('status', status),
+                       ('stripe_payment_id', payment_id), ('updated_at', now)):
+        set_committed_value(order, key, value)
+    if outcome == SUCCEEDED:
+        rollups.record_payment_completed(order)
+        rollups.record_status_change(previous_status, status)
+        prep.record_transitions(menu_catalog.current(), [(order.id, previous_status, status)])
+        analytics.lines_changed([(order.created_at, previous_status)])
+        events.order_changed(order, 'paid')
+    else:
+        events.order_changed(order, 'payment_failed')
+    db.session.commit()
+    return True
+
+@payments_bp.route('/webhook', methods=['POST'])
+def webhook():
+    """Payment results reported by the provider, keyed on its payment id"""
+    provider = payment_queue().provider
+    try:
+        event = provider.parse_webhook(request.get_data(), request.headers)
+    except WebhookError:
+        abort(400)
+
+    outcome = WEBHOOK_OUTCOMES.get(event.get('type'))
+    if outcome is None:
+        # Acknowledge event types we do not handle so the provider stops retrying
+        return jsonify(received=True, applied=False)
+    intent = event.get('data', {}).get('object', {})
+    if not intent.get('id'):
+        abort(400)
+
+    order_id = db.session.execute(
+        select(Order.id).where(Order.stripe_payment_id == intent['id'])).scalar()
+    by_metadata = order_id is None
+    if by_metadata:
+        # The webhook can beat the worker to recording the payment id, but the
+        # metadata only vouches for an order whose charge is still unidentified
+        order_id = (intent.get('metadata') or {}).get('order_id')
+        try:
+            order_id = int(order_id) if order_id is not None else None
+        except ValueError:
+            abort(400)
+    applied = order_id is not None and apply_result(intent['id'], outcome, order_id, in_flight_only=by_metadata)
+    return jsonify(received=True, applied=applied)
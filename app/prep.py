@@ -0,0 +1,122 @@
+"""Kitchen prep forecast.
+
+``ingredient_demand`` holds, per ingredient, what the open orders (confirmed
+or preparing) still need. It is maintained like the rollups: every code path
+that moves orders into or out of the open statuses calls
+``record_transitions`` in the same transaction, which reads the moved orders'
+lines once and expands them through the menu snapshot's burger x ingredient
+matrix into one signed delta per ingredient. Editing a recipe changes what
+open orders need, so those paths call ``rebuild`` instead.
+
+The next-hour forecast scales the burgers ordered during the last
+PREP_FORECAST_WINDOW seconds to an hour and expands them the same way. The
+admin page reads the running demand, the stock and the recent burger counts
+in a fixed number of queries however many orders are open.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import BurgerIngredient, Ingredient, IngredientDemand, Order, OrderItem
+
+OPEN_STATUSES = ('confirmed', 'preparing')
+
+PrepLine = namedtuple('PrepLine', 'ingredient_id name open forecast stock')
+
+def _is_open(status):
+    return status in OPEN_STATUSES
+
+def record_transitions(snapshot, changes):
+    """Account for orders changing status, given as (order id, old status, new status)"""
+    signs = {}
+    for order_id, old_status, new_status in changes:
+        sign = _is_open(new_status) - _is_open(old_status)
+        if sign:
+            signs[order_id] = sign
+    if not signs:
+        return
+
+    burgers = {}
+    for order_id, burger_id, quantity in db.session.execute(
+            select(OrderItem.order_id, OrderItem.burger_id, OrderItem.quantity)
+            .where(OrderItem.order_id.in_(signs))):
+        burgers[burger_id] = burgers.get(burger_id, 0) + signs[order_id] * quantity
+    _add_demand(snapshot.expand(burgers))
+
+def _add_demand(deltas):
+    """Add signed quantities to the demand rows in one UPDATE, creating missing rows"""
+    deltas = {ingredient_id: delta for ingredient_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    ids = list(deltas)
+    statement = (update(IngredientDemand)
+                 .where(IngredientDemand.ingredient_id.in_(ids))
+                 .values(quantity=IngredientDemand.quantity + case(deltas, value=IngredientDemand.ingredient_id))
+                 .execution_options(synchronize_session=False))
+    if db.engine.dialect.update_returning:
+        existing = set(db.session.execute(statement.returning(IngredientDemand.ingredient_id)).scalars())
+    else:
+        existing = set(db.session.execute(
+            select(IngredientDemand.ingredient_id).where(IngredientDemand.ingredient_id.in_(ids))).scalars())
+        db.session.execute(statement)
+
+    missing = {ingredient_id: deltas[ingredient_id] for ingredient_id in ids if ingredient_id not in existing}
+    if not missing:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(IngredientDemand), [
+                {'ingredient_id': ingredient_id, 'quantity': delta} for ingredient_id, delta in missing.items()
+            ])
+    except IntegrityError:
+        # Another worker created some of the rows first; add on top of theirs
+        _add_demand(missing)
+
+def rebuild():
+    """Recompute the demand of open orders from their lines and the current recipes"""
+    rows = db.session.execute(
+        select(BurgerIngredient.ingredient_id,
+               func.sum(OrderItem.quantity * BurgerIngredient.quantity))
+        .join(OrderItem, OrderItem.burger_id == BurgerIngredient.burger_id)
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(Order.status.in_(OPEN_STATUSES))
+        .group_by(BurgerIngredient.ingredient_id)
+    ).all()
+    db.session.execute(IngredientDemand.__table__.delete())
+    if rows:
+        db.session.execute(insert(IngredientDemand),
+                           [{'ingredient_id': ingredient_id, 'quantity': quantity} for ingredient_id, quantity in rows])
+    return len(rows)
+
+def recent_burgers(since):
+    """{burger id: quantity} ordered since `since`, cancelled orders excluded"""
+    return dict(db.session.execute(
+        select(OrderItem.burger_id, func.sum(OrderItem.quantity))
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(Order.created_at >= since, Order.status != 'cancelled')
+        .group_by(OrderItem.burger_id)
+    ).all())
+
+def forecast(snapshot, now=None):
+    """PrepLines for every ingredient open orders need or the next hour is expected to need"""
+    window = current_app.config['PREP_FORECAST_WINDOW']
+    now = now or datetime.utcnow()
+    scale = 3600 / window
+    expected = snapshot.expand(recent_burgers(now - timedelta(seconds=window)))
+
+    lines = []
+    for ingredient_id, stock, open_quantity in db.session.execute(
+            select(Ingredient.id, Ingredient.stock_quantity, IngredientDemand.quantity)
+            .outerjoin(IngredientDemand, IngredientDemand.ingredient_id == Ingredient.id)):
+        ingredient = snapshot.ingredients.get(ingredient_id)
+        open_quantity = max(open_quantity or 0, 0)
+        next_hour = expected.get(ingredient_id, 0) * scale
+        if ingredient is not None and (open_quantity or next_hour):
+            lines.append(PrepLine(ingredient_id, ingredient.name, open_quantity, next_hour, stock))
+    lines.sort(key=lambda line: (-line.open, -line.forecast, line.name))
+    return lines
+
+def init_app(app):
+    app.config.setdefault('PREP_FORECAST_WINDOW', 1800)
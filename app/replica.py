@@ -0,0 +1,60 @@
+"""Read-replica routing.
+
+With a ``replica`` bind in SQLALCHEMY_BINDS, GET and HEAD requests to the
+customer and admin blueprints run their SELECTs on the replica. Flushes and
+DML always go to the primary, and once a request writes, the rest of that
+request reads from the primary too. A user who wrote keeps reading from the
+primary for REPLICA_READ_YOUR_WRITES seconds, so the order history after a
+checkout or the order list after a status change never shows replica lag.
+"""
+import time
+from flask import current_app, g, has_app_context, request, session
+from flask_sqlalchemy.session import Session
+
+REPLICA_BIND = 'replica'
+READ_METHODS = ('GET', 'HEAD')
+_PRIMARY_UNTIL = '_read_primary_until'
+
+class RoutingSession(Session):
+    """Session sending reads to the replica while the current request allows it"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            if self._flushing or getattr(clause, 'is_dml', False):
+                g.db_wrote = True
+                g.db_read_replica = False
+            elif g.get('db_read_replica') and getattr(clause, 'is_select', False):
+                return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def init_app(app, db):
+    app.config.setdefault('REPLICA_READ_YOUR_WRITES', 5)
+    app.config.setdefault('REPLICA_BLUEPRINTS', ('customer', 'admin'))
+    with app.app_context():
+        enabled = REPLICA_BIND in db.engines
+    app.extensions['replica'] = enabled
+    if enabled:
+        app.before_request(_choose_bind)
+        app.after_request(_remember_write)
+        app.teardown_request(_reset)
+
+def reading_from_replica():
+    """True while the current request's SELECTs go to the replica"""
+    return bool(g.get('db_read_replica'))
+
+def _choose_bind():
+    g.db_wrote = False
+    g.db_read_replica = (
+        request.method in READ_METHODS
+        and request.blueprint in current_app.config['REPLICA_BLUEPRINTS']
+        and session.get(_PRIMARY_UNTIL, 0) <= time.time()
+    )
+
+def _remember_write(response):
+    if g.get('db_wrote'):
+        session[_PRIMARY_UNTIL] = time.time() + current_app.config['REPLICA_READ_YOUR_WRITES']
+    return response
+
+def _reset(exc=None):
+    g.pop('db_read_replica', None)
+    g.pop('db_wrote', None)
@@ -0,0 +1,176 @@
+"""Incrementally maintained order and revenue rollups.
+
+The admin dashboard reads its counters from these summary tables instead of
+scanning ``orders``. Every code path that creates an order, completes a payment
+or changes an order status must call the matching ``record_*`` hook inside the
+same transaction so the rollups never drift from the orders table. Each hook
+writes every row it touches in one upsert per table (``ON CONFLICT DO UPDATE``
+or ``ON DUPLICATE KEY UPDATE``), so a new bucket costs no extra round trips.
+"""
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import func, insert, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Order, SalesRollup, OrderStatusCount
+
+GRANULARITIES = ('hour', 'day', 'total')
+TOTAL_BUCKET = datetime(1970, 1, 1)
+REBUILD_BATCH_SIZE = 5000
+
+def bucket_start(moment, granularity):
+    """Truncate a timestamp to the start of its bucket"""
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return TOTAL_BUCKET
+
+def _upsert(model, key_columns, rows):
+    """INSERT of `rows` that adds to existing rows on a key conflict, or None without dialect support"""
+    dialect = db.engine.dialect.name
+    deltas = [name for name in rows[0] if name not in key_columns]
+    if dialect in ('sqlite', 'postgresql'):
+        dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = dialect_insert(model).values(rows)
+        return statement.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={name: getattr(model, name) + getattr(statement.excluded, name) for name in deltas})
+    if dialect in ('mysql', 'mariadb'):
+        statement = mysql.insert(model).values(rows)
+        return statement.on_duplicate_key_update(
+            {name: getattr(model, name) + statement.inserted[name] for name in deltas})
+    return None
+
+def _increment(model, key_columns, rows):
+    """Add each row's deltas to the row with the same key, creating rows that are missing.
+
+    One upsert statement for all rows where the dialect has one; otherwise an
+    UPDATE per row, falling back to an INSERT when the row does not exist yet.
+    """
+    statement = _upsert(model, key_columns, rows)
+    if statement is not None:
+        db.session.execute(statement)
+        return
+
+    for row in rows:
+        conditions = [getattr(model, name) == row[name] for name in key_columns]
+        values = {name: getattr(model, name) + delta for name, delta in row.items() if name not in key_columns}
+        if db.session.execute(update(model).where(*conditions).values(**values)).rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(model).values(**row))
+        except IntegrityError:
+            # Another worker created the row first; add on top of theirs
+            db.session.execute(update(model).where(*conditions).values(**values))
+
+def _bump_sales(moment, order_count=0, paid_order_count=0, revenue=0.0):
+    # As in rebuild(), a legacy order without a timestamp only counts towards the totals
+    granularities = GRANULARITIES if moment is not None else ('total',)
+    _increment(SalesRollup, ['granularity', 'bucket_start'], [
+        {'granularity': granularity, 'bucket_start': bucket_start(moment, granularity),
+         'order_count': order_count, 'paid_order_count': paid_order_count, 'revenue': revenue}
+        for granularity in granularities
+    ])
+
+def _bump_statuses(deltas):
+    """Add {status: delta} to the status tallies"""
+    rows = [{'status': status, 'count': delta} for status, delta in deltas.items() if delta]
+    if rows:
+        _increment(OrderStatusCount, ['status'], rows)
+
+def record_order_created(order):
+    """Account for a newly created (flushed) order"""
+    _bump_sales(order.created_at or datetime.utcnow(), order_count=1)
+    _bump_statuses({order.status or 'pending': 1})
+
+def record_payment_completed(order):
+    """Account for an order whose payment just completed"""
+    _bump_sales(order.created_at, paid_order_count=1, revenue=order.total_price)
+
+def record_status_change(old_status, new_status, count=1):
+    """Move orders from one status tally to another"""
+    if old_status == new_status or not count:
+        return
+    _bump_statuses({old_status: -count, new_status: count})
+
+def record_status_moves(moves, new_status):
+    """Move orders tallied by old status ({status: count}) to one new status"""
+    deltas = {old_status: -count for old_status, count in moves.items() if old_status != new_status}
+    moved = -sum(deltas.values())
+    if moved:
+        deltas[new_status] = moved
+    _bump_statuses(deltas)
+
+def dashboard_totals():
+    """Constant-size aggregates for the admin dashboard"""
+    totals = SalesRollup.query.filter_by(granularity='total', bucket_start=TOTAL_BUCKET).first()
+    today = SalesRollup.query.filter_by(granularity='day',
+                                        bucket_start=bucket_start(datetime.utcnow(), 'day')).first()
+    status_counts = dict(db.session.query(OrderStatusCount.status, OrderStatusCount.count).all())
+
+    return {
+        'total_orders': totals.order_count if totals else 0,
+        'total_revenue': totals.revenue if totals else 0.0,
+        'pending_orders': status_counts.get('pending', 0),
+        'today_orders': today.order_count if today else 0,
+        'today_revenue': today.revenue if today else 0.0,
+        'status_counts': status_counts,
+    }
+
+def order_count(status=None):
+    """Number of orders, optionally in one status, from the rollups"""
+    if status:
+        row = db.session.get(OrderStatusCount, status)
+        return row.count if row else 0
+    totals = SalesRollup.query.filter_by(granularity='total', bucket_start=TOTAL_BUCKET).first()
+    return totals.order_count if totals else 0
+
+def revenue_series(granularity, since):
+    """Rollup rows of one granularity starting at or after `since`"""
+    return (SalesRollup.query
+            .filter(SalesRollup.granularity == granularity,
+                    SalesRollup.bucket_start >= bucket_start(since, granularity))
+            .order_by(SalesRollup.bucket_start)
+            .all())
+
+def rebuild(session=None):
+    """Recompute every rollup from the orders table, in `session` (default db.session)"""
+    session = session or db.session
+    buckets = defaultdict(lambda: [0, 0, 0.0])
+    rows = (session.query(Order.created_at, Order.total_price, Order.payment_status)
+            .execution_options(yield_per=REBUILD_BATCH_SIZE))
+
+    for created_at, total_price, payment_status in rows:
+        paid = payment_status == 'completed'
+        for granularity in GRANULARITIES:
+            if created_at is None and granularity != 'total':
+                continue  # legacy rows without a timestamp only count towards the totals
+            bucket = buckets[(granularity, bucket_start(created_at, granularity))]
+            bucket[0] += 1
+            if paid:
+                bucket[1] += 1
+                bucket[2] += total_price
+
+    status_counts = defaultdict(int)
+    for status, count in session.query(Order.status, func.count(Order.id)).group_by(Order.status):
+        status_counts[status or 'pending'] += count
+
+    session.execute(SalesRollup.__table__.delete())
+    session.execute(OrderStatusCount.__table__.delete())
+
+    sales_rows = [
+        {'granularity': granularity, 'bucket_start': start,
+         'order_count': counts[0], 'paid_order_count': counts[1], 'revenue': counts[2]}
+        for (granularity, start), counts in buckets.items()
+    ]
+    for offset in range(0, len(sales_rows), REBUILD_BATCH_SIZE):
+        session.execute(insert(SalesRollup), sales_rows[offset:offset + REBUILD_BATCH_SIZE])
+    if status_counts:
+        session.execute(insert(OrderStatusCount),
+                        [{'status': status, 'count': count} for status, count in status_counts.items()])
+
+    session.commit()
+    return len(sales_rows)
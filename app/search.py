@@ -0,0 +1,243 @@
+"""In-memory menu search.
+
+An inverted index maps every word of the burger names, descriptions and
+ingredient names to the ids of the burgers it appears in, one posting table
+per field, plus a sorted vocabulary so a query word matches every indexed
+word it is a prefix of ("chee" finds "cheese" and "cheeseburger"). Queries
+are answered from the index and the menu snapshot alone, without touching the
+database.
+
+The index follows the menu snapshot. When the menu version changes, only the
+burgers whose name, description or ingredient names differ from the previous
+snapshot are re-tokenized, and only their posting sets are replaced; the new
+index is swapped in whole, so readers never see a half-updated one.
+
+Queries are free text: every word must match (as a prefix) in some field,
+and burgers rank by where the words matched (name, then ingredients, then
+description). ``no bacon``, ``without bacon`` or ``-bacon`` leave out burgers
+with a matching ingredient, and ``under 10`` / ``over 8`` bound the price.
+"""
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import namedtuple
+from flask import current_app
+
+FIELDS = ('name', 'ingredients', 'description')
+FIELD_WEIGHTS = {'name': 3, 'ingredients': 2, 'description': 1}
+
+EXCLUDE_WORDS = ('no', 'without')
+MAX_PRICE_WORDS = ('under', 'below')
+MIN_PRICE_WORDS = ('over', 'above')
+
+_WORD = re.compile(r'\w+')
+
+SearchQuery = namedtuple('SearchQuery', 'terms exclude min_price max_price available_only')
+
+def tokenize(text):
+    """Lowercased words of `text` with accents stripped"""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return _WORD.findall(''.join(c for c in text if not unicodedata.combining(c)))
+
+def _price(word):
+    try:
+        return float(word.lstrip('$'))
+    except ValueError:
+        return None
+
+def parse(text, min_price=None, max_price=None, available_only=False):
+    """SearchQuery for free text plus explicit filters; explicit prices win over words"""
+    terms, exclude = [], []
+    words = (text or '').split()
+    i = 0
+    while i < len(words):
+        word = words[i].casefold()
+        following = words[i + 1] if i + 1 < len(words) else None
+        if word in EXCLUDE_WORDS and following:
+            exclude.extend(tokenize(following))
+            i += 2
+            continue
+        if word in MAX_PRICE_WORDS + MIN_PRICE_WORDS and following and _price(following) is not None:
+            if word in MAX_PRICE_WORDS:
+                max_price = _price(following) if max_price is None else max_price
+            else:
+                min_price = _price(following) if min_price is None else min_price
+            i += 2
+            continue
+        if word.startswith('-') and len(word) > 1:
+            exclude.extend(tokenize(word[1:]))
+        else:
+            terms.extend(tokenize(word))
+        i += 1
+    return SearchQuery(tuple(terms), tuple(exclude), min_price, max_price, bool(available_only))
+
+def is_empty(query):
+    return not (query.terms or query.exclude or query.available_only
+                or query.min_price is not None or query.max_price is not None)
+
+def _document_key(burger):
+    return (burger.name, burger.description, tuple(line.name for line in burger.ingredients))
+
+def _document(burger):
+    return {
+        'name': frozenset(tokenize(burger.name)),
+        'ingredients': frozenset(token for line in burger.ingredients for token in tokenize(line.name)),
+        'description': frozenset(tokenize(burger.description)),
+    }
+
+class MenuIndex:
+    """Immutable inverted index over one menu snapshot"""
+
+    def __init__(self, version=None, keys=None, documents=None, postings=None, vocabulary=(), reindexed=0):
+        self.version = version
+        self.reindexed = reindexed  # burgers (re)indexed or dropped to build this from the previous index
+        self.keys = keys or {}
+        self.documents = documents or {}
+        self.postings = postings or {field: {} for field in FIELDS}
+        self.vocabulary = vocabulary
+
+    def updated(self, snapshot):
+        """Index for `snapshot`, re-indexing only the burgers whose text changed"""
+        keys = {burger.id: _document_key(burger) for burger in snapshot.burgers}
+        changed = [burger for burger in snapshot.burgers if self.keys.get(burger.id) != keys[burger.id]]
+        removed = [burger_id for burger_id in self.keys if burger_id not in keys]
+
+        documents = dict(self.documents)
+        touched = {field: {} for field in FIELDS}  # field -> token -> (ids removed, ids added)
+        for burger_id in removed + [burger.id for burger in changed if burger.id in self.keys]:
+            for field, tokens in documents.pop(burger_id).items():
+                for token in tokens:
+                    touched[field].setdefault(token, (set(), set()))[0].add(burger_id)
+        for burger in changed:
+            documents[burger.id] = _document(burger)
+            for field, tokens in documents[burger.id].items():
+                for token in tokens:
+                    touched[field].setdefault(token, (set(), set()))[1].add(burger.id)
+
+        postings = {field: dict(self.postings[field]) for field in FIELDS}
+        vocabulary_changed = False
+        for field in FIELDS:
+            table = postings[field]
+            for token, (gone, added) in touched[field].items():
+                ids = (table.get(token, frozenset()) - gone) | added
+                if ids:
+                    vocabulary_changed |= token not in table
+                    table[token] = frozenset(ids)
+                elif token in table:
+                    del table[token]
+                    vocabulary_changed = True
+
+        vocabulary = self.vocabulary
+        if vocabulary_changed:
+            vocabulary = tuple(sorted(set().union(*postings.values())))
+        return MenuIndex(snapshot.version, keys, documents, postings, vocabulary, len(changed) + len(removed))
+
+    def expand(self, prefix):
+        """Indexed words starting with `prefix`"""
+        start = bisect_left(self.vocabulary, prefix)
+        end = start
+        while end < len(self.vocabulary) and self.vocabulary[end].startswith(prefix):
+            end += 1
+        return self.vocabulary[start:end]
+
+    def lookup(self, field, prefix):
+        """Ids of burgers with a word starting with `prefix` in `field`"""
+        table = self.postings[field]
+        ids = set()
+        for token in self.expand(prefix):
+            ids |= table.get(token, frozenset())
+        return ids
+
+    def search(self, snapshot, query):
+        """Matching BurgerSnapshots, best match first, then in menu order"""
+        scores = {}
+        candidates = None
+        for term in query.terms:
+            term_scores = {}
+            for field in FIELDS:
+                weight = FIELD_WEIGHTS[field]
+                for burger_id in self.lookup(field, term):
+                    if term_scores.get(burger_id, 0) < weight:
+                        term_scores[burger_id] = weight
+            candidates = set(term_scores) if candidates is None else candidates & term_scores.keys()
+            if not candidates:
+                return []
+            for burger_id, weight in term_scores.items():
+                scores[burger_id] = scores.get(burger_id, 0) + weight
+
+        excluded = set()
+        for term in query.exclude:
+            excluded |= self.lookup('ingredients', term)
+
+        # The snapshot lists burgers by id, so sorted ids keep menu order
+        pool = snapshot.burgers if candidates is None else (
+            snapshot.by_id[burger_id] for burger_id in sorted(candidates) if burger_id in snapshot.by_id)
+        results = []
+        for burger in pool:
+            if burger.id in excluded:
+                continue
+            if query.available_only and not burger.is_orderable:
+                continue
+            if query.min_price is not None and burger.price < query.min_price:
+                continue
+            if query.max_price is not None and burger.price > query.max_price:
+                continue
+            results.append(burger)
+        results.sort(key=lambda burger: -scores.get(burger.id, 0))  # stable: menu order within a score
+        return results
+
+class MenuSearch:
+    """Flask extension keeping a search index in step with the menu snapshot"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['menu_search'] = {
+            'index': MenuIndex(),
+            'lock': threading.Lock(),
+            'updates': 0,
+            'reindexed': 0,
+        }
+
+    def _state(self):
+        return current_app.extensions['menu_search']
+
+    def index(self, snapshot):
+        """Index matching `snapshot`, updated from the previous one when the menu changed"""
+        state = self._state()
+        index = state['index']
+        if index.version == snapshot.version:
+            return index
+
+        with state['lock']:
+            index = state['index']
+            if index.version != snapshot.version:
+                previous = index
+                index = previous.updated(snapshot)
+                state['reindexed'] += index.reindexed
+                state['updates'] += 1
+                # A lagging replica may hand out an older snapshot; keep the newest index
+                if previous.version is None or snapshot.version >= previous.version:
+                    state['index'] = index
+        return index
+
+    def search(self, snapshot, query):
+        return self.index(snapshot).search(snapshot, query)
+
+    def stats(self):
+        state = self._state()
+        index = state['index']
+        return {
+            'version': index.version,
+            'burgers': len(index.keys),
+            'words': len(index.vocabulary),
+            'updates': state['updates'],
+            'reindexed_burgers': state['reindexed'],
+        }
+
+menu_search = MenuSearch()
@@ -0,0 +1,198 @@
+"""Synthetic production-scale dataset for local performance work"""
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert
+from werkzeug.security import generate_password_hash
+from app import db, prep, rollups
+from app.availability import refresh_burger_availability
+from app.catalog import menu_catalog
+from app.models import User, Ingredient, Burger, BurgerIngredient, Order, OrderItem, CartItem
+
+# Relative order volume per hour of day: lunch and dinner rushes
+HOURLY_WEIGHTS = [
+    1, 1, 0, 0, 0, 0, 1, 2, 3, 3, 5, 12,
+    22, 18, 8, 5, 5, 9, 16, 14, 9, 6, 4, 2,
+]
+# Relative order volume per weekday, Monday first
+WEEKDAY_WEIGHTS = [0.8, 0.85, 0.9, 1.0, 1.3, 1.45, 1.2]
+
+FIRST_NAMES = ['Olle', 'Anna', 'Erik', 'Maja', 'Lars', 'Sara', 'Johan', 'Elin', 'Karl', 'Ida',
+               'Nils', 'Emma', 'Oskar', 'Lina', 'Axel', 'Moa', 'Hugo', 'Ella', 'Leo', 'Alva']
+LAST_NAMES = ['Andersson', 'Johansson', 'Karlsson', 'Nilsson', 'Eriksson', 'Larsson',
+              'Olsson', 'Persson', 'Svensson', 'Gustafsson', 'Pettersson', 'Jonsson']
+INGREDIENTS = [
+    ('Beef Patty', 3.00), ('Chicken Patty', 2.50), ('Veggie Patty', 2.25), ('Bun', 0.40),
+    ('Brioche Bun', 0.70), ('Tomato', 0.50), ('Lettuce', 0.30), ('Cheese', 0.75),
+    ('Cheddar', 0.85), ('Swiss Cheese', 0.90), ('Blue Cheese', 1.10), ('Onion', 0.25),
+    ('Red Onion', 0.30), ('Fried Onion', 0.45), ('Pickle', 0.20), ('Jalapeno', 0.35),
+    ('Bacon', 1.00), ('Egg', 0.60), ('Avocado', 1.20), ('Mushroom', 0.60),
+    ('Pineapple', 0.55), ('Mayo', 0.15), ('Ketchup', 0.10), ('Mustard', 0.10),
+    ('BBQ Sauce', 0.20), ('Chipotle Mayo', 0.25), ('Truffle Mayo', 0.80), ('Coleslaw', 0.50),
+    ('Rocket', 0.40), ('Beetroot', 0.35),
+]
+ADJECTIVES = ['Classic', 'Smoky', 'Spicy', 'Double', 'Triple', 'Crispy', 'Royal', 'Garden',
+              'Midnight', 'Texas', 'Nordic', 'Loaded', 'Tiny', 'Giant', 'Golden', 'Rustic']
+NOUNS = ['Burger', 'Stack', 'Smash', 'Melt', 'Deluxe', 'Special', 'Slider', 'Tower']
+
+def _batched_insert(table, rows, batch_size):
+    for offset in range(0, len(rows), batch_size):
+        db.session.execute(insert(table), rows[offset:offset + batch_size])
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+def _status_for(age, rng):
+    """Order status for an order placed `age` ago"""
+    if age < timedelta(minutes=15):
+        return rng.choice(['pending', 'confirmed', 'confirmed', 'preparing'])
+    if age < timedelta(hours=1):
+        return rng.choice(['confirmed', 'preparing', 'preparing', 'ready', 'delivered'])
+    if rng.random() < 0.03:
+        return 'cancelled'
+    return 'delivered'
+
+def seed_scale(users=1000, burgers=50, orders=100000, cart_rows=5000, days=90,
+               seed=42, batch_size=20000, end=None, log=print):
+    """Insert a deterministic synthetic dataset in large batches"""
+    if users < 1 or burgers < 1:
+        raise ValueError('seed_scale needs at least one user and one burger')
+    rng = random.Random(seed)
+    end = end or datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    started = time.perf_counter()
+
+    def report(message):
+        log(f'[{time.perf_counter() - started:7.1f}s] {message}')
+
+    # Ingredients
+    existing = {name for (name,) in db.session.query(Ingredient.name)}
+    ingredient_rows = [{'name': name, 'price': price, 'is_available': True, 'created_at': end}
+                       for name, price in INGREDIENTS if name not in existing]
+    _batched_insert(Ingredient.__table__, ingredient_rows, batch_size)
+    ingredient_ids = [ingredient_id for (ingredient_id,) in db.session.query(Ingredient.id)]
+    report(f'{len(ingredient_rows)} ingredients')
+
+    # Burgers with 3-8 ingredients each
+    first_burger_id = _next_id(Burger)
+    burger_rows, recipe_rows, burger_prices = [], [], {}
+    for n in range(burgers):
+        burger_id = first_burger_id + n
+        price = round(rng.uniform(6, 16), 2) - 0.01
+        burger_prices[burger_id] = price
+        burger_rows.append({
+            'id': burger_id,
+            'name': f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} #{burger_id}',
+            'description': 'Generated by seed-scale',
+            'price': price,
+            'is_available': rng.random() > 0.05,
+            'ingredients_available': True,
+            'created_at': end,
+        })
+        for ingredient_id in rng.sample(ingredient_ids, min(len(ingredient_ids), rng.randint(3, 8))):
+            recipe_rows.append({'burger_id': burger_id, 'ingredient_id': ingredient_id,
+                                'quantity': float(rng.choice([1, 1, 1, 2]))})
+    _batched_insert(Burger.__table__, burger_rows, batch_size)
+    _batched_insert(BurgerIngredient.__table__, recipe_rows, batch_size)
+    report(f'{len(burger_rows)} burgers, {len(recipe_rows)} recipe lines')
+
+    # Customers share one password hash: hashing each would dominate the run
+    password_hash = generate_password_hash('password', method='pbkdf2:sha256:1000')
+    first_user_id = _next_id(User)
+    user_rows, user_names = [], {}
+    for n in range(users):
+        user_id = first_user_id + n
+        full_name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        user_names[user_id] = full_name
+        user_rows.append({
+            'id': user_id,
+            'username': f'seed{user_id}',
+            'email': f'seed{user_id}@example.com',
+            'password_hash': password_hash,
+            'full_name': full_name,
+            'is_admin': False,
+            'is_active': True,
+            'created_at': end - timedelta(days=days),
+        })
+    _batched_insert(User.__table__, user_rows, batch_size)
+    report(f'{len(user_rows)} users (password: "password")')
+
+    # Orders, spread over `days` with weekday and time-of-day skew
+    user_ids = list(user_names)
+    burger_ids = list(burger_prices)
+    start_day = (end - timedelta(days=days)).replace(hour=0)
+    span = days + 1  # include the elapsed hours of the current day so recent orders exist
+    hour_weights = [HOURLY_WEIGHTS] * days + [HOURLY_WEIGHTS[:end.hour] + [0] * (24 - end.hour)]
+    day_weights = [WEEKDAY_WEIGHTS[(start_day + timedelta(days=d)).weekday()]
+                   * sum(hour_weights[d]) / sum(HOURLY_WEIGHTS) for d in range(span)]
+    per_day = [0] * span
+    for day in rng.choices(range(span), weights=day_weights, k=orders):
+        per_day[day] += 1
+
+    order_id = _next_id(Order)
+    order_rows, item_rows, inserted = [], [], 0
+    for day, count in enumerate(per_day):
+        if not count:
+            continue
+        day_start = start_day + timedelta(days=day)
+        hours = rng.choices(range(24), weights=hour_weights[day], k=count)
+        moments = sorted(day_start + timedelta(hours=hour, seconds=rng.randrange(3600)) for hour in hours)
+        for created_at in moments:
+            user_id = rng.choice(user_ids)
+            lines = rng.sample(burger_ids, min(len(burger_ids), rng.choice([1, 1, 1, 2, 2, 3, 4])))
+            total = 0.0
+            for burger_id in lines:
+                quantity = rng.choice([1, 1, 1, 2, 3])
+                price = burger_prices[burger_id]
+                total += price * quantity
+                item_rows.append({'order_id': order_id, 'burger_id': burger_id,
+                                  'quantity': quantity, 'price_at_order': price})
+
+            status = _status_for(end - created_at, rng)
+            paid = status not in ('pending', 'cancelled')
+            order_rows.append({
+                'id': order_id,
+                'user_id': user_id,
+                'total_price': round(total, 2),
+                'status': status,
+                'payment_status': 'completed' if paid else ('failed' if status == 'cancelled' else 'pending'),
+                'created_at': created_at,
+                'updated_at': created_at,
+                'customer_name': user_names[user_id],
+                'item_count': len(lines),
+            })
+            order_id += 1
+
+            if len(order_rows) >= batch_size:
+                _batched_insert(Order.__table__, order_rows, batch_size)
+                _batched_insert(OrderItem.__table__, item_rows, batch_size)
+                inserted += len(order_rows)
+                order_rows, item_rows = [], []
+                if inserted % (batch_size * 10) == 0:
+                    report(f'{inserted} orders')
+    _batched_insert(Order.__table__, order_rows, batch_size)
+    _batched_insert(OrderItem.__table__, item_rows, batch_size)
+    inserted += len(order_rows)
+    report(f'{inserted} orders in total')
+
+    # Open carts, holding burgers that are on the menu
+    cart_burger_ids = [row['id'] for row in burger_rows if row['is_available']] or burger_ids
+    cart_pairs = set()
+    max_pairs = len(user_ids) * len(cart_burger_ids)
+    while len(cart_pairs) < min(cart_rows, max_pairs):
+        cart_pairs.add((rng.choice(user_ids), rng.choice(cart_burger_ids)))
+    _batched_insert(CartItem.__table__,
+                    [{'user_id': user_id, 'burger_id': burger_id,
+                      'quantity': rng.randint(1, 3), 'added_at': end}
+                     for user_id, burger_id in sorted(cart_pairs)],
+                    batch_size)
+    report(f'{len(cart_pairs)} cart rows')
+
+    refresh_burger_availability()
+    menu_catalog.bump()
+    db.session.commit()
+    rollups.rebuild()
+    report('rollups rebuilt')
+    prep.rebuild()
+    db.session.commit()
+    report('prep demand rebuilt')
+    return inserted
@@ -0,0 +1,132 @@
+"""Ingredient stock ledger.
+
+Ingredients with a ``stock_quantity`` are tracked; NULL means untracked and
+never runs out. At checkout the cart is expanded through the snapshot's
+precomputed per-burger recipes into one summed demand per ingredient, which
+is checked and deducted by a single conditional UPDATE: either every tracked
+ingredient has enough stock and all of them go down together, or the caller
+rolls the order back. Every change is written to ``stock_movements``.
+
+An ingredient that reaches zero is marked unavailable, and burgers whose
+recipe needs more than what is left stop being orderable (see
+``availability``). Restocking above zero makes the ingredient available again.
+"""
+from sqlalchemy import case, insert, or_, select, update
+from app import db
+from app.availability import ingredient_changed, refresh_burger_availability
+from app.catalog import menu_catalog
+from app.models import Ingredient, StockMovement
+
+ORDER = 'order'
+RESTOCK = 'restock'
+COUNT = 'count'
+
+class OutOfStock(Exception):
+    """Not enough stock for an order; `shortages` lists (name, needed, on hand)"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(', '.join(name for name, _, _ in shortages))
+
+def demand(snapshot, lines):
+    """Summed quantity of each tracked ingredient needed for cart `lines`"""
+    needed = {}
+    for line in lines:
+        for ingredient_id, quantity in snapshot.stock_recipes.get(line.burger.id, ()):
+            needed[ingredient_id] = needed.get(ingredient_id, 0) + quantity * line.quantity
+    return needed
+
+def deduct(snapshot, needed, order_id):
+    """Take `needed` out of stock for `order_id` as part of the current transaction.
+
+    Raises OutOfStock, having possibly deducted some rows, when any ingredient
+    is short; the caller must roll back.
+    """
+    needed = {ingredient_id: quantity for ingredient_id, quantity in needed.items() if quantity}
+    if not needed:
+        return {}
+    ids = list(needed)
+    amount = case(needed, value=Ingredient.id)
+
+    # Rows untracked since the snapshot was built match with a NULL stock and stay NULL
+    statement = (update(Ingredient)
+                 .where(Ingredient.id.in_(ids),
+                        or_(Ingredient.stock_quantity.is_(None), Ingredient.stock_quantity >= amount))
+                 .values(stock_quantity=Ingredient.stock_quantity - amount)
+                 .execution_options(synchronize_session=False))
+    if db.engine.dialect.update_returning:
+        remaining = dict(db.session.execute(statement.returning(Ingredient.id, Ingredient.stock_quantity)).all())
+    else:
+        before = dict(db.session.execute(
+            select(Ingredient.id, Ingredient.stock_quantity).where(Ingredient.id.in_(ids)).with_for_update()).all())
+        db.session.execute(statement)
+        remaining = {ingredient_id: stock if stock is None else stock - needed[ingredient_id]
+                     for ingredient_id, stock in before.items()
+                     if stock is None or stock >= needed[ingredient_id]}
+
+    if len(remaining) < len(ids):
+        short = [ingredient_id for ingredient_id in ids if ingredient_id not in remaining]
+        rows = db.session.execute(select(Ingredient.id, Ingredient.name, Ingredient.stock_quantity)
+                                  .where(Ingredient.id.in_(short)).order_by(Ingredient.name))
+        raise OutOfStock([(row.name, needed[row.id], row.stock_quantity or 0) for row in rows])
+
+    tracked = [ingredient_id for ingredient_id in ids if remaining[ingredient_id] is not None]
+    if tracked:
+        db.session.execute(insert(StockMovement), [
+            {'ingredient_id': ingredient_id, 'change': -needed[ingredient_id], 'reason': ORDER, 'order_id': order_id}
+            for ingredient_id in tracked
+        ])
+    _after_deduct(snapshot, {ingredient_id: remaining[ingredient_id] for ingredient_id in tracked})
+    return remaining
+
+def _after_deduct(snapshot, remaining):
+    """Flip availability for ingredients that can no longer cover every burger using them"""
+    low = [ingredient_id for ingredient_id, stock in remaining.items()
+           if stock < snapshot.max_need.get(ingredient_id, 0) or stock <= 0]
+    if not low:
+        return
+    empty = [ingredient_id for ingredient_id in low if remaining[ingredient_id] <= 0]
+    if empty:
+        db.session.execute(update(Ingredient).where(Ingredient.id.in_(empty))
+                           .values(is_available=False)
+                           .execution_options(synchronize_session=False))
+    burger_ids = set().union(*(snapshot.burgers_using(ingredient_id) for ingredient_id in low))
+    if refresh_burger_availability(burger_ids) or empty:
+        menu_catalog.bump()
+
+def _record(ingredient, change, reason):
+    if change:
+        db.session.add(StockMovement(ingredient_id=ingredient.id, change=change, reason=reason))
+
+def _stock_changed(snapshot, ingredient):
+    if ingredient.stock_quantity is not None:
+        ingredient.is_available = ingredient.stock_quantity > 0
+    db.session.flush()
+    ingredient_changed(snapshot, ingredient.id)
+    menu_catalog.bump()
+
+def restock(snapshot, ingredient, amount):
+    """Add `amount` to an ingredient's stock, starting to track it if needed"""
+    ingredient.stock_quantity = db.func.coalesce(Ingredient.stock_quantity, 0) + amount
+    db.session.flush()
+    db.session.refresh(ingredient, ['stock_quantity'])
+    _record(ingredient, amount, RESTOCK)
+    _stock_changed(snapshot, ingredient)
+
+def set_count(snapshot, ingredient, quantity):
+    """Set an ingredient's stock to a counted `quantity`"""
+    change = quantity - (ingredient.stock_quantity or 0)
+    ingredient.stock_quantity = quantity
+    _record(ingredient, change, COUNT)
+    _stock_changed(snapshot, ingredient)
+
+def untrack(snapshot, ingredient):
+    """Stop tracking an ingredient's stock; its availability is left as it is"""
+    ingredient.stock_quantity = None
+    _stock_changed(snapshot, ingredient)
+
+def movements(ingredient_id, limit=50):
+    """Most recent ledger entries for an ingredient"""
+    return (StockMovement.query.filter_by(ingredient_id=ingredient_id)
+            .order_by(StockMovement.created_at.desc(), StockMovement.id.desc())
+            .limit(limit).all())
@@ -14,6 +14,66 @@ class Config:
     # Stripe configuration (use test keys for development)
     STRIPE_PUBLIC_KEY = os.environ.get('STRIPE_PUBLIC_KEY') or 'pk_test_your_key_here'
     STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY') or 'sk_test_your_key_here'
+    
+    # Payments: 'fake' (offline stand-in) or 'stripe'; charges run on a background pool
+    PAYMENT_PROVIDER = os.environ.get('PAYMENT_PROVIDER') or 'fake'
+    PAYMENT_WEBHOOK_SECRET = os.environ.get('PAYMENT_WEBHOOK_SECRET')
+    PAYMENT_WORKERS = 4  # 0 charges inline in the request
+    PAYMENT_QUEUE_DEPTH = 64
+    PAYMENT_STALE_AFTER = 600  # seconds before a charge without a result may be retried
+    PAYMENT_FAKE_LATENCY = float(os.environ.get('PAYMENT_FAKE_LATENCY') or 1.0)  # seconds
+    PAYMENT_FAKE_FAILURE_RATE = float(os.environ.get('PAYMENT_FAKE_FAILURE_RATE') or 0.0)
+    
+    # Optional read replica for GET views in the customer and admin blueprints
+    SQLALCHEMY_BINDS = {'replica': os.environ['REPLICA_DATABASE_URL']} if os.environ.get('REPLICA_DATABASE_URL') else {}
+    REPLICA_READ_YOUR_WRITES = 5  # seconds a user keeps reading from the primary after writing
+    
+    # SQLite engine profile, applied to every connection (see app/engines.py)
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL'
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000)  # ms
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE') or -65536)  # negative: KiB, so 64 MiB
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 268435456)  # bytes
+    
+    # Server database pool profile (PostgreSQL, MySQL)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 20)
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 30)  # seconds
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)  # seconds
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') != '0'
+    
+    # SQL instrumentation (per-request query counts and N+1 warnings)
+    SQL_INSTRUMENTATION = True
+    SQL_N_PLUS_ONE_THRESHOLD = 5
+    SQL_ENFORCE_QUERY_BUDGETS = False
+    
+    # Password hashing cost and worker pool; existing hashes are upgraded at next login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256:600000'
+    PASSWORD_HASH_WORKERS = 4
+    PASSWORD_HASH_QUEUE_DEPTH = 4  # workers + depth request threads may wait; keep it below the server's
+    PASSWORD_HASH_TIMEOUT = 10  # seconds
+    
+    # Flask-Login user cache (per process)
+    USER_CACHE_SIZE = 1024
+    USER_CACHE_TTL = 60  # seconds
+    # Seconds other processes may keep serving a changed user before they notice
+    USER_CACHE_CHECK_INTERVAL = 1
+    
+    # Cart storage: 'database' (cart_items table) or 'session' (signed cookie)
+    CART_BACKEND = os.environ.get('CART_BACKEND') or 'database'
+    
+    # Sales reports: seconds until an open order counts as settled, and between refreshes
+    ANALYTICS_SETTLE_AFTER = 86400
+    ANALYTICS_REFRESH_INTERVAL = 30
+    
+    # Kitchen prep forecast: seconds of recent orders extrapolated to the next hour
+    PREP_FORECAST_WINDOW = 1800
+    
+    # Seconds a cached order-history total stays valid for page navigation
+    PAGINATION_COUNT_TTL = 30
+    
+    # Apply schema migrations at startup; disable to run `flask db-upgrade` during deploys
+    AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', '1') != '0'
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -24,12 +84,23 @@ class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLITE_MMAP_SIZE = 0
+    SQL_ENFORCE_QUERY_BUDGETS = True
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    PAYMENT_WORKERS = 0
+    ANALYTICS_REFRESH_INTERVAL = 0
+    USER_CACHE_CHECK_INTERVAL = 60  # keeps per-request query counts stable
+    PAYMENT_FAKE_LATENCY = 0
+    PAYMENT_FAKE_FAILURE_RATE = 0
 
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
     TESTING = False
     SESSION_COOKIE_SECURE = True
+    PAYMENT_PROVIDER = os.environ.get('PAYMENT_PROVIDER') or 'stripe'
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 20)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 40)
 
 config = {
     'development': DevelopmentConfig,
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+"""Load generator replaying mixed customer and admin traffic.
+
+Each virtual user is a thread with its own cookie jar. Customers log in
+through the login form (CSRF token included), browse the menu, fill carts,
+check out and pay; admins poll the order list and push status changes. The
+report lists throughput, error rate and latency percentiles per route.
+
+    flask --app run seed-scale --orders 100000
+    python loadgen.py --customers 50 --admins 2 --duration 60
+
+Use --serve to run the app in-process against DATABASE_URL instead of a
+separately started server. Only the standard library is used on the client
+side, so it runs offline.
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from pathlib import Path
+
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+CUSTOMER_MIX = {
+    'browse': 35,
+    'burger': 20,
+    'add_to_cart': 15,
+    'view_cart': 10,
+    'checkout': 10,
+    'orders': 10,
+}
+ADMIN_MIX = {
+    'list_orders': 50,
+    'list_orders_by_status': 20,
+    'dashboard': 15,
+    'update_status': 15,
+}
+NEXT_STATUS = {
+    'confirmed': 'preparing',
+    'preparing': 'ready',
+    'ready': 'delivered',
+}
+
+CSRF_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+BURGER_RE = re.compile(r'/shop/burger/(\d+)')
+ORDERABLE_RE = re.compile(r'/shop/cart/add/(\d+)')
+CART_LINE_RE = re.compile(r'/shop/cart/remove/(\d+)')
+ORDER_RE = re.compile(r'/admin/order/(\d+)')
+IDEMPOTENCY_RE = re.compile(r'name="idempotency_key"[^>]*value="([^"]+)"')
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Report redirects as responses so every request is timed on its own"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+class Stats:
+    """Latency samples and error counts per route, shared by all workers"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.failed_logins = 0
+        self._lock = threading.Lock()
+
+    def record(self, route, elapsed, status, ok):
+        with self._lock:
+            self.latencies[route].append(elapsed)
+            self.statuses[route][status] += 1
+            if not ok:
+                self.errors[route] += 1
+
+    def login_failed(self):
+        with self._lock:
+            self.failed_logins += 1
+
+    def report(self, duration):
+        rows = {}
+        for route in sorted(self.latencies):
+            samples = sorted(self.latencies[route])
+            rows[route] = {
+                'requests': len(samples),
+                'errors': self.errors[route],
+                'error_rate': round(self.errors[route] / len(samples), 4),
+                'rps': round(len(samples) / duration, 2),
+                'p50_ms': round(percentile(samples, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(samples, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(samples, 0.99) * 1000, 2),
+                'max_ms': round(samples[-1] * 1000, 2),
+                'statuses': dict(self.statuses[route]),
+            }
+        return {'duration': round(duration, 2), 'failed_logins': self.failed_logins, 'routes': rows}
+
+def percentile(samples, fraction):
+    index = min(len(samples) - 1, max(0, round(fraction * (len(samples) - 1))))
+    return samples[index]
+
+class Session:
+    """One virtual user: a cookie jar and a timed request helper"""
+
+    def __init__(self, base_url, stats, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()),
+                                                  NoRedirect())
+
+    def request(self, route, path, data=None):
+        """Timed request; returns (status, body, location) and records the outcome"""
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        started = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + path, data=body, timeout=self.timeout) as response:
+                status, payload, location = response.status, response.read(), None
+        except urllib.error.HTTPError as error:
+            status, payload, location = error.code, error.read(), error.headers.get('Location')
+        except OSError:
+            status, payload, location = 0, b'', None
+        elapsed = time.perf_counter() - started
+        self.stats.record(route, elapsed, status, 0 < status < 400)
+        return status, payload.decode('utf-8', 'replace'), location
+
+    def login(self, email, password):
+        status, page, _ = self.request('auth.login GET', '/auth/login')
+        match = CSRF_RE.search(page)
+        if status != 200 or match is None:
+            return False
+        status, _, location = self.request('auth.login POST', '/auth/login', {
+            'csrf_token': match.group(1),
+            'email': email,
+            'password': password,
+        })
+        return status == 302 and location is not None and '/auth/login' not in location
+
+class Customer:
+    """Browses, fills the cart, checks out and pays"""
+
+    def __init__(self, session, rng):
+        self.session = session
+        self.rng = rng
+        self.burger_ids = []
+        self.orderable_ids = []
+
+    def browse(self):
+        status, page, _ = self.session.request('customer.dashboard', '/shop/')
+        if status == 200:
+            self.burger_ids = [int(burger_id) for burger_id in BURGER_RE.findall(page)] or self.burger_ids
+            self.orderable_ids = [int(burger_id) for burger_id in ORDERABLE_RE.findall(page)] or self.orderable_ids
+
+    def burger(self):
+        if not self.burger_ids:
+            return self.browse()
+        self.session.request('customer.burger_detail', f'/shop/burger/{self.rng.choice(self.burger_ids)}')
+
+    def add_to_cart(self):
+        if not self.orderable_ids:
+            return self.browse()
+        self.session.request('customer.add_to_cart', f'/shop/cart/add/{self.rng.choice(self.orderable_ids)}',
+                             {'quantity': self.rng.choice([1, 1, 2])})
+
+    def view_cart(self):
+        self.session.request('customer.view_cart', '/shop/cart')
+
+    def checkout(self):
+        status, page, _ = self.session.request('customer.checkout GET', '/shop/checkout')
+        match = IDEMPOTENCY_RE.search(page)
+        if status != 200 or match is None:
+            # Empty cart redirects to the cart page
+            return self.add_to_cart()
+        status, _, location = self.session.request('customer.checkout POST', '/shop/checkout',
+                                                   {'idempotency_key': match.group(1)})
+        if status == 302 and location and '/shop/payment/' in location:
+            path = urllib.parse.urlsplit(location).path
+            self.session.request('customer.payment GET', path)
+            self.session.request('customer.payment POST', path, {})
+        elif status == 302:
+            # Something in the cart became unavailable: start over
+            self.empty_cart()
+
+    def empty_cart(self):
+        status, page, _ = self.session.request('customer.view_cart', '/shop/cart')
+        for line_id in set(CART_LINE_RE.findall(page)) if status == 200 else ():
+            self.session.request('customer.remove_from_cart', f'/shop/cart/remove/{line_id}', {})
+
+    def orders(self):
+        self.session.request('customer.orders', '/shop/orders')
+
+class Admin:
+    """Polls the order list and advances orders through the kitchen"""
+
+    def __init__(self, session, rng):
+        self.session = session
+        self.rng = rng
+
+    def list_orders(self):
+        self.session.request('admin.list_orders', '/admin/orders')
+
+    def list_orders_by_status(self):
+        status = self.rng.choice(list(NEXT_STATUS))
+        self.session.request('admin.list_orders?status', f'/admin/orders?status={status}')
+
+    def dashboard(self):
+        self.session.request('admin.dashboard', '/admin/')
+
+    def update_status(self):
+        current = self.rng.choice(list(NEXT_STATUS))
+        status, page, _ = self.session.request('admin.list_orders?status', f'/admin/orders?status={current}')
+        order_ids = ORDER_RE.findall(page) if status == 200 else []
+        if order_ids:
+            self.session.request('admin.update_order_status',
+                                 f'/admin/order/{self.rng.choice(order_ids)}/status',
+                                 {'status': NEXT_STATUS[current]})
+
+def parse_mix(text, defaults):
+    """Parse 'browse=40,checkout=10' into weights, validating action names"""
+    if not text:
+        return dict(defaults)
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in defaults:
+            raise argparse.ArgumentTypeError(f'unknown action {name!r}; choose from {", ".join(defaults)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+def worker(actor_class, mix, session, credentials, deadline, seed, think_time):
+    rng = random.Random(seed)
+    if not session.login(*credentials):
+        session.stats.login_failed()
+        return
+    actor = actor_class(session, rng)
+    actions, weights = list(mix), list(mix.values())
+    while time.monotonic() < deadline:
+        getattr(actor, rng.choices(actions, weights=weights)[0])()
+        if think_time:
+            time.sleep(rng.uniform(0, think_time))
+
+def run_load(base_url, customers, admins, duration, customer_accounts, admin_account,
+             customer_mix=None, admin_mix=None, think_time=0.0, timeout=10.0, seed=0):
+    """Run the traffic mix for `duration` seconds and return the per-route report"""
+    stats = Stats()
+    deadline = time.monotonic() + duration
+    threads = []
+    for n in range(customers):
+        credentials = customer_accounts[n % len(customer_accounts)]
+        threads.append(threading.Thread(target=worker, daemon=True, args=(
+            Customer, customer_mix or CUSTOMER_MIX, Session(base_url, stats, timeout),
+            credentials, deadline, seed + n, think_time)))
+    for n in range(admins):
+        threads.append(threading.Thread(target=worker, daemon=True, args=(
+            Admin, admin_mix or ADMIN_MIX, Session(base_url, stats, timeout),
+            admin_account, deadline, seed + customers + n, think_time)))
+
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats.report(time.monotonic() - started)
+
+def serve_in_process(config_name):
+    """Start the app on a free local port in a background thread"""
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    app = create_app(config_name)
+    # Per-request log lines would dominate the run
+    app.logger.setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+def print_report(report):
+    rows = report['routes']
+    header = f'{"route":<32}{"reqs":>8}{"err%":>8}{"rps":>9}{"p50":>9}{"p95":>9}{"p99":>9}{"max":>9}'
+    print(header)
+    print('-' * len(header))
+    totals = [0, 0]
+    for route, row in rows.items():
+        totals[0] += row['requests']
+        totals[1] += row['errors']
+        print(f'{route:<32}{row["requests"]:>8}{row["error_rate"] * 100:>7.1f}%{row["rps"]:>9.1f}'
+              f'{row["p50_ms"]:>9.1f}{row["p95_ms"]:>9.1f}{row["p99_ms"]:>9.1f}{row["max_ms"]:>9.1f}')
+    print('-' * len(header))
+    print(f'{totals[0]} requests, {totals[1]} errors in {report["duration"]:g}s (latencies in ms)')
+    if report['failed_logins']:
+        print(f'{report["failed_logins"]} session(s) could not log in and sent no traffic')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='base URL of a running server')
+    parser.add_argument('--serve', action='store_true', help='serve the app in-process instead of using --url')
+    parser.add_argument('--config', default='development', help='config name used with --serve')
+    parser.add_argument('--customers', type=int, default=20, help='concurrent customer sessions')
+    parser.add_argument('--admins', type=int, default=2, help='concurrent admin sessions')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--customer-email', default='seed{}@example.com',
+                        help='customer email pattern, {} is replaced by the user id')
+    parser.add_argument('--customer-ids', default='2-1001', help='user id range for customers, e.g. 2-1001')
+    parser.add_argument('--customer-password', default='password')
+    parser.add_argument('--admin-email', default='admin@example.com')
+    parser.add_argument('--admin-password', default='admin123')
+    parser.add_argument('--customer-mix', help=f'weights, e.g. {",".join(f"{k}={v}" for k, v in CUSTOMER_MIX.items())}')
+    parser.add_argument('--admin-mix', help=f'weights, e.g. {",".join(f"{k}={v}" for k, v in ADMIN_MIX.items())}')
+    parser.add_argument('--think-time', type=float, default=0.0, help='max random pause between actions (s)')
+    parser.add_argument('--timeout', type=float, default=10.0, help='per-request timeout (s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', dest='json_path', help='also write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    try:
+        customer_mix = parse_mix(args.customer_mix, CUSTOMER_MIX)
+        admin_mix = parse_mix(args.admin_mix, ADMIN_MIX)
+    except argparse.ArgumentTypeError as error:
+        parser.error(str(error))
+    first, _, last = args.customer_ids.partition('-')
+    user_ids = range(int(first), int(last or first) + 1)
+    customer_accounts = [(args.customer_email.format(user_id), args.customer_password) for user_id in user_ids]
+
+    server = None
+    base_url = args.url
+    if args.serve:
+        server, base_url = serve_in_process(args.config)
+    print(f'Running {args.customers} customers and {args.admins} admins against {base_url} '
+          f'for {args.duration:g}s...')
+    try:
+        report = run_load(base_url, args.customers, args.admins, args.duration, customer_accounts,
+                        (args.admin_email, args.admin_password), customer_mix, admin_mix,
+                        think_time=args.think_time, timeout=args.timeout, seed=args.seed)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    print_report(report)
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(report, indent=2, sort_keys=True))
+    return 1 if report['failed_logins'] or not report['routes'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
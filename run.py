@@ -1,12 +1,16 @@
 import os
 import sys
+import click
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-from app import create_app, db
-from app.models import User, Burger, Ingredient, BurgerIngredient
+from app import create_app, db, engines, explain, export, migrations, prep, rollups
+from app.availability import refresh_burger_availability
+from app.catalog import menu_catalog
+from app.seeding import seed_scale as generate_dataset
+from app.models import User, Burger, Ingredient, BurgerIngredient, Order
 
 app = create_app(os.getenv('FLASK_ENV', 'development'))
 
@@ -17,7 +21,7 @@ def make_shell_context():
 @app.cli.command()
 def init_db():
     """Initialize the database with sample data."""
-    db.create_all()
+    migrations.upgrade()
     
     # Create sample ingredients
     ingredients_data = [
@@ -90,6 +94,8 @@ def init_db():
                     bi = BurgerIngredient(burger_id=burger.id, ingredient_id=ingredient.id, quantity=1)
                     db.session.add(bi)
     
+    # Running workers keep their menu snapshot until the version moves
+    menu_catalog.bump()
     db.session.commit()
     
     # Create sample admin user
@@ -107,6 +113,105 @@ def init_db():
     
     print('✓ Database initialized with sample data!')
 
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups():
+    """Recompute the revenue and order-count rollups from orders."""
+    buckets = rollups.rebuild()
+    print(f'✓ Rebuilt {buckets} rollup buckets')
+
+@app.cli.command('rebuild-prep-demand')
+def rebuild_prep_demand():
+    """Recompute the ingredient demand of confirmed and preparing orders."""
+    ingredients = prep.rebuild()
+    db.session.commit()
+    print(f'✓ Rebuilt prep demand for {ingredients} ingredients')
+
+@app.cli.command('seed-scale')
+@click.option('--users', default=10000, show_default=True, help='Customers to create.')
+@click.option('--burgers', default=60, show_default=True, help='Menu items to create.')
+@click.option('--orders', default=1000000, show_default=True, help='Orders to create.')
+@click.option('--cart-rows', default=20000, show_default=True, help='Open cart lines to create.')
+@click.option('--days', default=90, show_default=True, help='History length in days.')
+@click.option('--seed', default=42, show_default=True, help='Random seed.')
+@click.option('--batch-size', default=20000, show_default=True, help='Rows per INSERT batch.')
+@click.option('--end', type=click.DateTime(), default=None,
+              help='Timestamp of the newest order (defaults to the current hour); fix it for reproducible data.')
+def seed_scale(users, burgers, orders, cart_rows, days, seed, batch_size, end):
+    """Generate a production-scale synthetic dataset."""
+    migrations.upgrade()
+    if users < 1 or burgers < 1:
+        raise click.BadParameter('need at least one user and one burger')
+    generate_dataset(users=users, burgers=burgers, orders=orders, cart_rows=cart_rows,
+                     days=days, seed=seed, batch_size=batch_size, end=end)
+    print('✓ Synthetic dataset generated')
+
+@app.cli.command('refresh-availability')
+def refresh_availability():
+    """Recompute which burgers are missing ingredients."""
+    updated = refresh_burger_availability()
+    menu_catalog.bump()
+    db.session.commit()
+    print(f'✓ Availability changed for {updated} burgers')
+
+@app.cli.command('backfill-order-summaries')
+def backfill_order_summaries():
+    """Fill customer name and item count on orders that predate them."""
+    updated = Order.backfill_summaries()
+    db.session.commit()
+    print(f'✓ Backfilled {updated} orders')
+
+@app.cli.command('db-upgrade')
+def db_upgrade():
+    """Create missing tables and apply pending schema migrations."""
+    applied = migrations.upgrade(log=print)
+    print(f'✓ Applied {len(applied)} migration(s)' if applied else '✓ Schema is up to date')
+
+@app.cli.command('db-status')
+def db_status():
+    """List schema migrations and when they were applied."""
+    for migration, applied_at in migrations.status():
+        state = applied_at.strftime('%Y-%m-%d %H:%M') if applied_at else 'pending'
+        print(f'{migration.version:>4}  {state:<16}  {migration.name}')
+
+@app.cli.command('db-settings')
+def db_settings():
+    """Show the effective engine settings (SQLite pragmas or pool sizes)."""
+    for bind, values in engines.settings().items():
+        print(f'{bind}: {values["url"]}')
+        for key, value in values.items():
+            if key != 'url':
+                print(f'    {key:<14} {value}')
+
+@app.cli.command('explain-queries')
+@click.option('--sql', is_flag=True, help='Also print the SQL of each query.')
+def explain_queries(sql):
+    """Show the query plan of each hot query."""
+    full_scans = 0
+    for plan in explain.report():
+        full_scans += plan.full_scan
+        print(f'{"!" if plan.full_scan else "✓"} {plan.name}')
+        if sql:
+            print('    ' + ' '.join(plan.sql.split()))
+        for line in plan.plan:
+            print(f'    {line}')
+    print(f'{full_scans} hot query(s) scan a whole table or index' if full_scans else '✓ Every hot query uses an index')
+
+@app.cli.command('export-orders')
+@click.option('--format', 'fmt', type=click.Choice(sorted(export.FORMATS)), default='csv', show_default=True)
+@click.option('--start', help='First day (YYYY-MM-DD or an ISO timestamp).')
+@click.option('--end', help='Last day, inclusive (YYYY-MM-DD), or an exclusive ISO timestamp.')
+@click.option('--status', help='Only orders in this status.')
+@click.option('--gzip', 'compress', is_flag=True, help='Compress the output.')
+@click.option('--output', '-o', type=click.File('wb'), default='-', help='File to write (default: stdout).')
+def export_orders(fmt, start, end, status, compress, output):
+    """Stream orders with their items and customers as CSV or JSON Lines."""
+    try:
+        start, end = export.parse_bound(start), export.parse_bound(end, end=True)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc))
+    for chunk in export.generate(fmt, start=start, end=end, status=status, compress=compress):
+        output.write(chunk)
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Tests for the columnar sales analytics"""
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db, analytics, order_status, payments
+from app.analytics import SalesAnalytics, aggregate_numpy, aggregate_python
+from app.models import User, Burger, Order, OrderItem
+
+class AnalyticsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        admin = User(username='admin', email='admin@mail.com', full_name='Admin', password_hash='x', is_admin=True)
+        self.customer = User(username='olle', email='olle@mail.com', full_name='Olle', password_hash='x')
+        self.classic = Burger(name='Classic', price=9.0)
+        self.cheese = Burger(name='Cheese', price=10.0)
+        db.session.add_all([admin, self.customer, self.classic, self.cheese])
+        db.session.commit()
+        self.admin_id = admin.id
+
+        # A Monday noon and a Tuesday evening, well past the settle window
+        monday = datetime(2024, 3, 4, 12, 30)
+        self.addOrder(monday, [(self.classic, 2), (self.cheese, 1)])
+        self.addOrder(monday + timedelta(days=1, hours=6), [(self.cheese, 3)])
+        self.addOrder(monday, [(self.classic, 5)], status='cancelled', payment_status='completed')
+        self.addOrder(monday, [(self.classic, 7)], status='pending', payment_status='pending')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def addOrder(self, created_at, lines, status='delivered', payment_status='completed'):
+        total = sum(burger.price * quantity for burger, quantity in lines)
+        order = Order(user_id=self.customer.id, total_price=total, status=status,
+                      payment_status=payment_status, created_at=created_at)
+        db.session.add(order)
+        db.session.flush()
+        db.session.add_all([OrderItem(order_id=order.id, burger_id=burger.id, quantity=quantity,
+                                      price_at_order=burger.price) for burger, quantity in lines])
+        db.session.commit()
+        return order
+
+    def testAggregates(self):
+        """Only paid, uncancelled orders count"""
+        totals = SalesAnalytics(refresh_interval=0, use_numpy=False).totals()
+        self.assertEqual(totals.revenue, 58.0)
+        self.assertEqual((totals.orders, totals.items), (2, 6))
+        self.assertEqual(totals.basket_size, 3.0)
+        self.assertEqual(totals.burger_revenue[self.cheese.id], 40.0)
+        self.assertEqual(totals.top_burgers(1), [(self.cheese.id, 40.0, 4)])
+        self.assertEqual((totals.hour_revenue[12], totals.hour_orders[12]), (28.0, 1))
+        self.assertEqual((totals.weekday_revenue[0], totals.weekday_revenue[1]), (28.0, 30.0))
+        self.assertEqual(totals.weekday_orders, [1, 1, 0, 0, 0, 0, 0])
+
+    def testIncrementalRefresh(self):
+        """Settled orders are loaded once; open ones are re-read until they settle"""
+        sales = SalesAnalytics(refresh_interval=0, use_numpy=False)
+        sales.refresh()
+        self.assertEqual((sales.watermark, len(sales.settled), len(sales.tail)), (4, 3, 0))
+
+        recent = self.addOrder(datetime.utcnow(), [(self.classic, 1)], status='confirmed', payment_status='pending')
+        later = self.addOrder(datetime.utcnow(), [(self.cheese, 1)])
+        self.assertEqual(sales.totals().revenue, 68.0)
+        self.assertEqual(sales.watermark, recent.id - 1)
+
+        recent.payment_status = 'completed'
+        db.session.commit()
+        self.assertEqual(sales.totals().revenue, 77.0)
+        self.assertEqual(len(sales.tail), 2)
+
+        recent.status = 'delivered'
+        db.session.commit()
+        sales.refresh()
+        self.assertEqual((sales.watermark, len(sales.settled), len(sales.tail)), (later.id, 5, 0))
+        self.assertEqual(sales.totals(days=7).revenue, 19.0)
+
+    def testLateChangesBehindTheWatermarkReload(self):
+        """Paying an old pending order or cancelling an old paid one reaches settled totals"""
+        sales = SalesAnalytics(refresh_interval=0, use_numpy=False)
+        self.assertEqual(sales.totals().revenue, 58.0)
+        old_pending = db.session.execute(db.select(Order.id).where(Order.status == 'pending')).scalar()
+        old_paid = self.addOrder(datetime(2024, 3, 6, 9), [(self.cheese, 2)], status='confirmed')
+        self.assertEqual(sales.totals().revenue, 78.0)
+        self.assertEqual(sales.watermark, old_paid.id)
+
+        payments.apply_result('pi_late', payments.SUCCEEDED, old_pending)
+        self.assertEqual(sales.totals().revenue, 141.0)
+        order_status.transition([old_paid.id], 'cancelled')
+        self.assertEqual(sales.totals().revenue, 121.0)
+        self.assertEqual(len(sales.settled), 4)
+
+    @unittest.skipIf(analytics.numpy is None, 'NumPy is not installed')
+    def testNumpyMatchesPython(self):
+        sales = SalesAnalytics(refresh_interval=0, use_numpy=False)
+        sales.refresh()
+        for since_day in (None, datetime(2024, 3, 5).toordinal()):
+            slow = aggregate_python(sales.settled, since_day)
+            fast = aggregate_numpy(sales.settled, since_day)
+            self.assertEqual(vars(slow), vars(fast))
+
+    def testReportPages(self):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+        page = client.get('/admin/reports').get_data(as_text=True)
+        self.assertIn('$58.00', page)
+        self.assertIn('Cheese', page)
+        page = client.get('/admin/reports/burgers?sort=quantity&days=7').get_data(as_text=True)
+        self.assertIn('No paid orders yet', page)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Latency and query-count benchmarks for the hot endpoints.
+
+Query counts are deterministic and always compared against the baseline.
+Latency is compared only when BENCHMARK_CHECK_LATENCY=1, since timings from
+another machine are not comparable. Environment knobs:
+
+    BENCHMARK_ITERATIONS      measured requests per endpoint (default 20)
+    BENCHMARK_ORDERS          orders in the seeded dataset (default 2000)
+    BENCHMARK_TOLERANCE       allowed relative regression (default 0.25)
+    BENCHMARK_CHECK_LATENCY   also fail on p95 latency regressions
+    BENCHMARK_UPDATE_BASELINE write the measured results as the new baseline
+    BENCHMARK_OUTPUT          write the measured results to this JSON file
+"""
+import json
+import os
+import statistics
+import time
+import unittest
+from datetime import datetime
+from pathlib import Path
+from app import create_app, db
+from app.models import User, Burger
+from app.seeding import seed_scale
+
+BASELINE_PATH = Path(__file__).with_name('benchmark_baseline.json')
+ITERATIONS = int(os.environ.get('BENCHMARK_ITERATIONS', 20))
+WARMUP = 3
+ORDERS = int(os.environ.get('BENCHMARK_ORDERS', 2000))
+TOLERANCE = float(os.environ.get('BENCHMARK_TOLERANCE', 0.25))
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+class EndpointBenchmark(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Seed one dataset shared by every benchmark"""
+        cls.app = create_app('testing')
+        # Budgets are checked by the baseline comparison instead
+        cls.app.config['SQL_ENFORCE_QUERY_BUDGETS'] = False
+        with cls.app.app_context():
+            db.create_all()
+            seed_scale(users=200, burgers=40, orders=ORDERS, cart_rows=200, days=30,
+                       seed=1, batch_size=5000, end=datetime(2025, 6, 2, 12), log=lambda message: None)
+            admin = User(username='bench-admin', email='admin@bench.test', full_name='Bench Admin',
+                         password_hash='x', is_admin=True)
+            customer = User(username='bench-customer', email='customer@bench.test',
+                            full_name='Bench Customer', password_hash='x')
+            db.session.add_all([admin, customer])
+            db.session.commit()
+            cls.admin_id, cls.customer_id = admin.id, customer.id
+            cls.burger_id = Burger.query.filter_by(is_available=True, ingredients_available=True).first().id
+            db.session.remove()
+        cls.results = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.drop_all()
+
+        report = {'dataset': {'orders': ORDERS}, 'endpoints': cls.results}
+        if os.environ.get('BENCHMARK_OUTPUT'):
+            Path(os.environ['BENCHMARK_OUTPUT']).write_text(json.dumps(report, indent=2, sort_keys=True))
+        if os.environ.get('BENCHMARK_UPDATE_BASELINE'):
+            BASELINE_PATH.write_text(json.dumps(report, indent=2, sort_keys=True) + '\n')
+
+    def client_for(self, user_id):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+        return client
+
+    def measure(self, name, request, prepare=None):
+        """Time `request` and record p50/p95 latency and its worst query count"""
+        samples, queries = [], []
+        for iteration in range(WARMUP + ITERATIONS):
+            if prepare is not None:
+                prepare()
+            started = time.perf_counter()
+            response = request()
+            elapsed = time.perf_counter() - started
+            self.assertLess(response.status_code, 400, f'{name} returned {response.status_code}')
+            if iteration >= WARMUP:
+                samples.append(elapsed * 1000)
+                queries.append(int(response.headers['X-Query-Count']))
+
+        result = {
+            'p50_ms': round(statistics.median(samples), 3),
+            'p95_ms': round(percentile(samples, 0.95), 3),
+            'queries': max(queries),
+        }
+        self.results[name] = result
+        self.compare(name, result)
+
+    def compare(self, name, result):
+        if os.environ.get('BENCHMARK_UPDATE_BASELINE') or not BASELINE_PATH.exists():
+            return
+        baseline = json.loads(BASELINE_PATH.read_text())['endpoints'].get(name)
+        if baseline is None:
+            return
+
+        self.assertLessEqual(result['queries'], baseline['queries'],
+                             f'{name} now runs {result["queries"]} queries (baseline {baseline["queries"]})')
+        if os.environ.get('BENCHMARK_CHECK_LATENCY'):
+            limit = baseline['p95_ms'] * (1 + TOLERANCE)
+            self.assertLessEqual(result['p95_ms'], limit,
+                                 f'{name} p95 {result["p95_ms"]:.2f} ms exceeds {limit:.2f} ms')
+
+    def add_to_cart(self, client):
+        return client.post(f'/shop/cart/add/{self.burger_id}', data={'quantity': 1})
+
+    def testCustomerDashboard(self):
+        client = self.client_for(self.customer_id)
+        self.measure('customer.dashboard', lambda: client.get('/shop/'))
+
+    def testViewCart(self):
+        client = self.client_for(self.customer_id)
+        self.add_to_cart(client)
+        self.measure('customer.view_cart', lambda: client.get('/shop/cart'))
+
+    def testAddToCart(self):
+        client = self.client_for(self.customer_id)
+        self.measure('customer.add_to_cart', lambda: self.add_to_cart(client))
+
+    def testCheckout(self):
+        client = self.client_for(self.customer_id)
+        counter = iter(range(10 ** 6))
+        self.measure('customer.checkout',
+                     lambda: client.post('/shop/checkout', data={'idempotency_key': f'bench-{next(counter)}'}),
+                     prepare=lambda: self.add_to_cart(client))
+
+    def testPayment(self):
+        client = self.client_for(self.customer_id)
+        counter = iter(range(10 ** 6))
+        pending = []
+
+        def place_order():
+            self.add_to_cart(client)
+            response = client.post('/shop/checkout', data={'idempotency_key': f'pay-{next(counter)}'})
+            pending.append(response.headers['Location'])
+
+        self.measure('customer.payment', lambda: client.post(pending.pop()), prepare=place_order)
+
+    def testAdminDashboard(self):
+        client = self.client_for(self.admin_id)
+        self.measure('admin.dashboard', lambda: client.get('/admin/'))
+
+    def testAdminOrderList(self):
+        client = self.client_for(self.admin_id)
+        self.measure('admin.list_orders', lambda: client.get('/admin/orders'))
+
+    def testAdminOrderListFiltered(self):
+        client = self.client_for(self.admin_id)
+        self.measure('admin.list_orders?status', lambda: client.get('/admin/orders?status=delivered'))
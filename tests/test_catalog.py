@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Tests for the menu catalog cache"""
+import unittest
+from flask import g
+from app import create_app, db
+from app.catalog import menu_catalog, MENU_VERSION
+from app.models import User, Burger, Ingredient, BurgerIngredient, CacheVersion
+
+class CatalogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test context and database"""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.admin = User(username='boss', email='boss@mail.com', full_name='Boss', password_hash='x', is_admin=True)
+        cheese = Ingredient(name='Cheese', price=0.75)
+        burger = Burger(name='Cheese Burger', price=9.99)
+        db.session.add_all([self.admin, cheese, burger])
+        db.session.flush()
+        db.session.add(BurgerIngredient(burger_id=burger.id, ingredient_id=cheese.id))
+        for n in range(14):
+            db.session.add(Burger(name=f'Burger {n}', price=5))
+        db.session.commit()
+        self.burger_id = burger.id
+        self.cheese_id = cheese.id
+
+    def newRequest(self):
+        g.pop('menu_version', None)
+
+    def testSnapshotIsReused(self):
+        """Repeated reads at the same version do not rebuild"""
+        first = menu_catalog.current()
+        self.newRequest()
+        self.assertIs(menu_catalog.current(), first)
+        self.assertEqual(menu_catalog.stats()['rebuilds'], 1)
+        self.assertEqual(first.get(self.burger_id).ingredients[0].name, 'Cheese')
+
+    def testVersionBumpInvalidates(self):
+        """A version bump by any worker drops the stale snapshot"""
+        stale = menu_catalog.current()
+        CacheVersion.bump(MENU_VERSION)
+        db.session.commit()
+        self.newRequest()
+        fresh = menu_catalog.current()
+        self.assertIsNot(fresh, stale)
+        self.assertEqual(fresh.version, stale.version + 1)
+
+    def testPagination(self):
+        """Page slices expose the pagination interface used by templates"""
+        page = menu_catalog.current().page(2, per_page=12)
+        self.assertEqual(len(page.items), 3)
+        self.assertEqual(page.pages, 2)
+        self.assertTrue(page.has_prev)
+        self.assertFalse(page.has_next)
+        self.assertEqual(list(page.iter_pages()), [1, 2])
+
+    def testAdminToggleRefreshesMenu(self):
+        """Admin writes are visible on the next customer request"""
+        menu_catalog.current()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin.id)
+        self.client.post(f'/admin/burger/{self.burger_id}/toggle-availability')
+        self.newRequest()
+        self.assertFalse(menu_catalog.current().get(self.burger_id).is_available)
+
+    def testIngredientToggleCascades(self):
+        """Missing ingredients make only the burgers using them unorderable"""
+        customer = User(username='olle', email='olle@mail.com', full_name='Olle', password_hash='x')
+        db.session.add(customer)
+        db.session.commit()
+
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin.id)
+        self.client.post(f'/admin/ingredient/{self.cheese_id}/toggle-availability')
+
+        self.newRequest()
+        snapshot = menu_catalog.current()
+        self.assertEqual(snapshot.burgers_using(self.cheese_id), {self.burger_id})
+        self.assertFalse(snapshot.get(self.burger_id).is_orderable)
+        self.assertTrue(snapshot.get(self.burger_id).is_available)
+        self.assertEqual(sum(1 for b in snapshot.burgers if not b.is_orderable), 1)
+
+        g.pop('_login_user', None)
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(customer.id)
+        self.client.post(f'/shop/cart/add/{self.burger_id}')
+        self.assertEqual(customer.cart_items, [])
+
+    def tearDown(self):
+        """Tear down test context and database"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Tests for checkout"""
+import unittest
+from flask import g
+from app import create_app, db
+from app.cart import CartBackend
+from app.models import User, Burger, CartItem, Order, OrderItem
+
+class CheckoutTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test context and database"""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        customer = User(username='olle', email='olle@mail.com', full_name='Olle', password_hash='x')
+        burgers = [Burger(name=f'Burger {n}', price=5.0 + n) for n in range(6)]
+        db.session.add(customer)
+        db.session.add_all(burgers)
+        db.session.flush()
+        for burger in burgers:
+            db.session.add(CartItem(user_id=customer.id, burger_id=burger.id, quantity=2))
+        db.session.commit()
+        self.customer_id = customer.id
+
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.customer_id)
+
+    def post(self, data):
+        db.session.expunge_all()
+        g.pop('_login_user', None)
+        return self.client.post('/shop/checkout', data=data)
+
+    def testCheckoutIsAtomic(self):
+        """Order, items and cart clearing happen together"""
+        response = self.post({'idempotency_key': 'abc'})
+        self.assertEqual(response.status_code, 302)
+
+        order = Order.query.one()
+        self.assertEqual(order.item_count, 6)
+        self.assertAlmostEqual(order.total_price, 2 * sum(5.0 + n for n in range(6)))
+        self.assertEqual(OrderItem.query.filter_by(order_id=order.id).count(), 6)
+        self.assertEqual(CartItem.query.count(), 0)
+
+    def testRetriedSubmitReturnsSameOrder(self):
+        """A repeated idempotency key does not create a second order"""
+        first = self.post({'idempotency_key': 'same-key'})
+        second = self.post({'idempotency_key': 'same-key'})
+        self.assertEqual(first.headers['Location'], second.headers['Location'])
+        self.assertEqual(Order.query.count(), 1)
+
+    def tearDown(self):
+        """Tear down test context and database"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+class SessionCartTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test context and database"""
+        self.app = create_app('testing')
+        self.app.config['CART_BACKEND'] = 'session'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        customer = User(username='olle', email='olle@mail.com', full_name='Olle', password_hash='x')
+        burger = Burger(name='Classic', price=8.5)
+        db.session.add_all([customer, burger])
+        db.session.commit()
+        self.burger_id = burger.id
+
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(customer.id)
+
+    def testCartLivesInSession(self):
+        """Cart edits never write cart_items; checkout still creates the order"""
+        response = self.client.post(f'/shop/cart/add/{self.burger_id}', data={'quantity': 2})
+        self.assertEqual(response.status_code, 302)
+        self.client.post(f'/shop/cart/add/{self.burger_id}', data={'quantity': 1})
+        self.assertEqual(CartItem.query.count(), 0)
+
+        with self.client.session_transaction() as sess:
+            self.assertEqual(sess['cart']['items'], {str(self.burger_id): 3})
+            self.assertAlmostEqual(sess['cart']['total'], 25.5)
+
+        cart = self.client.get('/shop/cart')
+        self.assertIn(b'25.50', cart.data)
+
+        self.client.post('/shop/checkout', data={'idempotency_key': 'k1'})
+        order = Order.query.one()
+        self.assertAlmostEqual(order.total_price, 25.5)
+        with self.client.session_transaction() as sess:
+            self.assertNotIn('cart', sess)
+
+    def testBackendMustImplementInterface(self):
+        """A backend missing part of the cart interface cannot be created"""
+        class CountOnlyCart(CartBackend):
+            def count(self):
+                return 0
+
+        with self.assertRaises(TypeError):
+            CountOnlyCart(None)
+
+    def tearDown(self):
+        """Tear down test context and database"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Tests for conditional GET on menu and order pages"""
+import unittest
+from datetime import datetime, timedelta
+from flask import g
+from app import create_app, db, order_status
+from app.catalog import menu_catalog
+from app.instrumentation import count_queries
+from app.models import User, Burger, CacheVersion, CartItem, Order, OrderItem
+
+class ConditionalGetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        olle = User(username='olle', email='olle@mail.com', full_name='Olle', password_hash='x')
+        stina = User(username='stina', email='stina@mail.com', full_name='Stina', password_hash='x')
+        burger = Burger(name='Classic', price=9.0)
+        db.session.add_all([olle, stina, burger])
+        db.session.flush()
+        order = Order(user_id=olle.id, total_price=9.0, status='pending',
+                      updated_at=datetime.utcnow() - timedelta(minutes=5))
+        db.session.add(order)
+        db.session.flush()
+        db.session.add(OrderItem(order_id=order.id, burger_id=burger.id, quantity=1, price_at_order=9.0))
+        db.session.commit()
+        self.olle_id, self.stina_id = olle.id, stina.id
+        self.burger_id, self.order_id = burger.id, order.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url, user_id=None, **headers):
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id or self.olle_id)
+        g.pop('_login_user', None)
+        return self.client.get(url, headers=headers)
+
+    def testUnchangedMenuPagesAnswer304(self):
+        for url in ('/shop/', f'/shop/burger/{self.burger_id}'):
+            first = self.get(url)
+            self.assertEqual(first.status_code, 200)
+            self.assertIn('private', first.headers['Cache-Control'])
+            self.assertIn('no-cache', first.headers['Cache-Control'])
+            self.assertIn('Cookie', first.headers['Vary'])
+
+            with count_queries() as stats:
+                again = self.get(url, **{'If-None-Match': first.headers['ETag']})
+            self.assertEqual(again.status_code, 304)
+            self.assertEqual(again.get_data(), b'')
+            self.assertNotIn('FROM burgers', ' '.join(stats.shapes))
+
+    def testValidatorsFollowMenuCartAndUser(self):
+        etag = self.get('/shop/').headers['ETag']
+        self.assertEqual(self.get('/shop/', self.stina_id, **{'If-None-Match': etag}).status_code, 200)
+
+        db.session.add(CartItem(user_id=self.olle_id, burger_id=self.burger_id, quantity=1))
+        db.session.commit()
+        self.assertEqual(self.get('/shop/', **{'If-None-Match': etag}).status_code, 200)
+
+        etag = self.get('/shop/').headers['ETag']
+        menu_catalog.bump()
+        db.session.commit()
+        self.assertEqual(self.get('/shop/', **{'If-None-Match': etag}).status_code, 200)
+
+    def testOrderDetailUsesUpdatedAt(self):
+        url = f'/shop/order/{self.order_id}'
+        first = self.get(url)
+        self.assertEqual(self.get(url, **{'If-None-Match': first.headers['ETag']}).status_code, 304)
+
+        # A renamed burger changes the page even though the order did not change,
+        # so Last-Modified is the later of the two and absent while the menu's time is unknown
+        self.assertIsNone(first.last_modified)
+        menu_changed = datetime.utcnow().replace(microsecond=0) - timedelta(minutes=1)
+        menu_catalog.bump()
+        db.session.execute(db.update(CacheVersion).values(changed_at=menu_changed))
+        db.session.commit()
+        first = self.get(url)
+        self.assertEqual(first.last_modified.replace(tzinfo=None), menu_changed)
+        since = {'If-Modified-Since': first.headers['Last-Modified']}
+        self.assertEqual(self.get(url, **since).status_code, 304)
+
+        menu_catalog.bump()
+        db.session.commit()
+        self.assertEqual(self.get(url, **since).status_code, 200)
+        first = self.get(url)
+
+        order_status.transition([self.order_id], 'confirmed')
+        changed = self.get(url, **{'If-None-Match': first.headers['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn('Confirmed', changed.get_data(as_text=True))
+
+        self.assertEqual(self.get(url, self.stina_id).status_code, 302)
+
+    def testPendingFlashesAreRendered(self):
+        etag = self.get('/shop/').headers['ETag']
+        with self.client.session_transaction() as sess:
+            sess['_flashes'] = [('success', 'Added to cart')]
+        response = self.get('/shop/', **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Added to cart', response.get_data(as_text=True))
+
+    def testOtherSignedInPagesAreNotStored(self):
+        response = self.get('/shop/cart')
+        self.assertIn('private', response.headers['Cache-Control'])
+        self.assertIn('no-store', response.headers['Cache-Control'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Tests for the database engine profiles"""
+import os
+import tempfile
+import unittest
+from flask import Config, Flask
+from sqlalchemy import create_engine
+from app import create_app, engines
+from config import config
+
+def profile(name):
+    values = Config('.')
+    values.from_object(config[name])
+    return values
+
+class EngineProfileTestCase(unittest.TestCase):
+
+    def testSQLitePragmasAppliedOnConnect(self):
+        """A file database runs in WAL mode with the configured pragmas"""
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        engine = create_engine(f'sqlite:///{path}')
+        self.addCleanup(engine.dispose)
+
+        engines.install_pragmas(engine, engines.sqlite_pragmas(profile('development')))
+        settings = engines.effective_settings(engine)
+
+        self.assertEqual(settings['journal_mode'], 'wal')
+        self.assertEqual(settings['synchronous'], 1)  # NORMAL
+        self.assertEqual(settings['busy_timeout'], 5000)
+        self.assertEqual(settings['cache_size'], -65536)
+
+    def testServerDatabaseGetsPoolProfile(self):
+        """Pool options are only passed to server databases"""
+        production = profile('production')
+        options = engines.engine_options('postgresql://shop:secret@db/shop', production)
+        self.assertEqual(options, {
+            'pool_size': production['DB_POOL_SIZE'],
+            'max_overflow': production['DB_MAX_OVERFLOW'],
+            'pool_timeout': production['DB_POOL_TIMEOUT'],
+            'pool_recycle': production['DB_POOL_RECYCLE'],
+            'pool_pre_ping': True,
+        })
+        self.assertEqual(engines.engine_options('sqlite:///shop.db', production), {})
+
+    def testExplicitEngineOptionsWin(self):
+        """SQLALCHEMY_ENGINE_OPTIONS overrides the profile"""
+        app = Flask(__name__)
+        app.config.from_object(config['production'])
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'mysql://shop@db/shop'
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': 3}
+        engines.configure(app)
+        self.assertEqual(app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'], 3)
+        self.assertEqual(app.config['SQLALCHEMY_ENGINE_OPTIONS']['max_overflow'],
+                         config['production'].DB_MAX_OVERFLOW)
+
+    def testEffectiveSettingsReported(self):
+        """create_app records what the engine actually runs with"""
+        app = create_app('testing')
+        with app.app_context():
+            settings = engines.settings()['default']
+        self.assertTrue(settings['url'].startswith('sqlite:///'))
+        self.assertEqual(settings['journal_mode'], 'memory')  # WAL does not apply in memory
+        self.assertEqual(settings['busy_timeout'], 5000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Tests for the order event bus and its streams"""
+import json
+import threading
+import unittest
+from flask import g
+from app import create_app, db, events
+from app.events import EventBus
+from app.models import User, Burger, CartItem, Order
+
+def parse_stream(body):
+    """(event, payload) pairs of an SSE body"""
+    parsed = []
+    for block in body.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'event' in fields:
+            parsed.append((fields['event'], json.loads(fields['data'])))
+    return parsed
+
+class EventBusTestCase(unittest.TestCase):
+
+    def testSubscribersReadPastTheirLastId(self):
+        bus = EventBus(size=10)
+        bus.publish([{'n': 1}, {'n': 2}])
+        self.assertEqual([payload['n'] for _, payload in bus.since(0)], [1, 2])
+        self.assertEqual([payload['n'] for _, payload in bus.since(1)], [2])
+        self.assertEqual(bus.since(2), [])
+
+    def testWaitWakesOnPublish(self):
+        bus = EventBus()
+        threading.Timer(0.05, bus.publish, args=([{'n': 1}],)).start()
+        self.assertEqual(len(bus.wait(0, timeout=5)), 1)
+        self.assertEqual(bus.wait(1, timeout=0.01), [])
+
+    def testFallingBehindTheBufferIsReported(self):
+        bus = EventBus(size=3)
+        bus.publish([{'n': n} for n in range(5)])
+        self.assertIsNone(bus.since(0))
+        self.assertEqual(len(bus.since(2)), 3)
+
+class OrderEventTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['ORDER_STREAM_TIMEOUT'] = 0.2
+        self.app.config['ORDER_STREAM_HEARTBEAT'] = 0.05
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        admin = User(username='admin', email='admin@mail.com', full_name='Admin', password_hash='x', is_admin=True)
+        customer = User(username='olle', email='olle@mail.com', full_name='Olle', password_hash='x')
+        other = User(username='anna', email='anna@mail.com', full_name='Anna', password_hash='x')
+        burger = Burger(name='Classic', price=9.0)
+        db.session.add_all([admin, customer, other, burger])
+        db.session.flush()
+        db.session.add(CartItem(user_id=customer.id, burger_id=burger.id, quantity=1))
+        other_order = Order(user_id=other.id, total_price=9.0, status='confirmed')
+        db.session.add(other_order)
+        db.session.commit()
+        self.admin_id, self.customer_id = admin.id, customer.id
+        self.other_order_id = other_order.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self, user_id):
+        db.session.expunge_all()
+        g.pop('_login_user', None)
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+
+    def testOrderLifecyclePublishesDeltas(self):
+        """Checkout, payment and status updates reach the kitchen feed"""
+        self.login(self.customer_id)
+        response = self.client.post('/shop/checkout', data={'idempotency_key': 'k1'})
+        order_id = int(response.headers['Location'].rsplit('/', 1)[1])
+        self.login(self.customer_id)
+        self.client.post(f'/shop/payment/{order_id}')
+        self.login(self.admin_id)
+        self.client.post(f'/admin/order/{order_id}/status', data={'status': 'preparing'})
+
+        self.login(self.admin_id)
+        feed = parse_stream(self.client.get('/admin/orders/stream?after=0').get_data(as_text=True))
+        self.assertEqual([(payload['type'], payload['status']) for _, payload in feed],
+                         [('created', 'pending'), ('paid', 'confirmed'), ('status', 'preparing')])
+        self.assertEqual(feed[0][1]['order_id'], order_id)
+        self.assertEqual(feed[0][1]['item_count'], 1)
+
+    def testRolledBackChangesArePublishedNowhere(self):
+        order = db.session.get(Order, self.other_order_id)
+        order.status = 'ready'
+        events.order_changed(order, 'status')
+        db.session.rollback()
+        self.assertEqual(events.bus().last_id, 0)
+
+    def testCustomerFeedOnlyShowsTheirOrder(self):
+        """The per-order feed filters other orders and hides other customers' orders"""
+        self.login(self.customer_id)
+        response = self.client.post('/shop/checkout', data={'idempotency_key': 'k2'})
+        order_id = int(response.headers['Location'].rsplit('/', 1)[1])
+
+        other = db.session.get(Order, self.other_order_id)
+        other.status = 'ready'
+        events.order_changed(other, 'status')
+        db.session.commit()
+
+        self.login(self.customer_id)
+        response = self.client.get(f'/shop/order/{order_id}/stream?after=0')
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        feed = parse_stream(response.get_data(as_text=True))
+        self.assertEqual([payload['order_id'] for _, payload in feed], [order_id])
+
+        self.login(self.customer_id)
+        self.assertEqual(self.client.get(f'/shop/order/{self.other_order_id}/stream').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
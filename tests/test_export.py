@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Tests for the streaming order export"""
+import csv
+import gzip
+import io
+import json
+import unittest
+from datetime import datetime
+from app import create_app, db, export
+from app.models import User, Burger, Order, OrderItem
+
+class ExportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        admin = User(username='admin', email='admin@mail.com', full_name='Admin', password_hash='x', is_admin=True)
+        customer = User(username='olle', email='olle@mail.com', full_name='Olle, Jr.', password_hash='x')
+        classic = Burger(name='Classic', price=9.0)
+        cheese = Burger(name='Cheese', price=10.0)
+        db.session.add_all([admin, customer, classic, cheese])
+        db.session.flush()
+        first = Order(user_id=customer.id, total_price=29.0, status='delivered', created_at=datetime(2024, 3, 1, 12))
+        second = Order(user_id=customer.id, total_price=10.0, status='pending', created_at=datetime(2024, 3, 2, 9))
+        third = Order(user_id=customer.id, total_price=9.0, status='delivered', created_at=datetime(2024, 3, 5, 18))
+        db.session.add_all([first, second, third])
+        db.session.flush()
+        db.session.add_all([
+            OrderItem(order_id=first.id, burger_id=classic.id, quantity=1, price_at_order=9.0),
+            OrderItem(order_id=first.id, burger_id=cheese.id, quantity=2, price_at_order=10.0),
+            OrderItem(order_id=second.id, burger_id=cheese.id, quantity=1, price_at_order=10.0),
+            OrderItem(order_id=third.id, burger_id=classic.id, quantity=1, price_at_order=9.0),
+        ])
+        db.session.commit()
+        self.admin_id = admin.id
+        self.order_ids = [first.id, second.id, third.id]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def export(self, **args):
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+        return self.client.get('/admin/orders/export', query_string=args)
+
+    def testCsvHasOneLinePerItem(self):
+        response = self.export(format='csv')
+        self.assertEqual(response.mimetype, 'text/csv')
+        self.assertIn('attachment; filename="orders-', response.headers['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1]['burger_name'], 'Cheese')
+        self.assertEqual(rows[1]['line_total'], '20.00')
+        self.assertEqual(rows[1]['customer_name'], 'Olle, Jr.')
+
+    def testCsvDefusesFormulas(self):
+        """Names that a spreadsheet would evaluate are written as text"""
+        customer = db.session.execute(db.select(User).where(User.username == 'olle')).scalar_one()
+        customer.full_name = '=HYPERLINK("http://evil.example","Olle")'
+        db.session.execute(db.update(Burger).where(Burger.name == 'Cheese').values(name='@SUM(A1)'))
+        db.session.commit()
+        rows = list(csv.DictReader(io.StringIO(self.export(format='csv').get_data(as_text=True))))
+        self.assertEqual(rows[0]['customer_name'], '\'=HYPERLINK("http://evil.example","Olle")')
+        self.assertEqual(rows[1]['burger_name'], "'@SUM(A1)")
+        self.assertEqual(rows[0]['burger_name'], 'Classic')
+
+    def testJsonLinesNestItemsAndFilter(self):
+        """A date range and status pick whole orders; an end date includes that day"""
+        response = self.export(format='jsonl', start='2024-03-01', end='2024-03-02', status='delivered')
+        records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([r['order_id'] for r in records], [self.order_ids[0]])
+        self.assertEqual([(i['burger_name'], i['quantity']) for i in records[0]['items']],
+                         [('Classic', 1), ('Cheese', 2)])
+        self.assertEqual(records[0]['customer']['email'], 'olle@mail.com')
+
+    def testGzipStreamsInChunks(self):
+        response = self.export(format='jsonl', gzip='1')
+        self.assertEqual(response.mimetype, 'application/gzip')
+        self.assertTrue(response.headers['Content-Disposition'].endswith('.jsonl.gz"'))
+        lines = gzip.decompress(response.get_data()).decode().splitlines()
+        self.assertEqual([json.loads(line)['order_id'] for line in lines], self.order_ids)
+
+        chunks = list(export.generate('csv', chunk_size=1, batch_size=2))
+        self.assertEqual(len(chunks), 4)  # one per row, the header riding with the first
+
+    def testBadArgumentsRejected(self):
+        self.assertEqual(self.export(format='xml').status_code, 400)
+        self.assertEqual(self.export(start='yesterday').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
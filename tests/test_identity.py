@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Tests for the Flask-Login user cache"""
+import unittest
+from app import create_app, db
+from app.identity import USERS_VERSION, load_user, user_cache
+from app.instrumentation import count_queries
+from app.models import CacheVersion, User
+
+class UserCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test context and database"""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        user = User(username='olle', email='olle@mail.com', full_name='Olle', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+        db.session.remove()
+
+    def testCacheHitSkipsQuery(self):
+        """Second load in a fresh session is served from the cache"""
+        load_user(self.user_id)
+        db.session.remove()
+
+        with count_queries() as stats:
+            user = load_user(self.user_id)
+            self.assertEqual(user.full_name, 'Olle')
+        self.assertEqual(stats.count, 0)
+        self.assertIs(user, db.session.get(User, self.user_id))
+        self.assertEqual(user_cache().stats()['hits'], 1)
+
+    def testUpdateInvalidates(self):
+        """Promoting or deactivating a user drops the cached entry"""
+        user = load_user(self.user_id)
+        user.is_admin = True
+        db.session.commit()
+        db.session.remove()
+
+        self.assertTrue(load_user(self.user_id).is_admin)
+        self.assertEqual(user_cache().stats()['misses'], 2)
+
+    def testOtherProcessesSeeChangesWithinTheCheckInterval(self):
+        """A change committed elsewhere reaches this cache through the shared version"""
+        self.assertEqual(load_user(self.user_id).is_active, True)
+        before = CacheVersion.get(USERS_VERSION)
+        load_user(self.user_id).full_name = 'Olle B'
+        db.session.commit()
+        self.assertEqual(CacheVersion.get(USERS_VERSION), before + 1)
+        db.session.remove()
+        self.assertEqual(load_user(self.user_id).full_name, 'Olle B')
+
+        # Another worker deactivates the user: no local invalidation, only the version
+        db.session.execute(db.update(User).where(User.id == self.user_id).values(is_active=False))
+        CacheVersion.bump(USERS_VERSION)
+        db.session.commit()
+        db.session.remove()
+        self.assertTrue(load_user(self.user_id).is_active)
+        db.session.remove()
+
+        user_cache().check_interval = 0
+        self.assertFalse(load_user(self.user_id).is_active)
+
+    def testBoundedSize(self):
+        """Least recently used entries are evicted"""
+        cache = user_cache()
+        cache.max_size = 2
+        for user_id in range(100, 103):
+            cache.put(user_id, {'id': user_id})
+        self.assertIsNone(cache.get(100))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def tearDown(self):
+        """Tear down test context and database"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Tests for SQL instrumentation"""
+import unittest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app import create_app, db
+from app.models import Burger
+from app.instrumentation import (statement_shape, count_queries, query_budget,
+                                 QueryBudgetExceeded)
+
+class InstrumentationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test context and database"""
+        self.app = create_app('testing')
+
+        @self.app.route('/_burgers')
+        @query_budget(2)
+        def list_burger_names():
+            return ','.join(b.name for b in Burger.query.all())
+
+        @self.app.route('/_burgers_n_plus_one')
+        @query_budget(2)
+        def burger_names_one_by_one():
+            ids = [b.id for b in Burger.query.all()]
+            return ','.join(Burger.query.get(i).name for i in ids)
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        for n in range(3):
+            db.session.add(Burger(name=f'Burger {n}', price=5 + n))
+        db.session.commit()
+        db.session.expunge_all()
+
+    def testStatementShape(self):
+        """Parameters and IN lists collapse to one shape"""
+        self.assertEqual(statement_shape("SELECT * FROM t WHERE id IN (?, ?, ?) AND n = 3"),
+                         statement_shape("SELECT *  FROM t WHERE id IN (?) AND n = 42"))
+
+    def testCountQueries(self):
+        """Collector sees statements executed inside the block"""
+        with count_queries() as stats:
+            Burger.query.count()
+            Burger.query.count()
+        self.assertEqual(stats.count, 2)
+        self.assertEqual(stats.repeated(2)[0][1], 2)
+
+    def testFailedStatementReleasesItsStartTime(self):
+        """A statement that raises is counted and leaves no timer behind"""
+        connection = db.session.connection()
+        with count_queries() as stats:
+            with self.assertRaises(OperationalError):
+                db.session.execute(text('SELECT * FROM no_such_table'))
+        self.assertEqual(stats.count, 1)
+        self.assertEqual(connection.info['query_start'], [])
+        db.session.rollback()
+
+    def testResponseHeaders(self):
+        """Totals are reported in response headers"""
+        response = self.client.get('/_burgers')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Query-Count'], '1')
+        self.assertIn('X-Query-Time-Ms', response.headers)
+
+    def testBudgetExceeded(self):
+        """An endpoint over its query budget fails in testing"""
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/_burgers_n_plus_one')
+
+    def tearDown(self):
+        """Tear down test context and database"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
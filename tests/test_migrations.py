@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Tests for schema migrations and the hot-query plan report"""
+import unittest
+from sqlalchemy import inspect, select, text
+from app import create_app, db, explain, migrations, rollups
+from app.models import Order
+
+# Tables as they were before summaries, idempotency keys and the hot-query indexes
+OLD_SCHEMA = [
+    """CREATE TABLE users (
+        id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, email VARCHAR(120) NOT NULL UNIQUE,
+        password_hash VARCHAR(255) NOT NULL, full_name VARCHAR(120) NOT NULL, is_admin BOOLEAN,
+        is_active BOOLEAN, created_at DATETIME)""",
+    """CREATE TABLE ingredients (
+        id INTEGER PRIMARY KEY, name VARCHAR(80) NOT NULL UNIQUE, is_available BOOLEAN,
+        price FLOAT, created_at DATETIME)""",
+    """CREATE TABLE burgers (
+        id INTEGER PRIMARY KEY, name VARCHAR(120) NOT NULL UNIQUE, description TEXT,
+        price FLOAT NOT NULL, is_available BOOLEAN, image_url VARCHAR(255), created_at DATETIME)""",
+    """CREATE TABLE burger_ingredients (
+        id INTEGER PRIMARY KEY, burger_id INTEGER NOT NULL, ingredient_id INTEGER NOT NULL,
+        quantity FLOAT, CONSTRAINT uq_burger_ingredient UNIQUE (burger_id, ingredient_id))""",
+    """CREATE TABLE orders (
+        id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, total_price FLOAT NOT NULL,
+        status VARCHAR(20), payment_status VARCHAR(20), stripe_payment_id VARCHAR(255),
+        created_at DATETIME, updated_at DATETIME)""",
+    """CREATE TABLE order_items (
+        id INTEGER PRIMARY KEY, order_id INTEGER NOT NULL, burger_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL, price_at_order FLOAT NOT NULL)""",
+    "CREATE TABLE cache_versions (name VARCHAR(40) PRIMARY KEY, version INTEGER NOT NULL)",
+    "INSERT INTO cache_versions (name, version) VALUES ('menu', 3)",
+    "INSERT INTO users (id, username, email, password_hash, full_name) VALUES (1, 'olle', 'olle@mail.com', 'x', 'Olle')",
+    "INSERT INTO ingredients (id, name, is_available) VALUES (1, 'Pickles', 0)",
+    "INSERT INTO burgers (id, name, price, is_available) VALUES (1, 'Classic', 8.99, 1)",
+    "INSERT INTO burgers (id, name, price, is_available) VALUES (2, 'Plain', 6.99, 1)",
+    "INSERT INTO burger_ingredients (burger_id, ingredient_id, quantity) VALUES (1, 1, 1)",
+    "INSERT INTO orders (id, user_id, total_price, status, payment_status) VALUES (1, 1, 8.99, 'pending', 'pending')",
+    "INSERT INTO order_items (order_id, burger_id, quantity, price_at_order) VALUES (1, 1, 1, 8.99)",
+]
+
+class MigrationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def createOldSchema(self):
+        db.drop_all()
+        with db.engine.begin() as connection:
+            for statement in OLD_SCHEMA:
+                connection.execute(text(statement))
+
+    def indexNames(self, table):
+        inspector = inspect(db.engine)
+        names = {index['name'] for index in inspector.get_indexes(table)}
+        return names | {constraint['name'] for constraint in inspector.get_unique_constraints(table)}
+
+    def testFreshDatabaseIsUpToDate(self):
+        """create_app builds the current schema and records every migration"""
+        self.assertTrue(all(applied_at for _, applied_at in migrations.status()))
+        self.assertEqual(migrations.upgrade(), [])
+
+    def testUpgradesOldSchema(self):
+        """Columns and indexes are added to existing tables without losing rows"""
+        self.createOldSchema()
+        self.assertTrue(all(applied_at is None for _, applied_at in migrations.status()))
+
+        applied = migrations.upgrade()
+        self.assertEqual([m.version for m in applied], [m.version for m in migrations.MIGRATIONS])
+
+        columns = {column['name'] for column in inspect(db.engine).get_columns('orders')}
+        self.assertTrue({'customer_name', 'item_count', 'idempotency_key'} <= columns)
+        self.assertTrue({'ix_orders_user_created', 'ix_orders_status_created', 'ix_orders_created',
+                         'uq_order_idempotency_key'} <= self.indexNames('orders'))
+        self.assertIn('ix_order_items_order_id', self.indexNames('order_items'))
+        self.assertIn('ix_burger_ingredients_ingredient_id', self.indexNames('burger_ingredients'))
+
+        # Summaries and availability are derived for the rows that were already there
+        row = db.session.execute(text('SELECT customer_name, item_count FROM orders WHERE id = 1')).one()
+        self.assertEqual((row.customer_name, row.item_count), ('Olle', 1))
+        available = dict(db.session.execute(text('SELECT name, ingredients_available FROM burgers')).all())
+        self.assertEqual(available, {'Classic': False, 'Plain': True})
+        menu = db.session.execute(text("SELECT version, changed_at FROM cache_versions WHERE name = 'menu'")).one()
+        self.assertEqual(menu.version, 4)
+        self.assertIsNotNone(menu.changed_at)
+
+        # The rollup tables are new, so they are filled from the existing orders
+        self.assertEqual((rollups.order_count(), rollups.order_count('pending')), (1, 1))
+
+        # A second run has nothing left to do
+        self.assertEqual(migrations.upgrade(), [])
+
+    def testExplainReportShowsIndexUse(self):
+        """Every hot query is planned on an index"""
+        plans = explain.report()
+        self.assertTrue(plans)
+        self.assertEqual([plan.name for plan in plans if plan.full_scan], [])
+
+        orders_plan = next(plan for plan in plans if plan.name == 'customer.orders')
+        self.assertIn('ix_orders_user_created', ' '.join(orders_plan.plan))
+
+    def testExplainFlagsMissingIndexes(self):
+        """Without the indexes the filtered order list scans the whole table"""
+        with db.engine.begin() as connection:
+            connection.execute(text('DROP INDEX ix_orders_status_created'))
+            connection.execute(text('DROP INDEX ix_orders_created'))
+        plans = {plan.name: plan for plan in explain.report()}
+        self.assertTrue(plans['admin.list_orders?status='].full_scan)
+
+    def testExplainFlagsDeepOffsetPages(self):
+        """Walking the whole index to reach an OFFSET is not index use"""
+        newest_first = (Order.created_at.desc(), Order.id.desc())
+        first = explain.check('first page', select(Order).order_by(*newest_first).limit(21))
+        deep = explain.check('deep page', select(Order).order_by(*newest_first).offset(10000).limit(21))
+        self.assertIn('USING INDEX ix_orders_created', ' '.join(deep.plan))
+        self.assertEqual((first.full_scan, deep.full_scan), (False, True))
+
+if __name__ == '__main__':
+    unittest.main()
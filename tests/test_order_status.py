@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Tests for order status transitions"""
+import unittest
+from flask import g
+from app import create_app, db, events, order_status, rollups
+from app.instrumentation import count_queries
+from app.models import User, Order
+
+class OrderStatusTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        admin = User(username='admin', email='admin@mail.com', full_name='Admin', password_hash='x', is_admin=True)
+        customer = User(username='olle', email='olle@mail.com', full_name='Olle', password_hash='x')
+        db.session.add_all([admin, customer])
+        db.session.flush()
+        self.admin_id = admin.id
+        self.orders = {}
+        for status in ('confirmed', 'confirmed', 'confirmed', 'preparing', 'delivered'):
+            order = Order(user_id=customer.id, total_price=9.0, status=status, customer_name='Olle')
+            db.session.add(order)
+            db.session.flush()
+            rollups.record_order_created(order)
+            self.orders.setdefault(status, []).append(order.id)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self):
+        db.session.expunge_all()
+        g.pop('_login_user', None)
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+
+    def status(self, order_id):
+        db.session.expunge_all()
+        return db.session.get(Order, order_id).status
+
+    def testTransitionsEnforcedPerOrder(self):
+        """Only orders allowed to move do; the rest report where they stand"""
+        confirmed, delivered = self.orders['confirmed'], self.orders['delivered'][0]
+        results = order_status.transition(confirmed + [delivered, 9999], 'preparing')
+        self.assertEqual([r.outcome for r in results], ['updated'] * 3 + ['conflict', 'not_found'])
+        self.assertEqual(results[3].status, 'delivered')
+        self.assertEqual([self.status(i) for i in confirmed], ['preparing'] * 3)
+        self.assertEqual(self.status(delivered), 'delivered')
+
+        counts = rollups.dashboard_totals()['status_counts']
+        self.assertEqual((counts['confirmed'], counts['preparing']), (0, 4))
+
+    def testOneUpdateAndOneBatchedPublish(self):
+        ids = self.orders['confirmed'] + self.orders['preparing']
+        published = []
+        bus = events.bus()
+        original = bus.publish
+        bus.publish = lambda payloads: (published.append(list(payloads)), original(payloads))
+        with count_queries() as collector:
+            order_status.transition(ids, 'cancelled')
+        updates = [n for shape, n in collector.shapes.items() if shape.upper().startswith('UPDATE ORDERS')]
+        self.assertEqual(updates, [1])
+        self.assertEqual(len(published), 1)
+        self.assertEqual(sorted(p['order_id'] for p in published[0]), sorted(ids))
+        self.assertTrue(all(p['status'] == 'cancelled' for p in published[0]))
+
+    def testBulkEndpointReportsJson(self):
+        self.login()
+        response = self.client.post('/admin/orders/status', json={
+            'status': 'ready', 'order_ids': self.orders['preparing'] + self.orders['confirmed'][:1]})
+        body = response.get_json()
+        self.assertEqual([r['outcome'] for r in body['results']], ['updated', 'conflict'])
+        self.assertEqual(body['results'][1]['status'], 'confirmed')
+
+        self.login()
+        self.assertEqual(self.client.post('/admin/orders/status', json={'status': 'eaten', 'order_ids': []}).status_code, 400)
+
+    def testBulkFormFlashesConflicts(self):
+        self.login()
+        response = self.client.post('/admin/orders/status', data={
+            'status': 'delivered', 'order_ids': self.orders['confirmed'][:1], 'current_status': 'confirmed'},
+            follow_redirects=True)
+        page = response.get_data(as_text=True)
+        self.assertIn(f'#{self.orders["confirmed"][0]} (confirmed)', page)
+
+    def testSingleUpdateCannotSkipSteps(self):
+        order_id = self.orders['confirmed'][0]
+        self.login()
+        self.client.post(f'/admin/order/{order_id}/status', data={'status': 'delivered'})
+        self.assertEqual(self.status(order_id), 'confirmed')
+        self.login()
+        self.client.post(f'/admin/order/{order_id}/status', data={'status': 'preparing'})
+        self.assertEqual(self.status(order_id), 'preparing')
+
+if __name__ == '__main__':
+    unittest.main()
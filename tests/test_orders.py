@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Tests for order listings"""
+import unittest
+from datetime import datetime, timedelta
+from flask import g
+from werkzeug.exceptions import NotFound
+from app import create_app, db
+from app.models import User, Burger, Order, OrderItem
+from app.explain import explain
+from app.pagination import KeysetPage, _seek, keyset_paginate
+
+class OrderListTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test context and database"""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.admin = User(username='boss', email='boss@mail.com', full_name='Boss', password_hash='x', is_admin=True)
+        self.customer = User(username='olle', email='olle@mail.com', full_name='Olle', password_hash='x')
+        self.burger = Burger(name='Classic', price=8.0)
+        db.session.add_all([self.admin, self.customer, self.burger])
+        db.session.commit()
+        self.admin_id, self.customer_id, self.burger_id = self.admin.id, self.customer.id, self.burger.id
+
+    def login(self, user_id):
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+
+    def get(self, url):
+        db.session.expunge_all()
+        g.pop('_login_user', None)
+        return self.client.get(url)
+
+    def createOrders(self, count, status='pending'):
+        for _ in range(count):
+            order = Order(user_id=self.customer_id, total_price=8.0, status=status,
+                          customer_name='Olle', item_count=1)
+            order.items.append(OrderItem(burger_id=self.burger_id, quantity=1, price_at_order=8.0))
+            db.session.add(order)
+        db.session.commit()
+
+    def testAdminListQueryCountIsConstant(self):
+        """Order list cost does not grow with the number of rows shown"""
+        self.login(self.admin_id)
+        self.createOrders(21)
+        self.get('/admin/orders')  # warm the user cache
+        small = self.get('/admin/orders')
+        self.createOrders(25, status='confirmed')
+        large = self.get('/admin/orders')
+        filtered = self.get('/admin/orders?status=confirmed')
+
+        self.assertEqual(large.status_code, 200)
+        self.assertEqual(small.headers['X-Query-Count'], large.headers['X-Query-Count'])
+        self.assertEqual(small.headers['X-Query-Count'], filtered.headers['X-Query-Count'])
+        self.assertIn(b'Olle', large.data)
+
+    def testBackfillSummaries(self):
+        """Summary columns are derived for legacy orders"""
+        order = Order(user_id=self.customer_id, total_price=8.0)
+        order.items.append(OrderItem(burger_id=self.burger_id, quantity=2, price_at_order=8.0))
+        db.session.add(order)
+        db.session.commit()
+
+        self.assertEqual(Order.backfill_summaries(), 1)
+        db.session.commit()
+        db.session.refresh(order)
+        self.assertEqual(order.customer_name, 'Olle')
+        self.assertEqual(order.item_count, 1)
+
+    def testKeysetPagesCoverEveryOrderOnce(self):
+        """Walking next cursors visits all orders newest first, ties broken by id"""
+        start = datetime(2025, 1, 1, 12)
+        for n in range(25):
+            # Pairs of orders share a timestamp to exercise the id tie-breaker
+            db.session.add(Order(user_id=self.customer_id, total_price=1.0, item_count=0,
+                                 created_at=start + timedelta(minutes=n // 2)))
+        db.session.commit()
+        expected = [o.id for o in Order.query.order_by(Order.created_at.desc(), Order.id.desc())]
+
+        seen, pages, cursor = [], [], None
+        while True:
+            page = keyset_paginate(Order.query, Order, per_page=10, cursor=cursor, total=25)
+            pages.append(page)
+            seen.extend(o.id for o in page.items)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+
+        self.assertEqual(seen, expected)
+        self.assertEqual([p.page for p in pages], [1, 2, 3])
+        self.assertEqual(pages[-1].pages, 3)
+
+        back = keyset_paginate(Order.query, Order, per_page=10, cursor=pages[2].prev_cursor, total=25)
+        self.assertEqual([o.id for o in back.items], [o.id for o in pages[1].items])
+        self.assertEqual(back.page, 2)
+
+    def testDeepPagesSeekAnIndexRange(self):
+        """Cursor pages are an index range, and OFFSET jumps stop at max_jump"""
+        key = (datetime(2025, 1, 1, 12), 500)
+        for direction in ('next', 'prev'):
+            statement = (db.select(Order).where(_seek(Order, key, direction))
+                         .order_by(Order.created_at.desc(), Order.id.desc()).limit(11))
+            plan = ' '.join(explain(statement))
+            self.assertIn('SEARCH orders USING INDEX ix_orders_created', plan)
+            self.assertNotIn('SCAN', plan)
+
+        self.createOrders(5)
+        with self.app.test_request_context():
+            with self.assertRaises(NotFound):
+                keyset_paginate(Order.query, Order, per_page=1, page=4, max_jump=3)
+        deep = KeysetPage([], 40, 10, 1000, True, True, None, None, max_jump=10)
+        self.assertEqual(list(deep.iter_pages()), [1, 2, None, 40, None])
+        shallow = KeysetPage([], 3, 10, 1000, True, True, None, None, max_jump=10)
+        self.assertEqual(list(shallow.iter_pages()), [1, 2, 3, 4, 5, 6, 7, None])
+
+    def testCursorLinksRender(self):
+        """Order list navigation follows cursors"""
+        self.login(self.admin_id)
+        self.createOrders(25)
+        first = self.get('/admin/orders')
+        self.assertIn(b'cursor=', first.data)
+        self.assertEqual(self.get('/admin/orders?cursor=bogus').status_code, 400)
+
+    def tearDown(self):
+        """Tear down test context and database"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Tests for password hashing"""
+import time
+import unittest
+from werkzeug.security import generate_password_hash
+from app import create_app, db
+from app.models import User
+from app.passwords import PasswordHasher, HashingBusy
+
+class PasswordTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test context and database"""
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def testRehashOnLogin(self):
+        """A hash made with an old cost is upgraded at the next login"""
+        user = User(username='olle', email='olle@mail.com', full_name='Olle',
+                    password_hash=generate_password_hash('secret1', method='pbkdf2:sha256:500'))
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.post('/auth/login', data={'email': 'olle@mail.com', 'password': 'secret1'})
+        self.assertEqual(response.status_code, 302)
+
+        db.session.refresh(user)
+        self.assertTrue(user.password_hash.startswith('pbkdf2:sha256:1000$'))
+        self.assertFalse(user.password_needs_rehash())
+        self.assertTrue(user.check_password('secret1'))
+
+    def testQueueLimit(self):
+        """Hashing fails fast once every worker and queue slot is taken"""
+        hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1, queue_depth=0)
+        self.assertTrue(hasher.verify(hasher.hash('pw'), 'pw'))
+
+        hasher._slots.acquire()
+        with self.assertRaises(HashingBusy):
+            hasher.hash('pw')
+        hasher._slots.release()
+
+    def testSlowHashIsBusy(self):
+        """A hash that outlasts the timeout sheds the request instead of raising a 500"""
+        hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1, queue_depth=0, timeout=0.01)
+        with self.assertRaises(HashingBusy):
+            hasher._run(time.sleep, 0.2)
+
+    def testBusyRehashCheckStillLogsIn(self):
+        class BusyRehash(PasswordHasher):
+            def needs_rehash(self, password_hash):
+                raise HashingBusy('Password hashing queue is full')
+
+        db.session.add(User(username='olle', email='olle@mail.com', full_name='Olle',
+                            password_hash=generate_password_hash('secret1', method='pbkdf2:sha256:500')))
+        db.session.commit()
+        self.app.extensions['password_hasher'] = BusyRehash('pbkdf2:sha256:1000')
+        response = self.client.post('/auth/login', data={'email': 'olle@mail.com', 'password': 'secret1'})
+        self.assertEqual(response.status_code, 302)
+
+    def tearDown(self):
+        """Tear down test context and database"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
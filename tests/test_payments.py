@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""Tests for the asynchronous payment pipeline"""
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from flask import g
+from app import create_app, db, payments, rollups
+from app.models import User, Order
+from app.payments import ChargeResult, FakeProvider, PaymentQueue, PaymentsBusy
+from config import config, TestingConfig
+
+class PendingProvider(FakeProvider):
+    """Accepts charges and leaves the outcome to the webhook"""
+
+    def charge(self, amount, currency, order_id, idempotency_key):
+        return ChargeResult(f'pi_test_{order_id}', None)
+
+def webhook_body(payment_id, order_id, kind='payment_intent.succeeded'):
+    return json.dumps({'type': kind, 'data': {'object': {'id': payment_id, 'metadata': {'order_id': str(order_id)}}}})
+
+class PaymentTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        customer = User(username='olle', email='olle@mail.com', full_name='Olle', password_hash='x')
+        db.session.add(customer)
+        db.session.flush()
+        order = Order(user_id=customer.id, total_price=12.5, item_count=1)
+        db.session.add(order)
+        db.session.commit()
+        self.customer_id, self.order_id = customer.id, order.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self):
+        db.session.expunge_all()
+        g.pop('_login_user', None)
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.customer_id)
+
+    def order(self):
+        db.session.expunge_all()
+        return db.session.get(Order, self.order_id)
+
+    def pay(self):
+        self.login()
+        return self.client.post(f'/shop/payment/{self.order_id}')
+
+    def testSuccessfulChargeConfirmsOrder(self):
+        response = self.pay()
+        self.assertEqual(response.headers['Location'], f'/shop/payment/{self.order_id}')
+        order = self.order()
+        self.assertEqual((order.payment_status, order.status), ('completed', 'confirmed'))
+        self.assertTrue(order.stripe_payment_id.startswith('pi_fake_'))
+        self.assertEqual(rollups.dashboard_totals()['total_revenue'], 12.5)
+
+        self.login()
+        response = self.client.get(f'/shop/payment/{self.order_id}')
+        self.assertEqual(response.headers['Location'], f'/shop/order/{self.order_id}')
+
+    def testDeclinedChargeCanBeRetried(self):
+        provider = payments.payment_queue().provider
+        provider.failure_rate = 1.0
+        self.pay()
+        self.assertEqual(self.order().payment_status, 'failed')
+        self.login()
+        self.assertIn('declined', self.client.get(f'/shop/payment/{self.order_id}').get_data(as_text=True))
+
+        provider.failure_rate = 0.0
+        self.pay()
+        self.assertEqual(self.order().payment_status, 'completed')
+
+    def testCancelledOrderCannotBePaid(self):
+        order = self.order()
+        order.status = 'cancelled'
+        db.session.commit()
+        response = self.pay()
+        self.assertEqual(self.order().payment_status, 'pending')
+        self.login()
+        response = self.client.get(response.headers['Location'], follow_redirects=True)
+        self.assertIn('can no longer be paid', response.get_data(as_text=True))
+        self.assertEqual(rollups.dashboard_totals()['total_revenue'], 0)
+
+    def testWebhookAppliesResultOnce(self):
+        """A redelivered webhook changes nothing"""
+        payments.payment_queue().provider = PendingProvider()
+        self.pay()
+        order = self.order()
+        self.assertEqual((order.payment_status, order.stripe_payment_id),
+                         ('processing', f'pi_test_{self.order_id}'))
+        self.login()
+        self.assertIn('Processing payment', self.client.get(f'/shop/payment/{self.order_id}').get_data(as_text=True))
+
+        body = webhook_body(f'pi_test_{self.order_id}', self.order_id)
+        first = self.client.post('/payments/webhook', data=body).get_json()
+        second = self.client.post('/payments/webhook', data=body).get_json()
+        self.assertEqual((first['applied'], second['applied']), (True, False))
+        self.assertEqual(self.order().payment_status, 'completed')
+        self.assertEqual(rollups.dashboard_totals()['status_counts'].get('confirmed'), 1)
+
+    def testWebhookBeforePaymentIdIsRecorded(self):
+        """The order id in the metadata finds an order the worker has not updated yet"""
+        order = self.order()
+        order.payment_status = 'processing'
+        db.session.commit()
+        body = webhook_body('pi_early', self.order_id, kind='payment_intent.payment_failed')
+        self.assertTrue(self.client.post('/payments/webhook', data=body).get_json()['applied'])
+        order = self.order()
+        self.assertEqual((order.payment_status, order.stripe_payment_id), ('failed', 'pi_early'))
+
+    def testMetadataOnlyVouchesForAnUnidentifiedCharge(self):
+        """An unsigned event naming an order by metadata cannot pay for it"""
+        body = webhook_body('pi_forged', self.order_id)
+        self.assertFalse(self.client.post('/payments/webhook', data=body).get_json()['applied'])
+        self.assertEqual(self.order().payment_status, 'pending')
+
+        order = self.order()
+        order.payment_status, order.stripe_payment_id = 'processing', 'pi_real'
+        db.session.commit()
+        self.assertFalse(self.client.post('/payments/webhook', data=body).get_json()['applied'])
+        self.assertEqual(self.order().payment_status, 'processing')
+
+    def testFakeProviderRefusedInProduction(self):
+        class LiveConfig(TestingConfig):
+            TESTING = False
+
+        config['live-testing'] = LiveConfig
+        self.addCleanup(config.pop, 'live-testing')
+        with self.assertRaises(RuntimeError):
+            create_app('live-testing')
+
+    def testWebhookSignatureChecked(self):
+        provider = payments.payment_queue().provider
+        provider.webhook_secret = 'whsec'
+        body = webhook_body('pi_x', self.order_id).encode()
+        self.assertEqual(self.client.post('/payments/webhook', data=body,
+                                          headers={'Fake-Signature': 'forged'}).status_code, 400)
+        response = self.client.post('/payments/webhook', data=body,
+                                    headers={'Fake-Signature': provider.sign(body)})
+        self.assertEqual(response.status_code, 200)
+
+class PaymentWorkerTestCase(unittest.TestCase):
+    """Charges on the background pool, against a file database shared across threads"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        class WorkerConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(directory.name, "shop.db")}'
+            PAYMENT_WORKERS = 2
+            PAYMENT_FAKE_LATENCY = 0.05
+
+        config['payment-worker-testing'] = WorkerConfig
+        self.addCleanup(config.pop, 'payment-worker-testing')
+        self.app = create_app('payment-worker-testing')
+        self.addCleanup(self.disposeEngine)
+        with self.app.app_context():
+            customer = User(username='olle', email='olle@mail.com', full_name='Olle', password_hash='x')
+            db.session.add(customer)
+            db.session.flush()
+            order = Order(user_id=customer.id, total_price=9.0, item_count=1)
+            db.session.add(order)
+            db.session.commit()
+            self.customer_id, self.order_id = customer.id, order.id
+            db.session.remove()
+
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.customer_id)
+
+    def disposeEngine(self):
+        with self.app.app_context():
+            db.engine.dispose()
+
+    def paymentStatus(self):
+        with self.app.app_context():
+            return db.session.get(Order, self.order_id).payment_status
+
+    def testRequestReturnsBeforeTheCharge(self):
+        self.client.post(f'/shop/payment/{self.order_id}')
+        self.assertEqual(self.paymentStatus(), 'processing')
+        self.assertIn('Processing payment', self.client.get(f'/shop/payment/{self.order_id}').get_data(as_text=True))
+
+        deadline = time.monotonic() + 5
+        while self.paymentStatus() == 'processing' and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(self.paymentStatus(), 'completed')
+
+    def testFullQueueReleasesTheOrder(self):
+        release = threading.Event()
+
+        class BlockingProvider(FakeProvider):
+            def charge(self, *args):
+                release.wait(5)
+                return super().charge(*args)
+
+        self.app.extensions['payments'] = PaymentQueue(BlockingProvider(latency=0), workers=1, queue_depth=0)
+        self.addCleanup(release.set)
+        with self.app.app_context():
+            self.app.extensions['payments'].submit(self.app, 999, 100, 'held')
+            with self.assertRaises(PaymentsBusy):
+                payments.start(db.session.get(Order, self.order_id))
+        self.assertEqual(self.paymentStatus(), 'pending')
+
+if __name__ == '__main__':
+    unittest.main()
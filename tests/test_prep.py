@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Tests for the kitchen prep forecast"""
+import unittest
+from datetime import datetime, timedelta
+from flask import g
+from app import create_app, db, order_status, payments, prep
+from app.catalog import menu_catalog
+from app.instrumentation import count_queries
+from app.models import User, Burger, Ingredient, BurgerIngredient, IngredientDemand, Order, OrderItem
+
+class PrepTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        admin = User(username='admin', email='admin@mail.com', full_name='Admin', password_hash='x', is_admin=True)
+        self.customer = User(username='olle', email='olle@mail.com', full_name='Olle', password_hash='x')
+        patty = Ingredient(name='Patty')
+        bun = Ingredient(name='Bun', stock_quantity=3)
+        cheese = Ingredient(name='Cheese')
+        self.single = Burger(name='Single', price=8.0)
+        self.double = Burger(name='Double', price=11.0)
+        db.session.add_all([admin, self.customer, patty, bun, cheese, self.single, self.double])
+        db.session.flush()
+        db.session.add_all([
+            BurgerIngredient(burger_id=self.single.id, ingredient_id=patty.id, quantity=1),
+            BurgerIngredient(burger_id=self.single.id, ingredient_id=bun.id, quantity=1),
+            BurgerIngredient(burger_id=self.double.id, ingredient_id=patty.id, quantity=2),
+            BurgerIngredient(burger_id=self.double.id, ingredient_id=bun.id, quantity=1),
+            BurgerIngredient(burger_id=self.double.id, ingredient_id=cheese.id, quantity=2),
+        ])
+        db.session.commit()
+        self.admin_id = admin.id
+        self.ids = {'patty': patty.id, 'bun': bun.id, 'cheese': cheese.id}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def addOrder(self, lines, status='pending', created_at=None):
+        order = Order(user_id=self.customer.id, total_price=0, status=status,
+                      created_at=created_at or datetime.utcnow() - timedelta(hours=3))
+        db.session.add(order)
+        db.session.flush()
+        db.session.add_all([OrderItem(order_id=order.id, burger_id=burger.id, quantity=quantity,
+                                      price_at_order=burger.price) for burger, quantity in lines])
+        db.session.commit()
+        return order.id
+
+    def demand(self):
+        rows = dict(db.session.execute(db.select(IngredientDemand.ingredient_id, IngredientDemand.quantity)).all())
+        return {name: rows.get(ingredient_id, 0) for name, ingredient_id in self.ids.items()}
+
+    def testTransitionsMoveDemand(self):
+        first = self.addOrder([(self.single, 2), (self.double, 1)])
+        second = self.addOrder([(self.double, 3)])
+        order_status.transition([first, second], 'confirmed')
+        self.assertEqual(self.demand(), {'patty': 10, 'bun': 6, 'cheese': 8})
+
+        order_status.transition([first], 'preparing')
+        self.assertEqual(self.demand(), {'patty': 10, 'bun': 6, 'cheese': 8})
+        order_status.transition([first], 'ready')
+        order_status.transition([second], 'cancelled')
+        self.assertEqual(self.demand(), {'patty': 0, 'bun': 0, 'cheese': 0})
+
+    def testPaymentConfirmsIntoDemand(self):
+        order_id = self.addOrder([(self.double, 1)])
+        payments.apply_result('pi_test', payments.SUCCEEDED, order_id)
+        self.assertEqual(self.demand(), {'patty': 2, 'bun': 1, 'cheese': 2})
+
+    def testRebuildMatchesRunningDemand(self):
+        self.addOrder([(self.single, 1)], status='confirmed')
+        self.addOrder([(self.double, 2)], status='preparing')
+        self.addOrder([(self.double, 5)], status='delivered')
+        prep.rebuild()
+        db.session.commit()
+        self.assertEqual(self.demand(), {'patty': 5, 'bun': 3, 'cheese': 4})
+
+    def testForecastExtrapolatesRecentOrders(self):
+        now = datetime.utcnow()
+        self.addOrder([(self.double, 2)], created_at=now - timedelta(minutes=10))
+        self.addOrder([(self.single, 4)], status='cancelled', created_at=now - timedelta(minutes=5))
+        lines = {line.name: line for line in prep.forecast(menu_catalog.current(), now)}
+        self.assertEqual(lines['Cheese'].forecast, 8.0)  # 4 in the last 30 minutes
+        self.assertEqual((lines['Bun'].forecast, lines['Bun'].stock), (4.0, 3))
+
+    def testPageCostsConstantQueries(self):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+
+        def load():
+            g.pop('_login_user', None)
+            with count_queries() as stats:
+                page = client.get('/admin/prep').get_data(as_text=True)
+            return page, stats.count
+
+        order_status.transition([self.addOrder([(self.single, 1)])], 'confirmed')
+        load()  # warm the user cache
+        _, few = load()
+        order_status.transition([self.addOrder([(self.double, 1)], created_at=datetime.utcnow())
+                                 for _ in range(5)], 'confirmed')
+        page, many = load()
+        self.assertEqual(few, many)
+        self.assertIn('Cheese', page)
+        self.assertIn('Short', page)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Tests for read-replica routing"""
+import os
+import tempfile
+import unittest
+from app import create_app, db
+from app.models import User, Burger, Order, CartItem
+from config import config, TestingConfig
+
+class ReplicaTestCase(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        class ReplicaConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(directory.name, "primary.db")}'
+            SQLALCHEMY_BINDS = {'replica': f'sqlite:///{os.path.join(directory.name, "replica.db")}'}
+
+        config['replica-testing'] = ReplicaConfig
+        self.addCleanup(config.pop, 'replica-testing')
+        self.app = create_app('replica-testing')
+        self.addCleanup(self.disposeEngines)
+
+        # The replica starts as a copy of the primary
+        with self.app.app_context():
+            db.metadata.create_all(db.engines['replica'])
+            for engine in (db.engines[None], db.engines['replica']):
+                with engine.begin() as connection:
+                    connection.execute(db.insert(User), [{
+                        'id': 1, 'username': 'customer', 'email': 'customer@example.com',
+                        'full_name': 'Customer', 'password_hash': 'x', 'is_admin': False, 'is_active': True,
+                    }])
+                    connection.execute(db.insert(Burger), [{'id': 1, 'name': 'Classic', 'price': 9.0,
+                                                            'is_available': True, 'ingredients_available': True}])
+
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = '1'
+
+    def disposeEngines(self):
+        with self.app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+        # db is shared by every app; forget the bind so other apps' create_all() skip it
+        db.metadatas.pop('replica', None)
+
+    def addOrder(self, bind, order_id):
+        with self.app.app_context():
+            with db.engines[bind].begin() as connection:
+                connection.execute(db.insert(Order), [{'id': order_id, 'user_id': 1, 'total_price': 9.0,
+                                                       'status': 'pending', 'item_count': 1,
+                                                       'customer_name': 'Customer'}])
+
+    def testGetViewsReadFromReplica(self):
+        """Order history comes from the replica"""
+        self.addOrder(None, 101)
+        self.addOrder('replica', 202)
+        page = self.client.get('/shop/orders').get_data(as_text=True)
+        self.assertIn('#202', page)
+        self.assertNotIn('#101', page)
+
+    def testWritesGoToPrimaryAndReadYourWrites(self):
+        """After writing, the same user's next reads come from the primary"""
+        response = self.client.post('/shop/cart/add/1', data={'quantity': 2})
+        self.assertEqual(response.status_code, 302)
+
+        with self.app.app_context():
+            self.assertEqual(db.session.query(CartItem).count(), 1)
+            replica_rows = db.session.execute(db.text('SELECT COUNT(*) FROM cart_items'),
+                                              bind_arguments={'bind': db.engines['replica']}).scalar()
+            self.assertEqual(replica_rows, 0)
+
+        page = self.client.get('/shop/cart').get_data(as_text=True)
+        self.assertNotIn('Your cart is empty', page)
+
+    def testReadYourWritesWindowExpires(self):
+        """Once the window passes, reads go back to the replica"""
+        self.app.config['REPLICA_READ_YOUR_WRITES'] = 0
+        self.client.post('/shop/cart/add/1', data={'quantity': 1})
+        page = self.client.get('/shop/cart').get_data(as_text=True)
+        self.assertIn('Your cart is empty', page)
+
+    def testOtherBlueprintsUsePrimary(self):
+        """Routing is limited to the configured blueprints"""
+        self.addOrder(None, 101)
+        self.app.config['REPLICA_BLUEPRINTS'] = ('admin',)
+        page = self.client.get('/shop/orders').get_data(as_text=True)
+        self.assertIn('#101', page)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Tests for revenue rollups"""
+import unittest
+from datetime import datetime
+from app import create_app, db, rollups
+from app.instrumentation import count_queries
+from app.models import User, Order, SalesRollup
+
+class RollupTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test context and database"""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.user = User(username='buyer', email='buyer@mail.com', full_name='Buyer', password_hash='x')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def placeOrder(self, total, created_at):
+        order = Order(user_id=self.user.id, total_price=total, status='pending', created_at=created_at)
+        db.session.add(order)
+        db.session.flush()
+        rollups.record_order_created(order)
+        db.session.commit()
+        return order
+
+    def testHooksMatchRebuild(self):
+        """Incremental hooks produce the same totals as a full rebuild"""
+        first = self.placeOrder(10.0, datetime(2025, 1, 1, 12, 15))
+        self.placeOrder(5.5, datetime(2025, 1, 1, 13, 5))
+
+        first.payment_status = 'completed'
+        rollups.record_payment_completed(first)
+        rollups.record_status_change('pending', 'confirmed')
+        first.status = 'confirmed'
+        db.session.commit()
+
+        incremental = rollups.dashboard_totals()
+        self.assertEqual(incremental['total_orders'], 2)
+        self.assertEqual(incremental['pending_orders'], 1)
+        self.assertAlmostEqual(incremental['total_revenue'], 10.0)
+
+        rollups.rebuild()
+        rebuilt = rollups.dashboard_totals()
+        self.assertEqual(rebuilt['total_orders'], incremental['total_orders'])
+        self.assertEqual(rebuilt['status_counts'], incremental['status_counts'])
+        self.assertAlmostEqual(rebuilt['total_revenue'], incremental['total_revenue'])
+        self.assertEqual(SalesRollup.query.filter_by(granularity='hour').count(), 2)
+
+    def testPaymentOnOrderWithoutTimestamp(self):
+        """A legacy order with no created_at only counts its payment towards the totals"""
+        order = self.placeOrder(4.0, datetime(2025, 3, 1, 8))
+        db.session.execute(db.update(Order).where(Order.id == order.id).values(created_at=None))
+        db.session.commit()
+
+        order.payment_status = 'completed'
+        rollups.record_payment_completed(order)
+        db.session.commit()
+        self.assertAlmostEqual(rollups.dashboard_totals()['total_revenue'], 4.0)
+        day = SalesRollup.query.filter_by(granularity='day').one()
+        self.assertEqual((day.paid_order_count, day.revenue), (0, 0.0))
+
+        rollups.rebuild()
+        self.assertAlmostEqual(rollups.dashboard_totals()['total_revenue'], 4.0)
+
+    def testNewBucketsCostOneStatementPerTable(self):
+        """Creating missing rollup rows is an upsert, not UPDATE, SAVEPOINT and INSERT"""
+        self.user.id  # load the committed user first
+        with count_queries() as stats:
+            self.placeOrder(7.0, datetime(2025, 2, 1, 9))
+        self.assertEqual(stats.count, 3)  # the order, its sales buckets, its status tally
+        self.placeOrder(3.0, datetime(2025, 2, 1, 9, 30))
+        self.assertEqual(rollups.order_count('pending'), 2)
+        self.assertEqual(db.session.query(SalesRollup).filter_by(granularity='hour').one().order_count, 2)
+
+    def testDashboardReadsRollups(self):
+        """Admin dashboard renders rollup totals"""
+        admin = User(username='boss', email='boss@mail.com', full_name='Boss', password_hash='x', is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+        self.placeOrder(7.25, datetime.utcnow())
+
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(admin.id)
+        response = self.client.get('/admin/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Today: 1 order(s)', response.data)
+
+    def tearDown(self):
+        """Tear down test context and database"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
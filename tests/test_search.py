@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Tests for the in-memory menu search"""
+import unittest
+from flask import g
+from app import create_app, db
+from app.catalog import menu_catalog
+from app.instrumentation import count_queries
+from app.models import User, Burger, Ingredient, BurgerIngredient
+from app.search import menu_search, parse
+
+class SearchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        customer = User(username='olle', email='olle@mail.com', full_name='Olle', password_hash='x')
+        bacon = Ingredient(name='Smoked Bacon')
+        cheese = Ingredient(name='Cheddar Cheese')
+        jalapeno = Ingredient(name='Jalapeño')
+        burgers = [
+            Burger(name='Classic', description='Beef with cheddar', price=8.0),
+            Burger(name='Bacon Cheeseburger', description='Double beef', price=12.0),
+            Burger(name='Inferno', description='Hot and spicy', price=9.5),
+            Burger(name='Garden', description='Grilled veggies and cheese', price=7.0, is_available=False),
+        ]
+        db.session.add_all([customer, bacon, cheese, jalapeno] + burgers)
+        db.session.flush()
+        db.session.add_all([
+            BurgerIngredient(burger_id=burgers[0].id, ingredient_id=cheese.id),
+            BurgerIngredient(burger_id=burgers[1].id, ingredient_id=bacon.id),
+            BurgerIngredient(burger_id=burgers[1].id, ingredient_id=cheese.id),
+            BurgerIngredient(burger_id=burgers[2].id, ingredient_id=jalapeno.id),
+            BurgerIngredient(burger_id=burgers[2].id, ingredient_id=bacon.id),
+        ])
+        db.session.commit()
+        self.customer_id = customer.id
+        self.bacon_id = bacon.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def names(self, text, **filters):
+        snapshot = menu_catalog.current()
+        return [burger.name for burger in menu_search.search(snapshot, parse(text, **filters))]
+
+    def testParse(self):
+        query = parse('Chee no bacon -onion under $10')
+        self.assertEqual((query.terms, query.exclude, query.max_price), (('chee',), ('bacon', 'onion'), 10.0))
+        self.assertEqual(parse('over 8', min_price=5).min_price, 5)
+
+    def testPrefixMatchRanksNameFirst(self):
+        self.assertEqual(self.names('chee'), ['Bacon Cheeseburger', 'Classic', 'Garden'])
+        self.assertEqual(self.names('jalap'), ['Inferno'])
+        self.assertEqual(self.names('beef chedd'), ['Classic', 'Bacon Cheeseburger'])
+        self.assertEqual(self.names('tofu'), [])
+
+    def testFilters(self):
+        self.assertEqual(self.names('no bacon'), ['Classic', 'Garden'])
+        self.assertEqual(self.names('cheese without smoked', available_only=True), ['Classic'])
+        self.assertEqual(self.names('under 9'), ['Classic', 'Garden'])
+        self.assertEqual(self.names('', min_price=9, max_price=10), ['Inferno'])
+
+    def testIndexFollowsMenuChangesIncrementally(self):
+        self.names('chee')
+        first = menu_search.stats()
+        self.assertEqual(first['reindexed_burgers'], 4)
+
+        db.session.get(Ingredient, self.bacon_id).name = 'Turkey Bacon'
+        menu_catalog.bump()
+        db.session.commit()
+        g.pop('menu_version', None)
+        self.assertEqual(self.names('turkey'), ['Bacon Cheeseburger', 'Inferno'])
+        self.assertEqual(self.names('smoked'), [])
+        self.assertEqual(menu_search.stats()['reindexed_burgers'] - first['reindexed_burgers'], 2)
+
+    def testDashboardSearchAddsNoQueries(self):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(self.customer_id)
+
+        def load(url):
+            g.pop('_login_user', None)
+            with count_queries() as stats:
+                page = client.get(url).get_data(as_text=True)
+            return page, stats.count
+
+        load('/shop/')
+        _, browse = load('/shop/')
+        page, searched = load('/shop/?q=no+bacon&max_price=10')
+        self.assertEqual(browse, searched)
+        self.assertIn('Search Results', page)
+        self.assertIn('Classic', page)
+        self.assertNotIn('Inferno', page)
+
+if __name__ == '__main__':
+    unittest.main()
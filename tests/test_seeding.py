@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Tests for the synthetic dataset generator"""
+import unittest
+from datetime import datetime
+from app import create_app, db, rollups
+from app.models import Order, OrderItem, User
+from app.seeding import seed_scale
+
+END = datetime(2025, 3, 14, 15)
+
+def generate():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        seed_scale(users=20, burgers=8, orders=500, cart_rows=30, days=7,
+                   seed=7, batch_size=128, end=END, log=lambda message: None)
+        orders = [(o.user_id, o.total_price, o.status, o.created_at)
+                  for o in Order.query.order_by(Order.id)]
+        totals = rollups.dashboard_totals()
+        items = OrderItem.query.count()
+        users = User.query.count()
+        db.session.remove()
+        db.drop_all()
+    return orders, totals, items, users
+
+class SeedingTestCase(unittest.TestCase):
+
+    def testDeterministicAndConsistent(self):
+        """Same seed gives the same data, and rollups match the orders"""
+        orders, totals, items, users = generate()
+        self.assertEqual(len(orders), 500)
+        self.assertEqual(users, 20)
+        self.assertGreaterEqual(items, 500)
+        self.assertTrue(all(created_at <= END for _, _, _, created_at in orders))
+        self.assertEqual(totals['total_orders'], 500)
+
+        again, _, _, _ = generate()
+        self.assertEqual(orders, again)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Tests for the ingredient stock ledger"""
+import unittest
+from flask import g
+from app import create_app, db
+from app.catalog import menu_catalog
+from app.instrumentation import count_queries
+from app.models import User, Burger, Ingredient, BurgerIngredient, CartItem, Order, StockMovement
+
+class StockTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        admin = User(username='admin', email='admin@mail.com', full_name='Admin', password_hash='x', is_admin=True)
+        customer = User(username='olle', email='olle@mail.com', full_name='Olle', password_hash='x')
+        patty = Ingredient(name='Patty', stock_quantity=10)
+        bun = Ingredient(name='Bun', stock_quantity=6)
+        lettuce = Ingredient(name='Lettuce')  # untracked
+        single = Burger(name='Single', price=8.0)
+        double = Burger(name='Double', price=11.0)
+        db.session.add_all([admin, customer, patty, bun, lettuce, single, double])
+        db.session.flush()
+        db.session.add_all([
+            BurgerIngredient(burger_id=single.id, ingredient_id=patty.id, quantity=1),
+            BurgerIngredient(burger_id=single.id, ingredient_id=bun.id, quantity=1),
+            BurgerIngredient(burger_id=single.id, ingredient_id=lettuce.id, quantity=1),
+            BurgerIngredient(burger_id=double.id, ingredient_id=patty.id, quantity=2),
+            BurgerIngredient(burger_id=double.id, ingredient_id=bun.id, quantity=1),
+        ])
+        db.session.commit()
+        self.admin_id = admin.id
+        self.customer_id = customer.id
+        self.patty_id, self.bun_id = patty.id, bun.id
+        self.single_id, self.double_id = single.id, double.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self, user_id):
+        g.pop('_login_user', None)
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+
+    def checkout(self, lines):
+        for burger_id, quantity in lines:
+            db.session.add(CartItem(user_id=self.customer_id, burger_id=burger_id, quantity=quantity))
+        db.session.commit()
+        db.session.expunge_all()
+        self.login(self.customer_id)
+        return self.client.post('/shop/checkout', data={})
+
+    def stock(self):
+        return dict(db.session.execute(db.select(Ingredient.name, Ingredient.stock_quantity)).all())
+
+    def testCheckoutDeductsSummedDemandInOneUpdate(self):
+        with count_queries() as stats:
+            response = self.checkout([(self.single_id, 2), (self.double_id, 3)])
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.stock(), {'Patty': 2, 'Bun': 1, 'Lettuce': None})
+        self.assertEqual(sum(n for shape, n in stats.shapes.items() if shape.startswith('UPDATE ingredients')), 1)
+
+        order = Order.query.one()
+        ledger = {(m.ingredient_id, m.change, m.reason, m.order_id) for m in StockMovement.query}
+        self.assertEqual(ledger, {(self.patty_id, -8, 'order', order.id), (self.bun_id, -5, 'order', order.id)})
+
+    def testShortageRollsBackTheOrder(self):
+        response = self.checkout([(self.double_id, 6)])
+        self.assertTrue(response.headers['Location'].endswith('/shop/cart'))
+        self.assertEqual(Order.query.count(), 0)
+        self.assertEqual(StockMovement.query.count(), 0)
+        self.assertEqual(self.stock()['Patty'], 10)
+        self.assertEqual(CartItem.query.count(), 1)
+
+    def testRunningOutFlipsAvailability(self):
+        self.checkout([(self.double_id, 4), (self.single_id, 2)])  # patty 0, bun 0
+        db.session.expunge_all()
+        self.assertFalse(db.session.get(Ingredient, self.patty_id).is_available)
+        self.assertFalse(db.session.get(Burger, self.double_id).ingredients_available)
+        self.assertFalse(menu_catalog.current().get(self.single_id).is_orderable)
+
+    def testLowStockDisablesOnlyBurgersItCannotCover(self):
+        self.checkout([(self.double_id, 4), (self.single_id, 1)])  # patty 1, bun 1
+        db.session.expunge_all()
+        self.assertTrue(db.session.get(Ingredient, self.patty_id).is_available)
+        self.assertFalse(db.session.get(Burger, self.double_id).ingredients_available)
+        self.assertTrue(db.session.get(Burger, self.single_id).ingredients_available)
+
+    def testAdminRestockAndCount(self):
+        self.checkout([(self.double_id, 5)])  # patty 0
+        self.login(self.admin_id)
+        url = f'/admin/ingredient/{self.patty_id}/stock'
+        self.client.post(url, data={'action': 'restock', 'quantity': '12'})
+        self.client.post(url, data={'action': 'count', 'quantity': '9'})
+        db.session.expunge_all()
+        patty = db.session.get(Ingredient, self.patty_id)
+        self.assertEqual((patty.stock_quantity, patty.is_available), (9, True))
+        self.assertTrue(db.session.get(Burger, self.double_id).ingredients_available)
+        self.assertEqual([m.change for m in StockMovement.query.filter_by(ingredient_id=self.patty_id)
+                          .order_by(StockMovement.id)], [-10, 12, -3])
+        self.login(self.admin_id)
+        self.assertIn('Restock', self.client.get(url).get_data(as_text=True))
+
+        self.client.post(url, data={'action': 'untrack'})
+        db.session.expunge_all()
+        self.assertIsNone(db.session.get(Ingredient, self.patty_id).stock_quantity)
+
+if __name__ == '__main__':
+    unittest.main()